@@ -0,0 +1,250 @@
+"""
+警告消息后台发送队列
+监控器只负责入队；后台worker按Telegram的全局（约30条/秒）和单聊天（约1条/秒）限制发送，
+遇到RetryAfter时按服务端给出的时间等待后重试。
+摘要模式下同一用户在一轮检查或合并窗口内的多条警告合并为一条消息发送。
+每条消息带着它对应的警告申请 [(地址, 申请时间)]，消息最终没有送达（队列已满、重试次数用完、停止时未发送）时
+通过on_give_up撤销这些申请，下一轮检查可以重新发送，而不是在冷却期内一直不再提醒
+"""
+
+import asyncio
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+from telegram.error import RetryAfter, NetworkError, TelegramError
+from rate_limiter import TokenBucket
+from message_utils import retry_after_seconds
+from metrics import ALERTS, ALERT_SEND_SECONDS
+from config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE, ALERT_QUEUE_SIZE, ALERT_WORKERS, ALERT_MAX_ATTEMPTS,
+    ALERT_DIGEST_WINDOW,
+)
+
+
+class AlertDispatcher:
+    def __init__(self, telegram_bot, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 per_chat_rate: float = TELEGRAM_PER_CHAT_RATE, max_queue: int = ALERT_QUEUE_SIZE,
+                 digest_formatter: Optional[Callable[[int, list], List[str]]] = None,
+                 digest_window: float = ALERT_DIGEST_WINDOW,
+                 on_give_up: Optional[Callable[[int, list], None]] = None):
+        self.telegram_bot = telegram_bot
+        # on_give_up(chat_id, claims)：消息放弃发送时撤销其警告申请
+        self.on_give_up = on_give_up
+        # 摘要模式：digest_formatter(chat_id, items) 把同一用户的多条警告生成一条或多条消息
+        self.digest_formatter = digest_formatter
+        self.digest_window = digest_window
+        self.digests: Dict[int, list] = {}
+        self.digest_claims: Dict[int, list] = {}
+        self.digest_timers: Dict[int, asyncio.TimerHandle] = {}
+        self.per_chat_rate = per_chat_rate
+        self.max_queue = max_queue
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        # 每个聊天一个待发送队列；ready中是可以发送下一条消息的聊天，避免慢聊天阻塞其他聊天
+        self.pending: Dict[int, Deque[list]] = {}  # chat_id -> [[消息, 已尝试次数, 警告申请], ...]
+        self.ready: asyncio.Queue = asyncio.Queue()
+        self.queued = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.workers: List[asyncio.Task] = []
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self, workers: int = ALERT_WORKERS):
+        """启动后台发送worker（需要在事件循环中调用）"""
+        if self.workers:
+            return
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    async def stop(self, drain_timeout: Optional[float] = 10):
+        """尽量发送完队列中剩余的消息后停止worker"""
+        self.flush_digests()
+        if drain_timeout and self.workers:
+            try:
+                await asyncio.wait_for(self.idle.wait(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Alert queue not drained, {self.queued} messages dropped")
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        for chat_id, messages in self.pending.items():
+            for entry in messages:
+                self._give_up(chat_id, entry[2])
+        self.pending.clear()
+        self.queued = 0
+        self.idle.set()
+
+    def _give_up(self, chat_id: int, claims):
+        if claims and self.on_give_up is not None:
+            try:
+                self.on_give_up(chat_id, list(claims))
+            except Exception as e:
+                print(f"❌ Error releasing alert claims for user {chat_id}: {str(e)}")
+
+    def enqueue(self, chat_id: int, text: str, claims=()) -> bool:
+        """非阻塞入队；队列已满时丢弃（并撤销claims）并返回False
+
+        claims: 这条消息对应的警告申请 [(地址, 申请时间)]
+        """
+        if self.queued >= self.max_queue:
+            self.dropped += 1
+            ALERTS.inc('dropped')
+            print(f"⚠️ Alert queue full, dropping message for user {chat_id}")
+            self._give_up(chat_id, claims)
+            return False
+
+        self.queued += 1
+        self.idle.clear()
+        if chat_id in self.pending:
+            # 该聊天已在发送流程中，追加到其队列末尾
+            self.pending[chat_id].append([text, 0, claims])
+        else:
+            self.pending[chat_id] = deque([[text, 0, claims]])
+            self.ready.put_nowait(chat_id)
+        return True
+
+    def add_to_digest(self, chat_id: int, item, claim=None) -> bool:
+        """把一条警告加入该用户的摘要；合并窗口结束或调用flush_digests时统一发送
+
+        claim: 这条警告的申请 (地址, 申请时间)，摘要没有送达时撤销
+        """
+        if self.digest_formatter is None:
+            raise RuntimeError("Digest mode requires a digest_formatter")
+        if self.queued + sum(len(items) for items in self.digests.values()) >= self.max_queue:
+            self.dropped += 1
+            ALERTS.inc('dropped')
+            print(f"⚠️ Alert queue full, dropping digest item for user {chat_id}")
+            self._give_up(chat_id, [claim] if claim is not None else [])
+            return False
+
+        self.digests.setdefault(chat_id, []).append(item)
+        if claim is not None:
+            self.digest_claims.setdefault(chat_id, []).append(claim)
+        if chat_id not in self.digest_timers and self.digest_window > 0:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return True
+            self.digest_timers[chat_id] = loop.call_later(self.digest_window, self.flush_digest, chat_id)
+        return True
+
+    def flush_digest(self, chat_id: int):
+        """立即生成并入队某个用户的摘要消息"""
+        timer = self.digest_timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        items = self.digests.pop(chat_id, None)
+        claims = self.digest_claims.pop(chat_id, [])
+        if not items:
+            return
+        # 摘要拆成多条消息时无法区分每条包含哪些警告：任何一条放弃发送都撤销整个摘要的申请（宁可下一轮重复提醒）
+        for text in self.digest_formatter(chat_id, items):
+            self.enqueue(chat_id, text, claims)
+
+    def flush_digests(self):
+        """立即发送所有用户的摘要（一轮检查结束时调用）"""
+        for chat_id in list(self.digests):
+            self.flush_digest(chat_id)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, 1)
+        return self.chat_buckets[chat_id]
+
+    def _reschedule(self, chat_id: int, delay: float):
+        """delay秒后让该聊天重新进入ready队列"""
+        asyncio.get_running_loop().call_later(delay, self.ready.put_nowait, chat_id)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self.ready.get()
+            try:
+                await self._process(chat_id)
+            except Exception as e:
+                # 意外错误不能结束worker：放弃该聊天当前的消息，继续处理后面的消息和其他聊天
+                print(f"❌ Error sending alert to user {chat_id}: {str(e)}")
+                self._drop_current(chat_id)
+
+    async def _process(self, chat_id: int):
+        """尝试发送该聊天队列中的第一条消息"""
+        messages = self.pending.get(chat_id)
+        if not messages:
+            self.pending.pop(chat_id, None)
+            return
+
+        # 该聊天还没到可发送时间：稍后再处理，worker转去处理其他聊天
+        bucket = self._chat_bucket(chat_id)
+        if not bucket.try_acquire():
+            self._reschedule(chat_id, (1 - bucket.tokens) / bucket.rate)
+            return
+
+        await self.global_bucket.acquire()
+        delay = await self._send(chat_id, messages[0])
+        if delay is not None:
+            # 需要稍后重试同一条消息
+            self._reschedule(chat_id, delay)
+            return
+
+        messages.popleft()
+        self._message_done()
+        self._next_message(chat_id)
+
+    def _drop_current(self, chat_id: int):
+        messages = self.pending.get(chat_id)
+        if not messages:
+            self.pending.pop(chat_id, None)
+            return
+        entry = messages.popleft()
+        self.failed += 1
+        ALERTS.inc('failed')
+        self._give_up(chat_id, entry[2])
+        self._message_done()
+        self._next_message(chat_id)
+
+    def _next_message(self, chat_id: int):
+        if self.pending.get(chat_id):
+            self.ready.put_nowait(chat_id)
+        else:
+            self.pending.pop(chat_id, None)
+
+    def _message_done(self):
+        self.queued -= 1
+        if self.queued == 0:
+            self.idle.set()
+
+    async def _send(self, chat_id: int, entry: list) -> Optional[float]:
+        """发送一条消息；需要重试时返回等待秒数，否则返回None（成功或放弃）"""
+        text = entry[0]
+        entry[1] += 1
+        try:
+            with ALERT_SEND_SECONDS.time():
+                await self.telegram_bot.send_message(chat_id=chat_id, text=text)
+            self.sent += 1
+            ALERTS.inc('sent')
+            return None
+        except RetryAfter as e:
+            wait = retry_after_seconds(e)
+            # 洪水限制针对整个Bot：所有聊天都暂停发送，避免其他worker继续触发429
+            self.global_bucket.pause(wait)
+            ALERTS.inc('flood_wait')
+            print(f"⏳ Telegram flood control for user {chat_id}, retrying in {wait:.0f}s")
+        except NetworkError as e:
+            # 超时等网络错误：指数退避后重试
+            wait = min(2 ** entry[1], 30)
+            ALERTS.inc('network_error')
+            print(f"⚠️ Network error sending alert to user {chat_id}: {str(e)}")
+        except TelegramError as e:
+            # 用户屏蔽机器人、聊天不存在等，重试无意义（保留警告申请，冷却期内不再尝试）
+            self.failed += 1
+            ALERTS.inc('failed')
+            print(f"Failed to send alert to user {chat_id}: {str(e)}")
+            return None
+
+        if entry[1] >= ALERT_MAX_ATTEMPTS:
+            self.failed += 1
+            ALERTS.inc('failed')
+            print(f"Failed to send alert to user {chat_id} after {ALERT_MAX_ATTEMPTS} attempts")
+            self._give_up(chat_id, entry[2])
+            return None
+        return wait
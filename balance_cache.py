@@ -0,0 +1,145 @@
+"""
+进程内共享的余额缓存
+按 (地址, 资产) 缓存余额，带TTL和LRU淘汰；同一个键的并发查询共享一次在途请求（single-flight）
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+from config import BALANCE_CACHE_TTL, BALANCE_CACHE_MAX_ENTRIES
+
+
+class BalanceCache:
+    def __init__(self, ttl: float = BALANCE_CACHE_TTL, max_entries: int = BALANCE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()  # key -> (value, fetched_at)
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(address: str, asset: str) -> Tuple[str, str]:
+        return address.lower(), asset
+
+    def get(self, key, max_age: Optional[float] = None):
+        """读取缓存值；超过max_age（默认TTL）则视为未命中，返回None"""
+        entry = self.entries.get(key)
+        max_age = self.ttl if max_age is None else max_age
+        if entry is None or time.time() - entry[1] > max_age:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, fetched_at: Optional[float] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self.entries[key] = (value, fetched_at if fetched_at is not None else time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    async def _wait_inflight(self, future: asyncio.Future):
+        # shield：等待者被取消时不影响发起请求的一方
+        return await asyncio.shield(future)
+
+    async def get_or_fetch(self, key, fetcher, max_age: Optional[float] = None):
+        """读取单个键；未命中时调用fetcher()，并与同一键的并发查询合并"""
+        cached = self.get(key, max_age)
+        if cached is not None:
+            return cached
+
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            success, value = await self._wait_inflight(inflight)
+            if success:
+                return value
+            raise Exception(value)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await fetcher()
+        except BaseException as e:
+            future.set_result((False, str(e) or type(e).__name__))
+            raise
+        else:
+            self.put(key, value)
+            future.set_result((True, value))
+            return value
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    async def get_many(self, keys: Iterable, fetch_missing, max_age: Optional[float] = None):
+        """批量读取；未命中且无在途请求的键交给fetch_missing(keys)一次性获取
+
+        fetch_missing返回 (values, errors)，values中额外返回的键也会写入缓存。
+        返回 (values, errors)，均以键为索引
+        """
+        values = {}
+        errors = {}
+        waiting = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            cached = self.get(key, max_age)
+            if cached is not None:
+                values[key] = cached
+            elif key in self.inflight:
+                waiting[key] = self.inflight[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self.inflight.update(futures)
+            try:
+                fetched, fetch_errors = await fetch_missing(missing)
+            except BaseException as e:
+                for future in futures.values():
+                    future.set_result((False, str(e) or type(e).__name__))
+                raise
+            finally:
+                for key, future in futures.items():
+                    if self.inflight.get(key) is future:
+                        del self.inflight[key]
+
+            now = time.time()
+            for key, value in fetched.items():
+                self.put(key, value, now)
+            for key, future in futures.items():
+                if key in fetched:
+                    values[key] = fetched[key]
+                    future.set_result((True, fetched[key]))
+                else:
+                    errors[key] = fetch_errors.get(key, 'Unknown error')
+                    future.set_result((False, errors[key]))
+
+        for key, future in waiting.items():
+            success, value = await self._wait_inflight(future)
+            if success:
+                values[key] = value
+            else:
+                errors[key] = value
+
+        return values, errors
+
+
+_shared_cache: Optional[BalanceCache] = None
+
+
+def get_balance_cache() -> BalanceCache:
+    """获取进程内共享的余额缓存"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = BalanceCache()
+    return _shared_cache
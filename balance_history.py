@@ -0,0 +1,272 @@
+"""
+余额历史时序存储
+每个地址在内存映射文件中占用一个固定大小的槽位，槽位内按分辨率分为多个环形缓冲区
+（原始采样、每小时、每天），记录为定长 (时间戳, wei)。地址数量增加时只按槽位扩展文件，
+单个地址的存储量不随时间增长。
+分片监控时每个地址分区使用单独的文件，同一分区同一时间只有持有租约的worker写入；
+租约交接期间可能短暂有两个进程新增地址，追加索引和扩展文件时持有索引文件的排他锁
+"""
+
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from config import BALANCE_HISTORY_FILE, BALANCE_HISTORY_TIERS, FORECAST_WINDOW, MONITOR_PARTITIONS
+from shard_coordinator import address_partition
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX平台没有文件锁，只支持单进程写入
+    fcntl = None
+
+# 记录：uint32时间戳 + 128位wei（低64位、高64位）
+RECORD = struct.Struct('<IQQ')
+# 每个环形缓冲区的头：下一个写入位置、已有记录数
+TIER_HEADER = struct.Struct('<II')
+# 文件按该槽位数扩展
+GROW_SLOTS = 256
+
+_MASK64 = (1 << 64) - 1
+
+
+class BalanceHistory:
+    def __init__(self, path: str = BALANCE_HISTORY_FILE, tiers=BALANCE_HISTORY_TIERS):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.tiers: List[Tuple[int, int]] = list(tiers)  # [(分辨率秒数, 容量), ...]
+
+        self.tier_offsets = []
+        offset = 0
+        for _, capacity in self.tiers:
+            self.tier_offsets.append(offset)
+            offset += TIER_HEADER.size + capacity * RECORD.size
+        self.slot_size = offset
+
+        # 槽位索引：每行一个地址，行号即槽位号
+        self.slots: Dict[str, int] = {}
+        self.index_offset = 0  # 已读取到的索引文件位置
+        self._load_index()
+        self.index_file = open(self.index_path, 'a', encoding='utf-8')
+
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        self.file = open(self.path, mode)
+        self.capacity = 0
+        self.mm: Optional[mmap.mmap] = None
+        self._ensure_capacity(max(len(self.slots), 1))
+
+    def _load_index(self) -> bool:
+        """读取索引文件中新增的地址（其他进程可能追加过），返回是否有新增"""
+        if not os.path.exists(self.index_path):
+            return False
+        loaded = len(self.slots)
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            f.seek(self.index_offset)
+            while True:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    break  # 末尾不完整的行等写入完成后再读
+                self.index_offset = f.tell()
+                address = line.strip()
+                if address:
+                    self.slots[address] = len(self.slots)
+        return len(self.slots) > loaded
+
+    def _ensure_capacity(self, slots_needed: int):
+        """文件容量不足时按GROW_SLOTS扩展并重新映射（文件被其他进程扩展过时也重新映射）"""
+        current_size = os.fstat(self.file.fileno()).st_size
+        self.capacity = current_size // self.slot_size
+        if self.mm is not None and slots_needed <= self.capacity and len(self.mm) == current_size:
+            return
+        if self.mm is not None:
+            self.mm.close()
+        if slots_needed > self.capacity:
+            new_capacity = (slots_needed + GROW_SLOTS - 1) // GROW_SLOTS * GROW_SLOTS
+            self.file.truncate(new_capacity * self.slot_size)
+            self.capacity = new_capacity
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+    def _slot_base(self, address: str, create: bool) -> Optional[int]:
+        slot = self.slots.get(address)
+        if slot is None and self._load_index():
+            slot = self.slots.get(address)
+        if slot is not None:
+            if (slot + 1) * self.slot_size > len(self.mm):
+                self._ensure_capacity(slot + 1)
+        else:
+            if not create:
+                return None
+            with self._index_lock():
+                # 加锁后重新读取索引：其他进程可能刚刚分配过该地址
+                self._load_index()
+                slot = self.slots.get(address)
+                if slot is None:
+                    slot = len(self.slots)
+                    self.slots[address] = slot
+                    self.index_file.write(address + '\n')
+                    self.index_file.flush()
+                    self.index_offset = self.index_file.tell()
+                self._ensure_capacity(slot + 1)
+        return slot * self.slot_size
+
+    @contextmanager
+    def _index_lock(self):
+        """跨进程的索引排他锁：追加索引行和扩展文件不与其他进程交错"""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.index_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.index_file.fileno(), fcntl.LOCK_UN)
+
+    def _tier_records(self, base: int, tier: int) -> List[Tuple[int, int]]:
+        """按时间顺序读取一个环形缓冲区内的记录"""
+        tier_base = base + self.tier_offsets[tier]
+        capacity = self.tiers[tier][1]
+        head, count = TIER_HEADER.unpack_from(self.mm, tier_base)
+        start = (head - count) % capacity
+        records = []
+        for i in range(count):
+            position = (start + i) % capacity
+            ts, low, high = RECORD.unpack_from(self.mm, tier_base + TIER_HEADER.size + position * RECORD.size)
+            records.append((ts, (high << 64) | low))
+        return records
+
+    def _tier_last_timestamp(self, base: int, tier: int) -> Optional[int]:
+        tier_base = base + self.tier_offsets[tier]
+        capacity = self.tiers[tier][1]
+        head, count = TIER_HEADER.unpack_from(self.mm, tier_base)
+        if count == 0:
+            return None
+        position = (head - 1) % capacity
+        return RECORD.unpack_from(self.mm, tier_base + TIER_HEADER.size + position * RECORD.size)[0]
+
+    def _tier_append(self, base: int, tier: int, timestamp: int, wei: int):
+        tier_base = base + self.tier_offsets[tier]
+        capacity = self.tiers[tier][1]
+        head, count = TIER_HEADER.unpack_from(self.mm, tier_base)
+        RECORD.pack_into(self.mm, tier_base + TIER_HEADER.size + head * RECORD.size,
+                         timestamp, wei & _MASK64, (wei >> 64) & _MASK64)
+        TIER_HEADER.pack_into(self.mm, tier_base, (head + 1) % capacity, min(count + 1, capacity))
+
+    def append(self, address: str, timestamp: float, wei: int):
+        """追加一条余额记录；达到各降采样层的分辨率间隔时同时写入该层"""
+        base = self._slot_base(address.lower(), create=True)
+        timestamp = int(timestamp)
+        for tier, (resolution, _) in enumerate(self.tiers):
+            last = self._tier_last_timestamp(base, tier)
+            if last is None or timestamp - last >= resolution:
+                self._tier_append(base, tier, timestamp, wei)
+
+    def get_history(self, address: str, since: Optional[float] = None) -> List[Tuple[int, int]]:
+        """读取地址的历史记录（按时间升序）：较新的时段使用高分辨率层，较早的时段由低分辨率层补充"""
+        base = self._slot_base(address.lower(), create=False)
+        if base is None:
+            return []
+        merged: List[Tuple[int, int]] = []
+        for tier in range(len(self.tiers)):
+            records = self._tier_records(base, tier)
+            if merged:
+                oldest = merged[0][0]
+                records = [record for record in records if record[0] < oldest]
+            merged = records + merged
+        if since is not None:
+            merged = [record for record in merged if record[0] >= since]
+        return merged
+
+    def latest(self, address: str) -> Optional[Tuple[int, int]]:
+        base = self._slot_base(address.lower(), create=False)
+        if base is None:
+            return None
+        records = self._tier_records(base, 0)
+        return records[-1] if records else None
+
+    def forecast(self, address: str, threshold_wei: int, window: float = FORECAST_WINDOW) -> Optional[dict]:
+        """根据最近window秒内的记录估算消耗速度和跌破阈值前的剩余小时数（不发起RPC请求）
+
+        返回 {'balance_wei', 'timestamp', 'burn_per_hour' (BNB/小时), 'hours_left', 'samples'}；
+        记录不足两条时返回None，余额未在减少时hours_left为None
+        """
+        latest = self.latest(address)
+        if latest is None:
+            return None
+        records = self.get_history(address, since=latest[0] - window)
+        if len(records) < 2:
+            return None
+
+        # 最小二乘拟合余额随时间（小时）的斜率
+        xs = [(ts - latest[0]) / 3600 for ts, _ in records]
+        ys = [wei / 10**18 for _, wei in records]
+        mean_x = sum(xs) / len(xs)
+        mean_y = sum(ys) / len(ys)
+        variance = sum((x - mean_x) ** 2 for x in xs)
+        if variance == 0:
+            return None
+        slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+        burn_per_hour = max(0.0, -slope)
+        headroom = (latest[1] - threshold_wei) / 10**18
+        if burn_per_hour <= 0:
+            hours_left = None
+        else:
+            hours_left = max(0.0, headroom / burn_per_hour)
+
+        return {
+            'balance_wei': latest[1],
+            'timestamp': latest[0],
+            'burn_per_hour': burn_per_hour,
+            'hours_left': hours_left,
+            'samples': len(records),
+        }
+
+    def flush(self):
+        if self.mm is not None:
+            self.mm.flush()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+        self.index_file.close()
+
+
+class PartitionedBalanceHistory:
+    """按地址分区拆分的余额历史：分区i保存在 {path}.{i}，接口与BalanceHistory相同"""
+
+    def __init__(self, path: str = BALANCE_HISTORY_FILE, tiers=BALANCE_HISTORY_TIERS, partitions: int = MONITOR_PARTITIONS):
+        self.path = path
+        self.tiers = tiers
+        self.partitions = partitions
+        self.shards: Dict[int, BalanceHistory] = {}
+
+    def _shard(self, address: str) -> BalanceHistory:
+        partition = address_partition(address.lower(), self.partitions)
+        shard = self.shards.get(partition)
+        if shard is None:
+            shard = self.shards[partition] = BalanceHistory(f"{self.path}.{partition}", self.tiers)
+        return shard
+
+    def append(self, address: str, timestamp: float, wei: int):
+        self._shard(address).append(address, timestamp, wei)
+
+    def get_history(self, address: str, since: Optional[float] = None) -> List[Tuple[int, int]]:
+        return self._shard(address).get_history(address, since)
+
+    def latest(self, address: str) -> Optional[Tuple[int, int]]:
+        return self._shard(address).latest(address)
+
+    def forecast(self, address: str, threshold_wei: int, window: float = FORECAST_WINDOW) -> Optional[dict]:
+        return self._shard(address).forecast(address, threshold_wei, window)
+
+    def flush(self):
+        for shard in self.shards.values():
+            shard.flush()
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+        self.shards = {}
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+吞吐量基准测试
+启动本地模拟BSC节点和BscScan API（mock_bsc_server.py），在100/1k/10k个地址规模下
+运行监控器的全量检查和机器人的 /list、/check 命令，输出耗时、请求速率和峰值内存。
+
+用法：
+    python benchmark.py
+    python benchmark.py --sizes 100,1000 --latency 0.05 --jitter 0.5 --distribution lognormal \\
+        --rate-limit-rate 0.02 --call-error-rate 0.01
+
+模拟服务器与被测代码运行在同一个事件循环中，结果包含服务器自身的开销，适合做前后对比
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+
+class _NullWriter(io.TextIOBase):
+    """丢弃被测代码的print输出（仍计入格式化开销）"""
+
+    def write(self, text):
+        return len(text)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_addresses(count: int):
+    return ['0x' + hashlib.sha256(f'bench-{i}'.encode()).hexdigest()[:40] for i in range(count)]
+
+
+def make_users_data(addresses, per_user: int = 10, threshold: float = 0.05) -> dict:
+    """用户1订阅全部地址（用于 /list、/check），其余用户每人订阅per_user个地址"""
+    users = {'1': {'addresses': list(addresses), 'threshold': threshold, 'last_alert': {}}}
+    for start in range(0, len(addresses), per_user):
+        user_id = 2 + start // per_user
+        users[str(user_id)] = {'addresses': addresses[start:start + per_user], 'threshold': threshold, 'last_alert': {}}
+    return users
+
+
+class _FakeReply:
+    def __init__(self, message, text):
+        self.message = message
+        self.text = text
+        self.chat_id = 1
+        self.message_id = id(self)
+
+    async def edit_text(self, text, **kwargs):
+        if self.message.first_edit_at is None:
+            self.message.first_edit_at = time.perf_counter()
+        self.message.edits += 1
+        self.text = text
+        return self
+
+    async def delete(self):
+        self.message.replies.remove(self)
+        return True
+
+
+class _FakeMessage:
+    def __init__(self):
+        self.replies = []
+        self.edits = 0
+        self.first_edit_at = None  # 第一次编辑（首批结果显示）的时间
+
+    async def reply_text(self, text, **kwargs):
+        reply = _FakeReply(self, text)
+        self.replies.append(reply)
+        return reply
+
+
+class _FakeTelegramBot:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+
+
+async def _measure(name, server, coro_factory, use_tracemalloc):
+    server.reset_stats()
+    if use_tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(_NullWriter()):
+        result = await coro_factory()
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if use_tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        'scenario': name,
+        'seconds': elapsed,
+        'http_requests': server.http_requests,
+        'rpc_calls': server.rpc_calls,
+        'api_requests': server.api_requests,
+        'requests_per_second': server.http_requests / elapsed if elapsed else 0.0,
+        'calls_per_second': server.rpc_calls / elapsed if elapsed else 0.0,
+        'injected_errors': server.injected_errors,
+        'injected_rate_limits': server.injected_rate_limits + server.overload_rate_limits,
+        'peak_memory_mb': peak / 1024 / 1024,
+        'result': result,
+    }
+
+
+async def run_size(size, server, args):
+    # 延迟导入：config在导入时读取环境变量
+    from telegram_bot import GasAlertBot
+    from monitor import BalanceMonitor
+
+    workdir = tempfile.mkdtemp(prefix=f'gas-bench-{size}-')
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        addresses = make_addresses(size)
+        # 通过旧JSON数据的自动迁移导入用户，走与生产一致的加载路径
+        with open('user_data.json', 'w', encoding='utf-8') as f:
+            json.dump(make_users_data(addresses), f)
+
+        with contextlib.redirect_stdout(_NullWriter()):
+            bot = GasAlertBot()
+        bot.alert_dispatcher.telegram_bot = _FakeTelegramBot()
+        monitor = BalanceMonitor(bot)
+        cache = bot.balance_checker.balance_cache
+        if args.rpc_rate and not args.aimd:
+            for url in bot.balance_checker.rpc_urls:
+                bucket = bot.balance_checker.rate_limiter.get_bucket(url)
+                bucket.rate = args.rpc_rate
+                bucket.capacity = max(bucket.capacity, args.rpc_rate)
+
+        async def sweep():
+            await monitor.check_all_balances()
+            return {'alerts_queued': bot.alert_dispatcher.queued}
+
+        async def handler(command):
+            message = _FakeMessage()
+            update = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=message)
+            # 等待失败地址的后台重试任务完成；1st s 为首批结果显示（第一次编辑消息）的时间
+            background = []
+            application = SimpleNamespace(create_task=lambda coro: background.append(asyncio.create_task(coro)))
+            context = SimpleNamespace(args=[], bot=bot.application.bot, application=application)
+            started = time.perf_counter()
+            await command(update, context)
+            await asyncio.gather(*background)
+            first_result = (message.first_edit_at or time.perf_counter()) - started
+            return {'replies': len(message.replies), 'edits': message.edits, 'first_result_seconds': first_result,
+                    'reply_chars': sum(len(reply.text) for reply in message.replies)}
+
+        results = []
+        cache.clear()
+        results.append(await _measure('monitor sweep', server, sweep, args.tracemalloc))
+        cache.clear()
+        results.append(await _measure('/list (cold cache)', server, lambda: handler(bot.list_addresses_command), args.tracemalloc))
+        results.append(await _measure('/list (warm cache)', server, lambda: handler(bot.list_addresses_command), args.tracemalloc))
+        cache.clear()
+        results.append(await _measure('/check (cold cache)', server, lambda: handler(bot.check_balance_command), args.tracemalloc))
+        for entry in bot.balance_checker.endpoint_status():
+            if 'limit' in entry:
+                print(f"🔧 {entry['url']}: AIMD concurrency limit {entry['limit']} ({entry['decreases']} decreases), "
+                      f"server peak in-flight {server.peak_in_flight}")
+
+        bot.balance_history.close()
+        await bot.balance_checker.close_session()
+        return results
+    finally:
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_report(size, results):
+    print(f"\n📊 {size} addresses")
+    print(f"{'scenario':<22}{'wall s':>9}{'1st s':>8}{'HTTP req':>10}{'RPC calls':>11}{'req/s':>9}{'calls/s':>10}{'429':>6}{'err':>6}{'peak MB':>9}")
+    for r in results:
+        first = r['result'].get('first_result_seconds')
+        first_text = f"{first:.3f}" if first is not None else '-'
+        print(f"{r['scenario']:<22}{r['seconds']:>9.3f}{first_text:>8}{r['http_requests']:>10}{r['rpc_calls']:>11}"
+              f"{r['requests_per_second']:>9.1f}{r['calls_per_second']:>10.0f}{r['injected_rate_limits']:>6}"
+              f"{r['injected_errors']:>6}{r['peak_memory_mb']:>9.1f}")
+
+
+async def main_async(args):
+    from mock_bsc_server import MockBSCServer
+
+    server = MockBSCServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                           distribution=args.distribution, per_call_latency=args.per_call_latency,
+                           error_rate=args.error_rate, call_error_rate=args.call_error_rate,
+                           rate_limit_rate=args.rate_limit_rate, max_batch=args.max_batch, seed=args.seed,
+                           max_concurrency=args.server_concurrency)
+    await server.start()
+    print(f"🧪 Mock BSC RPC on {server.rpc_url}")
+    report = {}
+    try:
+        for size in args.sizes:
+            results = await run_size(size, server, args)
+            print_report(size, results)
+            report[size] = results
+    finally:
+        await server.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Gas Alert Bot throughput benchmark')
+    parser.add_argument('--sizes', default='100,1000,10000', type=lambda v: [int(x) for x in v.split(',') if x])
+    parser.add_argument('--latency', type=float, default=0.02, help='per-request latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--distribution', choices=('uniform', 'lognormal'), default='uniform')
+    parser.add_argument('--per-call-latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of HTTP 500')
+    parser.add_argument('--call-error-rate', type=float, default=0.0, help='probability of a JSON-RPC error per call')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='probability of HTTP 429')
+    parser.add_argument('--max-batch', type=int, default=1000)
+    parser.add_argument('--server-concurrency', type=int, default=0,
+                        help='mock server answers 429 above this many in-flight requests (0: unlimited)')
+    parser.add_argument('--no-aimd', dest='aimd', action='store_false',
+                        help='use the fixed per-endpoint token bucket instead of AIMD concurrency control')
+    parser.add_argument('--rpc-rate', type=float, default=None,
+                        help='with --no-aimd, override the per-endpoint request rate (default: RPC_RATE_LIMIT from config)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-tracemalloc', dest='tracemalloc', action='store_false')
+    parser.add_argument('--json', help='write raw results to this file')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    args.port = _free_port()
+    # 在导入config之前把所有外部端点指向本地模拟服务器
+    os.environ['BSC_RPC_URLS'] = f'http://127.0.0.1:{args.port}/'
+    os.environ['ETHERSCAN_API_BASE_URL'] = f'http://127.0.0.1:{args.port}/api'
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:benchmark')
+    os.environ['USER_STORAGE_BACKEND'] = 'sqlite'
+    os.environ['RPC_AIMD_ENABLED'] = 'true' if args.aimd else 'false'
+    # 假的Telegram消息编辑按较短的间隔节流
+    os.environ['TELEGRAM_EDIT_INTERVAL'] = '0.1'
+    os.environ.pop('USER_DB_FILE', None)
+    os.environ.pop('BALANCE_HISTORY_FILE', None)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
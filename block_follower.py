@@ -0,0 +1,61 @@
+"""
+区块跟随器
+轮询最新区块，按交易的 from/to 找出被触及的监控地址，只对这些地址重新查询余额
+"""
+
+from typing import Container, Optional, Set
+from config import BLOCK_MAX_PER_POLL, BLOCK_MAX_LAG
+
+
+class BlockFollower:
+    def __init__(self, balance_checker, max_blocks_per_poll: int = BLOCK_MAX_PER_POLL,
+                 max_lag: int = BLOCK_MAX_LAG):
+        self.balance_checker = balance_checker
+        self.max_blocks_per_poll = max_blocks_per_poll
+        self.max_lag = max_lag
+        self.last_block: Optional[int] = None  # 已处理的最新区块
+        self.fell_behind = False               # 落后太多而跳过了区块，需要一次全量检查兜底
+
+    async def poll(self, watched: Container[str]) -> Set[str]:
+        """处理自上次以来的新区块，返回交易中出现过的监控地址（小写）
+
+        watched: 支持 `in` 判断的监控地址集合（如地址索引字典或set），地址为小写
+        """
+        latest = await self.balance_checker.get_block_number()
+
+        if self.last_block is None:
+            # 首次运行：从当前区块开始跟随
+            self.last_block = latest
+            return set()
+
+        if latest - self.last_block > self.max_lag:
+            print(f"⚠️ Block follower is {latest - self.last_block} blocks behind, skipping to {latest}")
+            self.last_block = latest
+            self.fell_behind = True
+            return set()
+
+        if latest <= self.last_block:
+            return set()
+
+        end = min(latest, self.last_block + self.max_blocks_per_poll)
+        block_numbers = range(self.last_block + 1, end + 1)
+        blocks = await self.balance_checker.get_blocks(block_numbers)
+
+        touched = set()
+        for number in block_numbers:
+            block = blocks.get(number)
+            if block is None:
+                # 区块尚未在该节点可见或获取失败，下次从这里继续
+                break
+            for tx in block.get('transactions') or []:
+                if not isinstance(tx, dict):
+                    continue
+                sender = (tx.get('from') or '').lower()
+                recipient = (tx.get('to') or '').lower()
+                if sender in watched:
+                    touched.add(sender)
+                if recipient in watched:
+                    touched.add(recipient)
+            self.last_block = number
+
+        return touched
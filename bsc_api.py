@@ -1,23 +1,58 @@
 import aiohttp
 import asyncio
 import time
-from decimal import Decimal
-from config import ETHERSCAN_API_KEY, ETHERSCAN_API_BASE_URL, BSC_CHAIN_ID, TOKEN_CONTRACTS
+from config import (
+    ETHERSCAN_API_KEY, ETHERSCAN_API_BASE_URL, BSC_CHAIN_ID, TOKEN_CONTRACTS,
+    RPC_BATCH_SIZE, RPC_BATCH_MAX_RETRIES, MULTICALL_CHUNK_SIZE,
+    ETHERSCAN_RATE_LIMIT, ETHERSCAN_RATE_BURST, BSC_RPC_URLS, LOW_BALANCE_THRESHOLD_WEI,
+    CASSETTE_MODE, CASSETTE_FILE, CASSETTE_TIMING, RPC_HEDGE_ENABLED, RPC_AIMD_ENABLED,
+    ETHERSCAN_FALLBACK_MAX_WAIT, ETHERSCAN_MAX_CONCURRENCY, ETHERSCAN_REQUEST_TIMEOUT,
+    ETHERSCAN_BREAKER_FAILURES, ETHERSCAN_BREAKER_SECONDS, RPC_POOL_MAX_EJECT_SECONDS,
+)
+from balance_cache import get_balance_cache
+from token_metadata import get_token_metadata_cache
+from rate_limiter import get_rate_limiter
+from rpc_pool import RPCEndpointPool
+from circuit_breaker import CircuitBreaker, CircuitOpenError, DegradedError, CLOSED
+from cassette import Cassette, RPC, API
+from metrics import (
+    RPC_REQUESTS, RPC_REQUEST_SECONDS, RPC_HEDGES, CIRCUIT_TRANSITIONS, ETHERSCAN_REQUESTS, ETHERSCAN_REQUEST_SECONDS,
+    ETHERSCAN_FALLBACKS, BALANCE_QUERIES, BALANCE_QUERY_SECONDS,
+)
+from multicall import (
+    MULTICALL3_ADDRESS, encode_aggregate3, decode_aggregate3, decode_uint256, decode_string,
+    encode_get_eth_balance, encode_balance_of, encode_decimals, encode_symbol,
+)
 
 class BSCBalanceChecker:
+    ETHERSCAN_LANE = 'etherscan'
+
     def __init__(self):
         self.api_key = ETHERSCAN_API_KEY
         self.base_url = ETHERSCAN_API_BASE_URL
         self.chain_id = BSC_CHAIN_ID
         self.session = None
-        # BSC公共RPC节点列表（作为备用）
-        self.rpc_urls = [
-            "https://bsc-dataseed1.binance.org",
-            "https://bsc-dataseed2.binance.org",
-            "https://bsc-dataseed3.binance.org",
-            "https://bsc-dataseed4.binance.org",
-        ]
-        self.current_rpc_index = 0
+        # BSC公共RPC节点池：按延迟、错误率和限流情况选择节点
+        self.rpc_pool = RPCEndpointPool(BSC_RPC_URLS)
+        # 进程内共享的限速器：每个RPC节点的并发上限根据429、限流错误和超时自适应调整（AIMD）
+        self.rate_limiter = get_rate_limiter()
+        if RPC_AIMD_ENABLED:
+            for url in self.rpc_urls:
+                self.rate_limiter.get_adaptive(url)
+        # Etherscan API（RPC失败时的备用）走独立的有界通道并带熔断器，饱和或熔断时抛出DegradedError
+        self.etherscan_lane = self.rate_limiter.get_lane(
+            self.ETHERSCAN_LANE, ETHERSCAN_RATE_LIMIT, ETHERSCAN_RATE_BURST,
+            ETHERSCAN_FALLBACK_MAX_WAIT, ETHERSCAN_MAX_CONCURRENCY,
+        )
+        self.etherscan_breaker = CircuitBreaker(
+            self.ETHERSCAN_LANE, ETHERSCAN_BREAKER_FAILURES, ETHERSCAN_BREAKER_SECONDS, RPC_POOL_MAX_EJECT_SECONDS
+        )
+        # 进程内共享的余额缓存：机器人和监控器查询的结果互相复用
+        self.balance_cache = get_balance_cache()
+        # 代币decimals/symbol的持久化缓存
+        self.token_metadata = get_token_metadata_cache()
+        # RPC流量录制/回放（CASSETTE_MODE为record或replay时启用）
+        self.cassette = Cassette(CASSETTE_FILE, CASSETTE_MODE, CASSETTE_TIMING) if CASSETTE_MODE else None
     
     def is_valid_address(self, address):
         """验证以太坊地址格式"""
@@ -41,16 +76,228 @@ class BSCBalanceChecker:
         """关闭aiohttp session"""
         if self.session and not self.session.closed:
             await self.session.close()
+        if self.cassette is not None:
+            self.cassette.close()
+
+    async def _transport(self, kind, url, request):
+        """所有HTTP请求的出口：启用cassette时由其录制或回放，否则直接发送"""
+        if self.cassette is not None:
+            return await self.cassette.handle(kind, url, request, self._send_http)
+        return await self._send_http(kind, url, request)
+
+    async def _send_http(self, kind, url, request):
+        """发送JSON-RPC POST（kind为RPC）或Etherscan GET（kind为API）请求，返回解析后的JSON"""
+        session = await self.get_session()
+        timeout = aiohttp.ClientTimeout(total=30 if kind == RPC else ETHERSCAN_REQUEST_TIMEOUT)
+        if kind == RPC:
+            response_context = session.post(url, json=request, timeout=timeout)
+        else:
+            response_context = session.get(url, params=request, timeout=timeout)
+        async with response_context as response:
+            response.raise_for_status()
+            return await response.json()
+
+    @property
+    def rpc_urls(self):
+        return self.rpc_pool.urls
+
+    @staticmethod
+    def _is_rate_limit_error(error):
+        """判断JSON-RPC错误是否为节点限流（不能只匹配"limit"，如 gas limit、返回数量上限等错误与限流无关）"""
+        if not isinstance(error, dict):
+            return False
+        message = str(error.get('message', '')).lower()
+        return error.get('code') == -32005 or 'rate limit' in message or 'too many requests' in message
+
+    @classmethod
+    def _has_rate_limit_error(cls, data):
+        """响应（单个或批量）中是否包含节点限流错误"""
+        items = data if isinstance(data, list) else [data]
+        return any(isinstance(item, dict) and cls._is_rate_limit_error(item.get('error')) for item in items)
+
+    async def _post_rpc(self, payload, rpc_url=None):
+        """向RPC节点发送JSON-RPC请求（单个或批量），返回解析后的JSON
+
+        未指定rpc_url时从节点池选择最优节点；启用对冲时，主节点在对冲延迟内未响应则向另一个节点
+        发送相同请求，取先返回的有效结果
+        """
+        if rpc_url is not None:
+            return await self._send_rpc(payload, rpc_url)
+
+        primary_url = self.rpc_pool.select()
+        self.rpc_pool.hedge_budget.record_request()
+        if not RPC_HEDGE_ENABLED or len(self.rpc_urls) < 2:
+            return await self._send_rpc(payload, primary_url)
+        return await self._post_rpc_hedged(payload, primary_url)
+
+    async def _post_rpc_hedged(self, payload, primary_url):
+        """对冲请求：只读调用可以安全地重复发送，先返回有效结果的一方胜出，另一方被取消"""
+        loop = asyncio.get_running_loop()
+        sent = asyncio.Event()
+        primary = asyncio.ensure_future(self._send_rpc(payload, primary_url, sent))
+        hedge = None
+        tasks = {primary: primary_url}
+        started = None
+        sent_waiter = asyncio.ensure_future(sent.wait())
+        try:
+            # 从主请求真正发出（通过限速器）时开始计时，排队等待令牌的时间不触发对冲
+            await asyncio.wait({primary, sent_waiter}, return_when=asyncio.FIRST_COMPLETED)
+            started = loop.time()
+
+            done, _ = await asyncio.wait({primary}, timeout=self.rpc_pool.hedge_delay(primary_url))
+            if done:
+                return primary.result()
+
+            if not self.rpc_pool.hedge_budget.try_acquire():
+                RPC_HEDGES.inc('budget_exhausted')
+                return await primary
+
+            try:
+                hedge_url = self.rpc_pool.select(exclude=[primary_url])
+            except CircuitOpenError:
+                # 没有其他可用节点，继续等待主请求
+                return await primary
+            hedge = asyncio.ensure_future(self._send_rpc(payload, hedge_url))
+            tasks[hedge] = hedge_url
+            RPC_HEDGES.inc('sent')
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and not self._has_rate_limit_error(task.result()):
+                        RPC_HEDGES.inc('won' if task is hedge else 'lost')
+                        return task.result()
+
+            # 两边都没有有效结果：优先返回节点的响应（由调用方按错误处理），否则抛出主请求的异常
+            RPC_HEDGES.inc('failed')
+            for task in (primary, hedge):
+                if task.exception() is None:
+                    return task.result()
+            raise primary.exception()
+        finally:
+            # 主请求在发出前就结束（或调用方被取消）时sent_waiter仍在等待，与请求任务一起取消
+            sent_waiter.cancel()
+            for task, url in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    # 被对冲请求超过的主请求：已等待的时间计入该节点的延迟统计
+                    elapsed = loop.time() - started if task is primary and started is not None and hedge is not None else None
+                    self.rpc_pool.record_cancelled(url, elapsed)
+
+    async def _send_rpc(self, payload, rpc_url, sent=None):
+        """向指定节点发送一次请求，并把延迟和失败情况反馈给节点池
+
+        sent: 可选的asyncio.Event，通过限速器、即将发出HTTP请求时置位
+        """
+        try:
+            async with self.rate_limiter.limit(rpc_url):
+                if sent is not None:
+                    sent.set()
+                started = time.monotonic()
+                try:
+                    data = await self._transport(RPC, rpc_url, payload)
+                except aiohttp.ClientResponseError as e:
+                    rate_limited = e.status == 429
+                    self.rpc_pool.record_failure(rpc_url, rate_limited=rate_limited)
+                    RPC_REQUESTS.inc(rpc_url, 'rate_limited' if rate_limited else 'http_error')
+                    if rate_limited:
+                        self.rate_limiter.record_congestion(rpc_url, started, 'http_429')
+                    raise
+                except asyncio.TimeoutError:
+                    self.rpc_pool.record_failure(rpc_url)
+                    RPC_REQUESTS.inc(rpc_url, 'timeout')
+                    self.rate_limiter.record_congestion(rpc_url, started, 'timeout')
+                    raise
+                except (aiohttp.ClientError, ValueError):
+                    self.rpc_pool.record_failure(rpc_url)
+                    RPC_REQUESTS.inc(rpc_url, 'error')
+                    raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            # 已在上面记录为失败
+            raise
+        except BaseException:
+            # 被取消（调用方中止、停止监控）或其他异常：请求没有结果，释放half_open的探测名额，
+            # 否则该节点一直处于“探测中”，再也不会被选中
+            self.rpc_pool.record_cancelled(rpc_url)
+            raise
+
+        elapsed = time.monotonic() - started
+        RPC_REQUEST_SECONDS.observe(elapsed, rpc_url)
+        if self._has_rate_limit_error(data):
+            self.rpc_pool.record_failure(rpc_url, rate_limited=True)
+            RPC_REQUESTS.inc(rpc_url, 'rate_limited')
+            self.rate_limiter.record_congestion(rpc_url, started, 'rpc_rate_limit')
+        else:
+            self.rpc_pool.record_success(rpc_url, elapsed)
+            RPC_REQUESTS.inc(rpc_url, 'ok')
+            self.rate_limiter.record_success(rpc_url)
+        return data
+
+    def endpoint_status(self):
+        """各RPC节点的健康状态和当前并发上限（用于日志和观测）"""
+        status = self.rpc_pool.snapshot()
+        for entry in status:
+            adaptive = self.rate_limiter.adaptive.get(entry['url'])
+            if adaptive is not None:
+                entry.update(adaptive.snapshot())
+        return status
+
+    @staticmethod
+    def _is_api_rate_limited(data):
+        """Etherscan超出调用频率时返回status=0，result为 Max rate limit reached"""
+        return isinstance(data, dict) and data.get('status') == '0' and 'rate limit' in str(data.get('result', '')).lower()
+
+    async def _get_api(self, params):
+        """向Etherscan（BscScan）API发送GET请求，返回解析后的JSON
+
+        熔断器打开或备用通道排队已满时立即抛出DegradedError，不再继续排队等待
+        """
+        if not self.etherscan_breaker.allow_request():
+            ETHERSCAN_REQUESTS.inc('rejected')
+            raise DegradedError("BscScan API circuit is open")
+        try:
+            async with self.etherscan_lane.acquire():
+                # 排队期间熔断器可能已重新打开，或half_open的探测名额已被先出队的请求占用：再次检查后再标记探测
+                if not self.etherscan_breaker.allow_request():
+                    raise DegradedError("BscScan API circuit is open")
+                self.etherscan_breaker.on_request()
+                started = time.monotonic()
+                try:
+                    data = await self._transport(API, self.base_url, params)
+                except asyncio.CancelledError:
+                    self.etherscan_breaker.release_probe()
+                    raise
+                except Exception:
+                    ETHERSCAN_REQUESTS.inc('error')
+                    self._record_api_failure()
+                    raise
+        except DegradedError:
+            ETHERSCAN_REQUESTS.inc('rejected')
+            raise
+
+        ETHERSCAN_REQUEST_SECONDS.observe(time.monotonic() - started)
+        if self._is_api_rate_limited(data):
+            ETHERSCAN_REQUESTS.inc('rate_limited')
+            self._record_api_failure()
+        else:
+            ETHERSCAN_REQUESTS.inc('ok' if isinstance(data, dict) and data.get('status') == '1' else 'api_error')
+            if self.etherscan_breaker.record_success():
+                print("✅ BscScan API recovered")
+                CIRCUIT_TRANSITIONS.inc(self.ETHERSCAN_LANE, CLOSED)
+        return data
+
+    def _record_api_failure(self):
+        duration = self.etherscan_breaker.record_failure()
+        if duration is not None:
+            CIRCUIT_TRANSITIONS.inc(self.ETHERSCAN_LANE, 'open')
+            print(f"⚠️ BscScan API circuit open for {duration:.0f}s")
 
     async def get_bnb_balance_via_rpc(self, address):
-        """通过RPC节点获取BNB余额（备用方法，无需API密钥）"""
+        """通过RPC节点获取BNB余额（wei）"""
         if not self.is_valid_address(address):
             raise ValueError(f"Invalid address: {address}")
 
-        # 轮询使用不同的RPC节点
-        rpc_url = self.rpc_urls[self.current_rpc_index % len(self.rpc_urls)]
-        self.current_rpc_index += 1
-
         # JSON-RPC请求
         payload = {
             "jsonrpc": "2.0",
@@ -60,41 +307,217 @@ class BSCBalanceChecker:
         }
 
         try:
-            session = await self.get_session()
-            async with session.post(rpc_url, json=payload, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                if 'result' in data:
-                    # 结果是十六进制字符串，转换为整数（wei）
-                    balance_wei = int(data['result'], 16)
-                    balance_bnb = Decimal(balance_wei) / Decimal(10**18)
-                    return float(balance_bnb)
-                else:
-                    error_msg = data.get('error', {}).get('message', 'Unknown RPC error')
-                    raise Exception(f"RPC Error: {error_msg}")
+            data = await self._post_rpc(payload)
+
+            if 'result' in data:
+                # 结果是十六进制字符串，转换为整数（wei）
+                return int(data['result'], 16)
+            else:
+                error_msg = data.get('error', {}).get('message', 'Unknown RPC error')
+                raise Exception(f"RPC Error: {error_msg}")
 
         except aiohttp.ClientError as e:
             raise Exception(f"RPC Network error: {str(e)}")
         except (ValueError, KeyError) as e:
             raise Exception(f"RPC response format error: {str(e)}")
 
-    async def get_bnb_balance(self, address):
-        """获取指定地址的BNB余额（异步，自动故障转移）"""
+    async def rpc_batch(self, calls):
+        """批量发送JSON-RPC调用（一次HTTP请求携带多个调用）
+
+        calls: [(method, params), ...]
+        返回 (results, errors)：均以calls中的下标为键，按响应的id映射回去
+        """
+        payload = [
+            {"jsonrpc": "2.0", "method": method, "params": params, "id": i}
+            for i, (method, params) in enumerate(calls)
+        ]
+        results = {}
+        errors = {}
+
+        try:
+            data = await self._post_rpc(payload)
+        except aiohttp.ClientError as e:
+            return results, {i: f"RPC Network error: {str(e)}" for i in range(len(calls))}
+        except (ValueError, asyncio.TimeoutError) as e:
+            return results, {i: f"RPC batch error: {str(e) or type(e).__name__}" for i in range(len(calls))}
+
+        # 节点拒绝整个批次时返回的是单个错误对象而不是数组
+        if not isinstance(data, list):
+            error_msg = data.get('error', {}).get('message', 'Unknown RPC error') if isinstance(data, dict) else 'Invalid batch response'
+            return results, {i: f"RPC Error: {error_msg}" for i in range(len(calls))}
+
+        for item in data:
+            request_id = item.get('id') if isinstance(item, dict) else None
+            if not isinstance(request_id, int) or not 0 <= request_id < len(calls):
+                continue
+            if 'result' in item and item['result'] is not None:
+                results[request_id] = item['result']
+            else:
+                errors[request_id] = f"RPC Error: {(item.get('error') or {}).get('message', 'Unknown RPC error')}"
+
+        # 响应中缺失的id视为失败
+        for i in range(len(calls)):
+            if i not in results and i not in errors:
+                errors[i] = "RPC Error: missing response"
+
+        return results, errors
+
+    async def rpc_call(self, method, params):
+        """发送单个JSON-RPC调用并返回result，失败时抛出异常"""
+        payload = {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
+        try:
+            data = await self._post_rpc(payload)
+        except aiohttp.ClientError as e:
+            raise Exception(f"RPC Network error: {str(e)}")
+
+        if isinstance(data, dict) and 'result' in data:
+            return data['result']
+        error_msg = (data.get('error') or {}).get('message', 'Unknown RPC error') if isinstance(data, dict) else 'Invalid response'
+        raise Exception(f"RPC Error: {error_msg}")
+
+    async def get_block_number(self):
+        """获取最新区块高度"""
+        return int(await self.rpc_call("eth_blockNumber", []), 16)
+
+    async def get_logs(self, filters):
+        """批量执行eth_getLogs，返回 (日志列表, 失败的过滤条件数)"""
+        logs = []
+        failed = 0
+        for start in range(0, len(filters), RPC_BATCH_SIZE):
+            chunk = filters[start:start + RPC_BATCH_SIZE]
+            results, _ = await self.rpc_batch([("eth_getLogs", [log_filter]) for log_filter in chunk])
+            for i in range(len(chunk)):
+                if isinstance(results.get(i), list):
+                    logs.extend(results[i])
+                else:
+                    failed += 1
+        return logs, failed
+
+    async def get_blocks(self, block_numbers):
+        """批量获取区块（含完整交易），返回{区块号: 区块}；获取失败或尚未可见的区块不在结果中"""
+        block_numbers = list(block_numbers)
+        blocks = {}
+        for start in range(0, len(block_numbers), RPC_BATCH_SIZE):
+            chunk = block_numbers[start:start + RPC_BATCH_SIZE]
+            results, _ = await self.rpc_batch([("eth_getBlockByNumber", [hex(n), True]) for n in chunk])
+            for i, number in enumerate(chunk):
+                if isinstance(results.get(i), dict):
+                    blocks[number] = results[i]
+        return blocks
+
+    async def get_bnb_balances(self, addresses, max_retries=RPC_BATCH_MAX_RETRIES, max_age=0):
+        """批量获取多个地址的BNB余额（JSON-RPC批量请求，仅重试失败的条目）
+
+        max_age: 可接受的缓存时长（秒），0表示总是重新查询（仍会与在途的相同查询合并）
+        返回 (balances, errors)：balances为{地址: 余额wei}，errors为{地址: 错误信息}
+        """
+        keys = {address: self.balance_cache.make_key(address, 'BNB') for address in addresses}
+
+        async def fetch_missing(missing_keys):
+            missing = set(missing_keys)
+            fetched, fetch_errors = await self._fetch_bnb_balances(
+                [address for address, key in keys.items() if key in missing], max_retries
+            )
+            return ({keys[address]: balance for address, balance in fetched.items()},
+                    {keys[address]: error for address, error in fetch_errors.items()})
+
+        values, key_errors = await self.balance_cache.get_many(keys.values(), fetch_missing, max_age)
+        balances = {address: values[key] for address, key in keys.items() if key in values}
+        errors = {address: key_errors.get(key, 'Unknown error') for address, key in keys.items() if key not in values}
+        return balances, errors
+
+    async def _fetch_bnb_balances(self, addresses, max_retries):
+        """批量查询BNB余额（不经过缓存）"""
+        balances = {}
+        errors = {}
+        pending = []
+        for address in dict.fromkeys(addresses):  # 去重并保持顺序
+            if self.is_valid_address(address):
+                pending.append(address)
+            else:
+                errors[address] = f"Invalid address: {address}"
+
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+
+            if attempt > 0:
+                await asyncio.sleep(min(attempt * 2, 10))
+
+            failed = []
+            for start in range(0, len(pending), RPC_BATCH_SIZE):
+                chunk = pending[start:start + RPC_BATCH_SIZE]
+                results, chunk_errors = await self.rpc_batch(
+                    [("eth_getBalance", [address, "latest"]) for address in chunk]
+                )
+
+                for i, address in enumerate(chunk):
+                    if i in results:
+                        try:
+                            balance_wei = int(results[i], 16)
+                        except (TypeError, ValueError) as e:
+                            errors[address] = f"RPC response format error: {str(e)}"
+                            failed.append(address)
+                            continue
+                        balances[address] = balance_wei
+                        errors.pop(address, None)
+                    else:
+                        errors[address] = chunk_errors.get(i, "RPC Error: missing response")
+                        failed.append(address)
+
+            pending = failed
+
+        return balances, errors
+
+    async def get_bnb_balance(self, address, max_age=0):
+        """获取指定地址的BNB余额（wei，自动故障转移）
+
+        max_age: 可接受的缓存时长（秒），0表示总是重新查询（仍会与在途的相同查询合并）
+        """
         if not self.is_valid_address(address):
             raise ValueError(f"Invalid address: {address}")
 
-        # 优先使用RPC节点（更稳定，无API密钥限制）
-        try:
-            return await self.get_bnb_balance_via_rpc(address)
-        except Exception as rpc_error:
-            # RPC失败，尝试使用Etherscan API作为备用
-            pass
+        return await self.balance_cache.get_or_fetch(
+            self.balance_cache.make_key(address, 'BNB'),
+            lambda: self._get_bnb_balance_uncached(address),
+            max_age,
+        )
 
-        # 备用：使用Etherscan API
-        url = f"{self.base_url}"
+    async def _query_with_fallback(self, asset, via_rpc, via_etherscan):
+        """优先使用RPC节点查询，失败时使用Etherscan API，并统计结果来源和耗时"""
+        started = time.monotonic()
+        try:
+            # 优先使用RPC节点（更稳定，无API密钥限制）；所有节点熔断时via_rpc立即失败
+            try:
+                balance = await via_rpc()
+                source = 'rpc'
+            except Exception:
+                # RPC失败，尝试使用Etherscan API作为备用（独立限速，饱和时抛出DegradedError）
+                ETHERSCAN_FALLBACKS.inc(asset)
+                balance = await via_etherscan()
+                source = 'etherscan'
+        except DegradedError:
+            BALANCE_QUERIES.inc(asset, 'degraded')
+            raise
+        except Exception:
+            BALANCE_QUERIES.inc(asset, 'error')
+            raise
+        finally:
+            BALANCE_QUERY_SECONDS.observe(time.monotonic() - started, asset)
+        BALANCE_QUERIES.inc(asset, source)
+        return balance
+
+    async def _get_bnb_balance_uncached(self, address):
+        """查询BNB余额（不经过缓存），RPC失败时使用Etherscan API"""
+        return await self._query_with_fallback(
+            'BNB',
+            lambda: self.get_bnb_balance_via_rpc(address),
+            lambda: self._get_bnb_balance_via_etherscan(address),
+        )
+
+    async def _get_bnb_balance_via_etherscan(self, address):
+        """通过Etherscan API获取BNB余额"""
         params = {
-            'chainid': self.chain_id,
             'module': 'account',
             'action': 'balance',
             'address': address,
@@ -102,47 +525,41 @@ class BSCBalanceChecker:
             'apikey': self.api_key
         }
 
+        # BSC API不需要chainid参数（值为None时aiohttp无法编码查询参数）
+        if self.chain_id is not None:
+            params['chainid'] = self.chain_id
+
         try:
-            session = await self.get_session()
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                if data.get('status') == '1':
-                    # 将wei转换为BNB (1 BNB = 10^18 wei)
-                    balance_wei = int(data.get('result', '0'))
-                    balance_bnb = Decimal(balance_wei) / Decimal(10**18)
-                    return float(balance_bnb)
-                else:
-                    error_msg = data.get('message', 'Unknown error')
-                    raise Exception(f"API Error: {error_msg}")
+            data = await self._get_api(params)
+
+            if data.get('status') == '1':
+                return int(data.get('result', '0'))
+            else:
+                error_msg = data.get('message', 'Unknown error')
+                raise Exception(f"API Error: {error_msg}")
 
         except aiohttp.ClientError as e:
             raise Exception(f"Network error: {str(e)}")
         except ValueError as e:
             raise Exception(f"Invalid response format: {str(e)}")
     
-    def check_low_balance(self, address, threshold=0.05):
-        """检查地址余额是否低于阈值"""
+    async def check_low_balance(self, address, threshold_wei=LOW_BALANCE_THRESHOLD_WEI):
+        """检查地址余额是否低于阈值（wei），返回 (是否低于阈值, 余额wei)"""
         try:
-            balance = self.get_bnb_balance(address)
-            return balance < threshold, balance
+            balance = await self.get_bnb_balance(address)
+            return balance < threshold_wei, balance
         except Exception as e:
             print(f"Error checking balance for {address}: {str(e)}")
-            return False, 0.0
+            return False, 0
 
     async def get_token_balance_via_rpc(self, address, contract_address):
-        """通过RPC节点获取ERC20代币余额（备用方法，无需API密钥）"""
+        """通过RPC节点获取ERC20代币余额（最小单位的整数）"""
         if not self.is_valid_address(address):
             raise ValueError(f"Invalid address: {address}")
 
         if not self.is_valid_address(contract_address):
             raise ValueError(f"Invalid contract address: {contract_address}")
 
-        # 轮询使用不同的RPC节点
-        rpc_url = self.rpc_urls[self.current_rpc_index % len(self.rpc_urls)]
-        self.current_rpc_index += 1
-
         # 构造balanceOf(address)调用
         # balanceOf函数选择器: 0x70a08231
         # 参数: 地址（补齐到32字节）
@@ -164,20 +581,14 @@ class BSCBalanceChecker:
         }
 
         try:
-            session = await self.get_session()
-            async with session.post(rpc_url, json=payload, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                response.raise_for_status()
-                result = await response.json()
-
-                if 'result' in result:
-                    # 结果是十六进制字符串
-                    balance_wei = int(result['result'], 16)
-                    # USDT和USDC都是18位小数
-                    balance = Decimal(balance_wei) / Decimal(10**18)
-                    return float(balance)
-                else:
-                    error_msg = result.get('error', {}).get('message', 'Unknown RPC error')
-                    raise Exception(f"RPC Error: {error_msg}")
+            result = await self._post_rpc(payload)
+
+            if 'result' in result:
+                # 结果是十六进制字符串
+                return int(result['result'], 16)
+            else:
+                error_msg = result.get('error', {}).get('message', 'Unknown RPC error')
+                raise Exception(f"RPC Error: {error_msg}")
 
         except aiohttp.ClientError as e:
             raise Exception(f"RPC Network error: {str(e)}")
@@ -185,22 +596,29 @@ class BSCBalanceChecker:
             raise Exception(f"RPC response format error: {str(e)}")
 
     async def get_token_balance(self, address, contract_address):
-        """获取指定地址的ERC20代币余额（异步，自动故障转移）"""
+        """获取指定地址的ERC20代币余额（最小单位的整数，自动故障转移）"""
         if not self.is_valid_address(address):
             raise ValueError(f"Invalid address: {address}")
 
         if not self.is_valid_address(contract_address):
             raise ValueError(f"Invalid contract address: {contract_address}")
 
-        # 优先使用RPC节点（更稳定，无API密钥限制）
-        try:
-            return await self.get_token_balance_via_rpc(address, contract_address)
-        except Exception as rpc_error:
-            # RPC失败，尝试使用Etherscan API作为备用
-            pass
-
-        # 备用：使用Etherscan API
-        url = f"{self.base_url}"
+        return await self._query_with_fallback(
+            self._token_label(contract_address),
+            lambda: self.get_token_balance_via_rpc(address, contract_address),
+            lambda: self._get_token_balance_via_etherscan(address, contract_address),
+        )
+
+    @staticmethod
+    def _token_label(contract_address):
+        """指标中使用的代币名称（TOKEN_CONTRACTS中的符号，否则为合约地址）"""
+        for symbol, contract in TOKEN_CONTRACTS.items():
+            if contract.lower() == contract_address.lower():
+                return symbol
+        return contract_address.lower()
+
+    async def _get_token_balance_via_etherscan(self, address, contract_address):
+        """通过Etherscan API获取ERC20代币余额"""
         params = {
             'module': 'account',
             'action': 'tokenbalance',
@@ -215,46 +633,327 @@ class BSCBalanceChecker:
             params['chainid'] = self.chain_id
 
         try:
-            session = await self.get_session()
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=30)) as response:
-                response.raise_for_status()
-                data = await response.json()
-
-                if data.get('status') == '1':
-                    # USDT和USDC都是18位小数
-                    balance_raw = int(data.get('result', '0'))
-                    balance = Decimal(balance_raw) / Decimal(10**18)
-                    return float(balance)
-                else:
-                    error_msg = data.get('message', 'Unknown error')
-                    raise Exception(f"API Error: {error_msg}")
+            data = await self._get_api(params)
+
+            if data.get('status') == '1':
+                return int(data.get('result', '0'))
+            else:
+                error_msg = data.get('message', 'Unknown error')
+                raise Exception(f"API Error: {error_msg}")
 
         except aiohttp.ClientError as e:
             raise Exception(f"Network error: {str(e)}")
         except ValueError as e:
             raise Exception(f"Invalid response format: {str(e)}")
 
-    async def get_all_balances(self, address):
-        """获取地址的所有余额（BNB、USDT、USDC）（异步）"""
-        balances = {
-            'BNB': 0.0,
-            'USDT': 0.0,
-            'USDC': 0.0
+    async def get_all_balances_batch(self, addresses, max_retries=RPC_BATCH_MAX_RETRIES, max_age=0):
+        """通过Multicall3批量获取多个地址的BNB及TOKEN_CONTRACTS中所有代币余额
+
+        每个地址的BNB（getEthBalance）和代币余额（balanceOf）在同一次eth_call中返回，
+        按MULTICALL_CHUNK_SIZE个子调用分块，避免超出节点的gas和响应大小限制。
+        max_age: 可接受的缓存时长（秒），0表示总是重新查询（仍会与在途的相同查询合并）
+        返回 (balances, errors)：balances为{地址: {'BNB': wei, 'USDT': .., 'USDC': ..}}（均为最小单位的整数），errors为{地址: 错误信息}
+        """
+        assets = ['BNB'] + list(TOKEN_CONTRACTS.keys())
+        keys = {
+            address: [self.balance_cache.make_key(address, asset) for asset in assets]
+            for address in addresses
         }
 
+        async def fetch_missing(missing_keys):
+            missing = set(missing_keys)
+            fetched, fetch_errors = await self._fetch_all_balances_batch(
+                [address for address, address_keys in keys.items() if missing.intersection(address_keys)],
+                max_retries,
+            )
+            values = {}
+            errors = {}
+            for address, address_balances in fetched.items():
+                for asset, key in zip(assets, keys[address]):
+                    values[key] = address_balances[asset]
+            for address, error in fetch_errors.items():
+                for key in keys[address]:
+                    errors[key] = error
+            return values, errors
+
+        values, key_errors = await self.balance_cache.get_many(
+            [key for address_keys in keys.values() for key in address_keys], fetch_missing, max_age
+        )
+
+        balances = {}
+        errors = {}
+        for address, address_keys in keys.items():
+            if all(key in values for key in address_keys):
+                balances[address] = {asset: values[key] for asset, key in zip(assets, address_keys)}
+            else:
+                errors[address] = next((key_errors[key] for key in address_keys if key in key_errors), 'Unknown error')
+        return balances, errors
+
+    async def get_all_balances_raw(self, addresses, block_tag='latest', max_retries=RPC_BATCH_MAX_RETRIES):
+        """通过Multicall3在指定区块批量查询全部余额（不经过缓存）"""
+        return await self._fetch_all_balances_batch(addresses, max_retries, block_tag=block_tag)
+
+    async def _fetch_all_balances_batch(self, addresses, max_retries, block_tag='latest'):
+        """通过Multicall3批量查询全部余额（不经过缓存）"""
+        assets = ['BNB'] + list(TOKEN_CONTRACTS.keys())
+        addresses_per_chunk = max(1, MULTICALL_CHUNK_SIZE // len(assets))
+
+        balances = {}
+        errors = {}
+        pending = []
+        for address in dict.fromkeys(addresses):  # 去重并保持顺序
+            if self.is_valid_address(address):
+                pending.append(address)
+            else:
+                errors[address] = f"Invalid address: {address}"
+
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+
+            if attempt > 0:
+                await asyncio.sleep(min(attempt * 2, 10))
+
+            # 每个分块对应一次aggregate3 eth_call，多个分块再合并进JSON-RPC批量请求
+            chunks = [pending[i:i + addresses_per_chunk] for i in range(0, len(pending), addresses_per_chunk)]
+            failed = []
+            for start in range(0, len(chunks), RPC_BATCH_SIZE):
+                chunk_group = chunks[start:start + RPC_BATCH_SIZE]
+                calls = []
+                for chunk in chunk_group:
+                    sub_calls = []
+                    for address in chunk:
+                        sub_calls.append(encode_get_eth_balance(address))
+                        for symbol in assets[1:]:
+                            sub_calls.append(encode_balance_of(TOKEN_CONTRACTS[symbol], address))
+                    calls.append(("eth_call", [{"to": MULTICALL3_ADDRESS, "data": encode_aggregate3(sub_calls)}, block_tag]))
+
+                results, call_errors = await self.rpc_batch(calls)
+
+                for i, chunk in enumerate(chunk_group):
+                    if i not in results:
+                        for address in chunk:
+                            errors[address] = call_errors.get(i, "RPC Error: missing response")
+                        failed.extend(chunk)
+                        continue
+
+                    try:
+                        decoded = decode_aggregate3(results[i])
+                        if len(decoded) != len(chunk) * len(assets):
+                            raise ValueError("Multicall result length mismatch")
+                    except (TypeError, ValueError) as e:
+                        for address in chunk:
+                            errors[address] = f"Multicall response format error: {str(e)}"
+                        failed.extend(chunk)
+                        continue
+
+                    for j, address in enumerate(chunk):
+                        entries = decoded[j * len(assets):(j + 1) * len(assets)]
+                        try:
+                            address_balances = {}
+                            for symbol, (success, return_data) in zip(assets, entries):
+                                if not success:
+                                    raise ValueError(f"{symbol} call reverted")
+                                address_balances[symbol] = decode_uint256(return_data)
+                        except ValueError as e:
+                            errors[address] = f"Multicall error: {str(e)}"
+                            failed.append(address)
+                            continue
+                        balances[address] = address_balances
+                        errors.pop(address, None)
+
+            pending = failed
+
+        return balances, errors
+
+    async def get_all_balances(self, address, max_age=0):
+        """获取地址的所有余额（BNB、USDT、USDC，最小单位的整数）"""
+        # 优先通过一次Multicall3调用同时获取全部余额
         try:
-            balances['BNB'] = await self.get_bnb_balance(address)
-        except Exception as e:
-            print(f"Error getting BNB balance: {str(e)}")
-
-        try:
-            balances['USDT'] = await self.get_token_balance(address, TOKEN_CONTRACTS['USDT'])
+            multicall_balances, _ = await self.get_all_balances_batch([address], max_retries=0, max_age=max_age)
+            if address in multicall_balances:
+                return multicall_balances[address]
         except Exception as e:
-            print(f"Error getting USDT balance: {str(e)}")
-
-        try:
-            balances['USDC'] = await self.get_token_balance(address, TOKEN_CONTRACTS['USDC'])
-        except Exception as e:
-            print(f"Error getting USDC balance: {str(e)}")
+            print(f"Error getting balances via multicall: {str(e)}")
+
+        # Multicall3不可用时逐项查询（各自带Etherscan备用），所有资产并发进行
+        assets = ['BNB'] + list(TOKEN_CONTRACTS.keys())
+        results = await asyncio.gather(
+            self.get_bnb_balance(address),
+            *[self.get_token_balance(address, TOKEN_CONTRACTS[symbol]) for symbol in assets[1:]],
+            return_exceptions=True,
+        )
+
+        balances = {}
+        for symbol, result in zip(assets, results):
+            if isinstance(result, Exception):
+                print(f"Error getting {symbol} balance: {str(result)}")
+                result = 0
+            balances[symbol] = result
+        return balances
+
+    async def get_token_metadata(self, contracts):
+        """获取代币的decimals和symbol（优先读取持久化缓存，未缓存的合约通过一次Multicall3读取）
+
+        返回 (metadata, errors)：metadata为{合约地址(小写): {'symbol': str, 'decimals': int}}，errors为{合约地址(小写): 错误信息}
+        """
+        errors = {}
+        missing = self.token_metadata.missing(contracts)
+        if missing:
+            fetched, errors = await self._fetch_token_metadata(missing)
+            self.token_metadata.update(fetched)
+
+        metadata = {}
+        for contract in contracts:
+            entry = self.token_metadata.get(contract)
+            if entry is not None:
+                metadata[contract.lower()] = entry
+        return metadata, errors
+
+    async def _fetch_token_metadata(self, contracts):
+        """通过Multicall3读取decimals()和symbol()（不经过缓存）"""
+        metadata = {}
+        errors = {}
+        valid = []
+        for contract in contracts:
+            if self.is_valid_address(contract):
+                valid.append(contract)
+            else:
+                errors[contract] = f"Invalid contract address: {contract}"
+
+        contracts_per_chunk = max(1, MULTICALL_CHUNK_SIZE // 2)
+        chunks = [valid[i:i + contracts_per_chunk] for i in range(0, len(valid), contracts_per_chunk)]
+        for start in range(0, len(chunks), RPC_BATCH_SIZE):
+            chunk_group = chunks[start:start + RPC_BATCH_SIZE]
+            calls = []
+            for chunk in chunk_group:
+                sub_calls = []
+                for contract in chunk:
+                    sub_calls.append(encode_decimals(contract))
+                    sub_calls.append(encode_symbol(contract))
+                calls.append(("eth_call", [{"to": MULTICALL3_ADDRESS, "data": encode_aggregate3(sub_calls)}, "latest"]))
+
+            results, call_errors = await self.rpc_batch(calls)
+
+            for i, chunk in enumerate(chunk_group):
+                try:
+                    if i not in results:
+                        raise ValueError(call_errors.get(i, "RPC Error: missing response"))
+                    decoded = decode_aggregate3(results[i])
+                    if len(decoded) != len(chunk) * 2:
+                        raise ValueError("Multicall result length mismatch")
+                except (TypeError, ValueError) as e:
+                    for contract in chunk:
+                        errors[contract] = str(e)
+                    continue
+
+                for j, contract in enumerate(chunk):
+                    (decimals_ok, decimals_data), (symbol_ok, symbol_data) = decoded[2 * j:2 * j + 2]
+                    try:
+                        if not decimals_ok:
+                            raise ValueError("decimals() reverted, not a BEP-20 token")
+                        decimals = decode_uint256(decimals_data)
+                        if decimals > 255:
+                            raise ValueError(f"Invalid decimals: {decimals}")
+                        symbol = decode_string(symbol_data).strip() if symbol_ok else ''
+                    except ValueError as e:
+                        errors[contract] = str(e)
+                        continue
+                    # 没有symbol()的代币用缩写的合约地址代替
+                    metadata[contract] = {'symbol': symbol or f"{contract[:6]}...{contract[-4:]}", 'decimals': decimals}
+
+        return metadata, errors
+
+    async def get_token_balances_batch(self, addresses, contracts, max_retries=RPC_BATCH_MAX_RETRIES, max_age=0):
+        """批量获取多个地址在多个代币合约上的余额（所有 (地址, 合约) 组合通过Multicall3一起读取）
+
+        max_age: 可接受的缓存时长（秒），0表示总是重新查询（仍会与在途的相同查询合并）
+        返回 (balances, errors)：balances为{地址: {合约地址(小写): 余额（最小单位的整数）}}，只包含查询成功的组合；
+        errors为{(地址, 合约地址(小写)): 错误信息}
+        """
+        keys = {
+            (address, contract.lower()): self.balance_cache.make_key(address, contract.lower())
+            for address in addresses for contract in contracts
+        }
 
-        return balances
\ No newline at end of file
+        async def fetch_missing(missing_keys):
+            missing = set(missing_keys)
+            fetched, fetch_errors = await self._fetch_token_balances(
+                [pair for pair, key in keys.items() if key in missing], max_retries
+            )
+            return ({keys[pair]: balance for pair, balance in fetched.items()},
+                    {keys[pair]: error for pair, error in fetch_errors.items()})
+
+        values, key_errors = await self.balance_cache.get_many(keys.values(), fetch_missing, max_age)
+
+        balances = {}
+        errors = {}
+        for (address, contract), key in keys.items():
+            if key in values:
+                balances.setdefault(address, {})[contract] = values[key]
+            else:
+                errors[(address, contract)] = key_errors.get(key, 'Unknown error')
+        return balances, errors
+
+    async def _fetch_token_balances(self, pairs, max_retries):
+        """通过Multicall3批量查询 (地址, 合约) 组合的balanceOf（不经过缓存）"""
+        balances = {}
+        errors = {}
+        pending = []
+        for pair in dict.fromkeys(pairs):  # 去重并保持顺序
+            address, contract = pair
+            if not self.is_valid_address(address):
+                errors[pair] = f"Invalid address: {address}"
+            elif not self.is_valid_address(contract):
+                errors[pair] = f"Invalid contract address: {contract}"
+            else:
+                pending.append(pair)
+
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+
+            if attempt > 0:
+                await asyncio.sleep(min(attempt * 2, 10))
+
+            chunks = [pending[i:i + MULTICALL_CHUNK_SIZE] for i in range(0, len(pending), MULTICALL_CHUNK_SIZE)]
+            failed = []
+            for start in range(0, len(chunks), RPC_BATCH_SIZE):
+                chunk_group = chunks[start:start + RPC_BATCH_SIZE]
+                calls = [
+                    ("eth_call", [{"to": MULTICALL3_ADDRESS,
+                                   "data": encode_aggregate3([encode_balance_of(contract, address) for address, contract in chunk])},
+                                  "latest"])
+                    for chunk in chunk_group
+                ]
+
+                results, call_errors = await self.rpc_batch(calls)
+
+                for i, chunk in enumerate(chunk_group):
+                    try:
+                        if i not in results:
+                            raise ValueError(call_errors.get(i, "RPC Error: missing response"))
+                        decoded = decode_aggregate3(results[i])
+                        if len(decoded) != len(chunk):
+                            raise ValueError("Multicall result length mismatch")
+                    except (TypeError, ValueError) as e:
+                        for pair in chunk:
+                            errors[pair] = str(e)
+                        failed.extend(chunk)
+                        continue
+
+                    for pair, (success, return_data) in zip(chunk, decoded):
+                        try:
+                            if not success:
+                                # 合约调用被revert是确定性的结果，不再重试
+                                errors[pair] = "Multicall error: balanceOf reverted"
+                                continue
+                            balances[pair] = decode_uint256(return_data)
+                            errors.pop(pair, None)
+                        except ValueError as e:
+                            errors[pair] = f"Multicall error: {str(e)}"
+                            failed.append(pair)
+
+            pending = failed
+
+        return balances, errors
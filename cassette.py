@@ -0,0 +1,163 @@
+"""
+RPC流量录制/回放（cassette）
+录制模式下把每次JSON-RPC和Etherscan请求的请求体、响应（或错误）和耗时追加写入gzip压缩的JSONL文件；
+回放模式下不访问网络，按请求内容从文件中取出对应的响应返回，可以全速回放，也可以按录制时的耗时等待。
+用于在完全相同的工作负载下比较查询逻辑的改动
+"""
+
+import asyncio
+import gzip
+import json
+from collections import deque
+from typing import Deque, Dict
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+RPC = 'rpc'
+API = 'api'
+
+# 不参与请求匹配的Etherscan参数
+_IGNORED_API_PARAMS = ('apikey',)
+
+
+class CassetteMiss(aiohttp.ClientConnectionError):
+    """回放时找不到对应的录制记录（按网络错误处理，走正常的失败/重试逻辑）"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def _request_key(kind: str, request) -> str:
+    """请求的匹配键：JSON-RPC忽略id（由回放时按位置重新映射），Etherscan忽略API Key"""
+    if kind == RPC:
+        calls = request if isinstance(request, list) else [request]
+        body = [[call.get('method'), call.get('params')] for call in calls]
+        return kind + ':' + _dumps(body if isinstance(request, list) else body[0])
+    params = {k: v for k, v in request.items() if k not in _IGNORED_API_PARAMS}
+    return kind + ':' + _dumps(params)
+
+
+def _request_ids(request) -> list:
+    calls = request if isinstance(request, list) else [request]
+    return [call.get('id') if isinstance(call, dict) else None for call in calls]
+
+
+def _remap_ids(response, recorded_ids: list, current_ids: list):
+    """把录制响应中的id替换为本次请求的id"""
+    if recorded_ids == current_ids:
+        return response
+    mapping = {_dumps(old): new for old, new in zip(recorded_ids, current_ids)}
+    if isinstance(response, list):
+        remapped = []
+        for item in response:
+            if isinstance(item, dict) and _dumps(item.get('id')) in mapping:
+                item = dict(item, id=mapping[_dumps(item.get('id'))])
+            remapped.append(item)
+        return remapped
+    if isinstance(response, dict) and current_ids:
+        return dict(response, id=current_ids[0])
+    return response
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, timing: str = 'fast'):
+        """mode: record 或 replay；timing: fast（全速回放）或 original（按录制耗时等待）"""
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self.file = None
+        self.entries: Dict[str, Deque[dict]] = {}
+
+        if mode == 'record':
+            self.file = gzip.open(path, 'at', encoding='utf-8')
+        else:
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    entry = json.loads(line)
+                    self.entries.setdefault(_request_key(entry['k'], entry['q']), deque()).append(entry)
+            except (EOFError, json.JSONDecodeError):
+                # 录制进程未正常退出时文件末尾可能不完整，忽略残缺部分
+                print(f"⚠️ Cassette {self.path} is truncated, using the complete records only")
+        print(f"📼 Loaded {sum(len(v) for v in self.entries.values())} recorded requests from {self.path}")
+
+    async def handle(self, kind: str, url: str, request, send):
+        """send(kind, url, request) 执行真实请求；返回解析后的JSON或抛出与真实请求相同类型的异常"""
+        if self.mode == 'record':
+            return await self._record(kind, url, request, send)
+        return await self._replay(kind, url, request)
+
+    async def _record(self, kind, url, request, send):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        entry = {'k': kind, 'q': request if kind == RPC else {k: v for k, v in request.items() if k not in _IGNORED_API_PARAMS}}
+        try:
+            response = await send(kind, url, request)
+            entry['r'] = response
+            return response
+        except aiohttp.ClientResponseError as e:
+            entry['e'] = {'type': 'http', 'status': e.status, 'message': e.message}
+            raise
+        except asyncio.TimeoutError:
+            entry['e'] = {'type': 'timeout'}
+            raise
+        except aiohttp.ClientError as e:
+            entry['e'] = {'type': 'client', 'message': str(e)}
+            raise
+        except ValueError as e:
+            entry['e'] = {'type': 'decode', 'message': str(e)}
+            raise
+        finally:
+            # 被取消的请求没有结果，不录制
+            if self.file is not None and ('r' in entry or 'e' in entry):
+                entry['t'] = round(loop.time() - started, 4)
+                self.file.write(_dumps(entry) + '\n')
+                self.recorded += 1
+
+    async def _replay(self, kind, url, request):
+        queue = self.entries.get(_request_key(kind, request))
+        if not queue:
+            self.misses += 1
+            raise CassetteMiss(f"No recorded response for {kind} request")
+        # 相同请求按录制顺序依次回放，最后一条重复使用（支持多轮检查）
+        entry = queue.popleft() if len(queue) > 1 else queue[0]
+        self.replayed += 1
+
+        if self.timing == 'original' and entry.get('t'):
+            await asyncio.sleep(entry['t'])
+
+        error = entry.get('e')
+        if error is None:
+            if kind == RPC:
+                return _remap_ids(entry['r'], _request_ids(entry['q']), _request_ids(request))
+            return entry['r']
+        if error['type'] == 'http':
+            request_info = aiohttp.RequestInfo(URL(url), 'POST' if kind == RPC else 'GET',
+                                               CIMultiDictProxy(CIMultiDict()), URL(url))
+            raise aiohttp.ClientResponseError(request_info, (), status=error['status'], message=error.get('message', ''))
+        if error['type'] == 'timeout':
+            raise asyncio.TimeoutError()
+        if error['type'] == 'decode':
+            raise ValueError(error.get('message', ''))
+        raise aiohttp.ClientConnectionError(error.get('message', ''))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            print(f"📼 Recorded {self.recorded} requests to {self.path}")
+        elif self.mode == 'replay':
+            print(f"📼 Replayed {self.replayed} requests ({self.misses} misses)")
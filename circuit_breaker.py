@@ -0,0 +1,84 @@
+"""
+熔断器
+每个上游端点（RPC节点、BscScan API）一个熔断器：
+closed 正常放行；连续失败达到阈值后 open，冷却期内直接拒绝请求；
+冷却结束进入 half_open，只放行一个探测请求，成功则恢复 closed，失败则重新 open（冷却时间指数增长）
+"""
+
+import time
+from typing import Optional
+import aiohttp
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(aiohttp.ClientConnectionError):
+    """熔断器打开，请求没有发出（按网络错误处理，调用方无需等待超时）"""
+
+
+class DegradedError(Exception):
+    """RPC节点和备用API都不可用或已饱和：服务降级，调用方应稍后重试而不是继续排队"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, max_reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.consecutive_failures = 0
+        self.trips = 0            # 连续打开的次数（用于指数退避），恢复后清零
+        self.open_until = 0.0
+        self.probing = False      # half_open状态下是否已放行探测请求
+
+    def state(self, now: Optional[float] = None) -> str:
+        if self.trips == 0:
+            return CLOSED
+        if (now if now is not None else time.monotonic()) < self.open_until:
+            return OPEN
+        return HALF_OPEN
+
+    def allow_request(self, now: Optional[float] = None) -> bool:
+        """closed时放行；half_open时只放行一个探测请求；open时拒绝"""
+        state = self.state(now)
+        if state == CLOSED:
+            return True
+        return state == HALF_OPEN and not self.probing
+
+    def on_request(self, now: Optional[float] = None):
+        """请求即将发出：half_open状态下标记为探测请求"""
+        if self.state(now) == HALF_OPEN:
+            self.probing = True
+
+    def release_probe(self):
+        """探测请求没有结果（被取消），允许再次探测"""
+        self.probing = False
+
+    def record_success(self) -> bool:
+        """记录成功，返回熔断器是否因此从half_open恢复"""
+        if self.state() == OPEN:
+            # 熔断器打开前发出的请求晚到的成功，不提前关闭熔断器（与record_failure忽略晚到的失败对应）
+            return False
+        recovered = self.trips > 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+        return recovered
+
+    def record_failure(self, force_trip: bool = False, now: Optional[float] = None) -> Optional[float]:
+        """记录失败；探测失败、连续失败达到阈值或force_trip时打开熔断器，返回冷却秒数（未打开时返回None）"""
+        self.consecutive_failures += 1
+        if self.probing or force_trip or self.consecutive_failures >= self.failure_threshold:
+            return self.trip(now)
+        return None
+
+    def trip(self, now: Optional[float] = None) -> float:
+        duration = min(self.reset_timeout * (2 ** self.trips), self.max_reset_timeout)
+        self.trips += 1
+        self.open_until = (now if now is not None else time.monotonic()) + duration
+        self.probing = False
+        self.consecutive_failures = 0
+        return duration
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,22 +9,179 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 
 # API配置
 ETHERSCAN_API_KEY = os.getenv('ETHERSCAN_API_KEY', 'YourApiKeyToken')
-ETHERSCAN_API_BASE_URL = "https://api.bscscan.com/api"  # 使用BSC官方API
+ETHERSCAN_API_BASE_URL = os.getenv('ETHERSCAN_API_BASE_URL', "https://api.bscscan.com/api")  # 使用BSC官方API
 
 # BSC链ID（BscScan API不需要chainid参数）
 BSC_CHAIN_ID = None
 
 # 余额阈值 (BNB)
 LOW_BALANCE_THRESHOLD = 0.05
+LOW_BALANCE_THRESHOLD_WEI = 5 * 10**16  # 同一阈值的wei表示，程序内部的阈值比较一律使用wei
 
 # 检查间隔 (分钟)
 CHECK_INTERVAL = 30
 
+# 监控模式：poll（每CHECK_INTERVAL分钟全量检查）、blocks（跟随新区块只检查被触及的地址，
+# 并保留每CHECK_INTERVAL分钟一次的全量检查兜底）或 adaptive（按距阈值余量和消耗速度为每个地址安排检查时间）
+MONITOR_MODE = os.getenv('MONITOR_MODE', 'poll')
+BLOCK_POLL_INTERVAL = 3      # 轮询最新区块的间隔（秒）
+BLOCK_MAX_PER_POLL = 20      # 每次轮询最多处理的区块数
+BLOCK_MAX_LAG = 200          # 落后超过该区块数时跳到最新区块并触发一次全量检查
+
+# 自适应调度配置（MONITOR_MODE=adaptive）
+ADAPTIVE_MIN_INTERVAL = 60          # 最短检查间隔（秒）
+ADAPTIVE_MAX_INTERVAL = 4 * 3600    # 最长检查间隔（秒）
+ADAPTIVE_HEADROOM_FULL = 10         # 余量达到阈值的该倍数时使用最长间隔
+ADAPTIVE_SAFETY_FACTOR = 0.25       # 按消耗速度预计跌破阈值时间的该比例安排下次检查
+ADAPTIVE_BURN_ALPHA = 0.3           # 消耗速度的EWMA平滑系数
+ADAPTIVE_RETRY_INTERVAL = 60        # 查询失败后的重试间隔（秒）
+ADAPTIVE_MAX_BATCH = 1000           # 每轮最多检查的到期地址数
+
+# USDT/USDC余额增量跟踪：基于Transfer事件日志维护本地余额表（需要节点支持eth_getLogs）
+TOKEN_TRACKING = os.getenv('TOKEN_TRACKING', 'false').lower() in ('1', 'true', 'yes')
+TOKEN_SYNC_INTERVAL = 3             # 拉取新日志的间隔（秒）
+TOKEN_LOG_MAX_RANGE = 50            # 每次eth_getLogs查询的最大区块范围
+TOKEN_LOG_CONFIRMATIONS = 2         # 只处理落后最新区块若干个确认的区块，减少重组影响
+TOKEN_LOG_TOPIC_CHUNK = 500         # 每个日志过滤条件中最多包含的地址topic数
+TOKEN_RECONCILE_INTERVAL = 3600     # 定期重新读取balanceOf校准的间隔（秒）
+TOKEN_TRACKER_MAX_STALENESS = 60    # 本地余额表超过该时间未同步则不再使用（秒）
+
 # API查询间隔 (秒) - 避免触发API限制
 API_QUERY_INTERVAL = 3
 
+# BSC公共RPC节点列表（逗号分隔，可通过环境变量覆盖）
+BSC_RPC_URLS = [
+    url.strip() for url in os.getenv(
+        'BSC_RPC_URLS',
+        'https://bsc-dataseed1.binance.org,'
+        'https://bsc-dataseed2.binance.org,'
+        'https://bsc-dataseed3.binance.org,'
+        'https://bsc-dataseed4.binance.org'
+    ).split(',') if url.strip()
+]
+
+# RPC节点池健康评分配置
+RPC_POOL_EWMA_ALPHA = 0.2          # 延迟和错误率的EWMA平滑系数
+RPC_POOL_EJECT_FAILURES = 3        # 连续失败多少次后剔除节点
+RPC_POOL_EJECT_ERROR_RATE = 0.5    # 错误率超过该值时剔除节点
+RPC_POOL_EJECT_SECONDS = 30        # 首次剔除的冷却时间（秒），之后指数增长
+RPC_POOL_MAX_EJECT_SECONDS = 600   # 最长冷却时间（秒）
+RPC_POOL_RATE_LIMIT_PENALTY = 60   # 收到429后降低该节点优先级的时长（秒）
+RPC_POOL_EXPLORE_RATE = 0.05       # 随机选择其他健康节点的概率，保持延迟统计更新
+
+# 对冲请求：主节点在自适应延迟（该节点最近延迟的P95）内未响应时，向另一个节点发送相同请求，取先返回的有效结果
+RPC_HEDGE_ENABLED = os.getenv('RPC_HEDGE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RPC_HEDGE_PERCENTILE = 0.95        # 对冲延迟使用的延迟分位数
+RPC_HEDGE_WINDOW = 200             # 每个节点保留的最近延迟样本数
+RPC_HEDGE_MIN_SAMPLES = 20         # 样本不足时使用RPC_HEDGE_MAX_DELAY
+RPC_HEDGE_MIN_DELAY = 0.05         # 对冲延迟下限（秒）
+RPC_HEDGE_MAX_DELAY = 2.0          # 对冲延迟上限（秒）
+RPC_HEDGE_BUDGET_RATIO = 0.05      # 对冲请求最多占普通请求的比例（额外流量上限）
+RPC_HEDGE_BUDGET_BURST = 10        # 对冲预算的最大累积量（次）
+
+# JSON-RPC批量请求配置
+RPC_BATCH_SIZE = 200         # 每个批量请求包含的调用数
+RPC_BATCH_MAX_RETRIES = 3    # 批量请求中失败条目的最大重试次数
+
+# 限速配置：每个RPC节点的并发数由AIMD自适应控制（关闭时改用固定速率的令牌桶），并限制全局同时在途的请求数
+RPC_RATE_LIMIT = 3.3         # 关闭AIMD时每个RPC节点的平均请求速率（次/秒）
+RPC_RATE_BURST = 5           # 关闭AIMD时每个RPC节点允许的突发请求数
+RPC_MAX_CONCURRENCY = 64     # 全局最大并发请求数
+
+# AIMD自适应并发：请求成功时每个节点的并发上限加性增长（约每轮满并发的请求+1），
+# 收到HTTP 429、JSON-RPC限流错误或超时时乘性下降
+RPC_AIMD_ENABLED = os.getenv('RPC_AIMD_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RPC_AIMD_INITIAL = 4         # 初始并发上限
+RPC_AIMD_MIN = 1
+RPC_AIMD_MAX = 32
+RPC_AIMD_INCREASE = 1.0      # 每轮增加量
+RPC_AIMD_DECREASE = 0.5      # 拥塞时的乘数
+ETHERSCAN_RATE_LIMIT = 5     # BscScan API每个Key约5次/秒
+ETHERSCAN_RATE_BURST = 5
+
+# BscScan备用通道：RPC失败时的单地址查询走独立的限速通道，排队超过该时长的请求直接返回“服务降级”
+ETHERSCAN_FALLBACK_MAX_WAIT = 5       # 最多排队的请求量（按ETHERSCAN_RATE_LIMIT折算的秒数）
+ETHERSCAN_MAX_CONCURRENCY = 5         # 同时在途的BscScan请求数
+ETHERSCAN_REQUEST_TIMEOUT = 10        # BscScan请求超时（秒）
+ETHERSCAN_BREAKER_FAILURES = 5        # BscScan连续失败多少次后打开熔断器
+ETHERSCAN_BREAKER_SECONDS = 30        # BscScan熔断器首次打开的冷却时间（秒），之后指数增长
+
+# 余额缓存配置（机器人和监控器共享）
+BALANCE_CACHE_TTL = 60                 # 默认缓存有效期（秒）
+BALANCE_CACHE_MAX_ENTRIES = 50000      # 最多缓存的 (地址, 资产) 条目数，超出按LRU淘汰
+BALANCE_CACHE_BOT_MAX_AGE = 300        # 机器人命令可接受的余额最大陈旧时间（秒）
+
+# Multicall3配置：每次aggregate3 eth_call最多包含的子调用数（控制gas和响应大小）
+MULTICALL_CHUNK_SIZE = 300
+
+# Telegram警告发送队列配置
+TELEGRAM_GLOBAL_RATE = 30      # 全局发送速率（条/秒）
+TELEGRAM_PER_CHAT_RATE = 1     # 单个聊天的发送速率（条/秒）
+ALERT_QUEUE_SIZE = 10000       # 待发送队列上限，超出时丢弃
+ALERT_WORKERS = 4              # 后台发送worker数
+ALERT_MAX_ATTEMPTS = 5         # 单条消息最多尝试次数
+# 摘要模式：同一用户在一轮检查或合并窗口内的多条警告合并为一条消息
+ALERT_DIGEST = os.getenv('ALERT_DIGEST', 'true').lower() in ('1', 'true', 'yes')
+ALERT_DIGEST_WINDOW = 60       # 合并窗口（秒），非全量检查产生的警告在窗口结束时发送
+ALERT_COOLDOWN = 24 * 3600     # 同一用户同一地址的警告最短间隔（秒）
+
+# /list、/check 流式返回结果：地址分批并发查询，每批完成后原地编辑结果消息，失败的地址在后台重试后补上
+BOT_QUERY_CHUNK_SIZE = 20      # 每批查询的地址数
+BOT_QUERY_ROUNDS = 5           # 含首轮在内最多查询几轮
+TELEGRAM_EDIT_INTERVAL = float(os.getenv('TELEGRAM_EDIT_INTERVAL', '1.5'))  # 同一份结果两次编辑（或发送）之间的最短间隔（秒）
+
+# /list 分页：每页只查询本页地址，并在后台预取下一页；查询过的页面在LIST_PAGE_CACHE_TTL内翻页时直接显示
+LIST_PAGE_SIZE = 10
+LIST_PAGE_CACHE_TTL = 60       # 页面结果的缓存时间（秒）
+LIST_VIEW_MAX = 1000           # 保留翻页状态的列表消息数，更早的消息翻页时重新建立
+
+# Telegram更新接收方式：polling（默认）或 webhook（内置aiohttp服务器接收推送）
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# 同时处理的Update数量（两种模式均生效）
+BOT_UPDATE_CONCURRENCY = int(os.getenv('BOT_UPDATE_CONCURRENCY', '8'))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')              # Telegram推送的公网地址，为空时不自动调用setWebhook
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')        # 校验X-Telegram-Bot-Api-Secret-Token请求头
+
+# Prometheus指标：未启用时所有统计都是空操作
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))  # Webhook模式下直接挂在Webhook服务器上
+METRICS_PATH = '/metrics'
+
+# RPC流量录制/回放：record 录制真实请求，replay 离线回放（为空时关闭）
+CASSETTE_MODE = os.getenv('CASSETTE_MODE', '')
+CASSETTE_FILE = os.getenv('CASSETTE_FILE', 'rpc_cassette.jsonl.gz')
+CASSETTE_TIMING = os.getenv('CASSETTE_TIMING', 'fast')  # fast（全速）或 original（按录制耗时）
+
 # 数据存储文件
-USER_DATA_FILE = "user_data.json"
+USER_DATA_FILE = os.getenv('USER_DATA_FILE', 'user_data.json')  # JSON存储文件（SQLite存储时为待迁移的旧数据）
+
+# 用户数据存储后端：sqlite（默认，首次启动时自动从USER_DATA_FILE迁移）或 json
+USER_STORAGE_BACKEND = os.getenv('USER_STORAGE_BACKEND', 'sqlite')
+USER_DB_FILE = os.getenv('USER_DB_FILE', 'user_data.db')
+
+# 分片监控：多个监控worker（main.py 和 monitor_worker.py 进程，同一容器内或多个副本）通过USER_DB_FILE中的租约表
+# 各自负责一部分地址分区（crc32(地址) % MONITOR_PARTITIONS），worker退出或失联后其分区由其他worker接管。
+# 需要SQLite用户存储，且所有worker访问同一个数据库文件
+MONITOR_SHARDING = os.getenv('MONITOR_SHARDING', 'false').lower() in ('1', 'true', 'yes')
+MONITOR_PARTITIONS = int(os.getenv('MONITOR_PARTITIONS', '64'))   # 所有worker必须一致
+MONITOR_WORKER_ID = os.getenv('MONITOR_WORKER_ID', f"{socket.gethostname()}-{os.getpid()}")
+MONITOR_LEASE_TTL = 30              # 租约有效期（秒），worker失联超过该时长后其分区被接管
+MONITOR_LEASE_RENEW_INTERVAL = 10   # 续约（同时重新加载用户数据）的间隔（秒）
+
+# 余额历史时序存储（内存映射文件），每个地址固定占用一个槽位
+BALANCE_HISTORY_FILE = os.getenv('BALANCE_HISTORY_FILE', 'balance_history.dat')
+# 降采样层：(分辨率秒数, 保留记录数) —— 原始采样约2天、每小时7天、每天90天
+BALANCE_HISTORY_TIERS = [(0, 96), (3600, 168), (86400, 90)]
+# /forecast 估算消耗速度时使用的时间窗口（秒）
+FORECAST_WINDOW = 24 * 3600
+
+# 用户自选代币：每个用户最多关注的BEP-20代币数；代币的decimals和symbol持久化缓存在本地文件
+MAX_WATCHED_TOKENS = 20
+TOKEN_METADATA_FILE = os.getenv('TOKEN_METADATA_FILE', 'token_metadata.json')
 
 # BSC代币合约地址
 TOKEN_CONTRACTS = {
@@ -5,11 +5,19 @@ BSC Gas余额监控机器人
 """
 
 import asyncio
+import secrets
 import sys
 import signal
+from telegram import Update
 from telegram_bot import GasAlertBot
 from monitor import BalanceMonitor
-from config import TELEGRAM_BOT_TOKEN, ETHERSCAN_API_KEY
+from webhook_server import WebhookServer
+from metrics import metrics_handler, start_metrics_server
+from config import (
+    TELEGRAM_BOT_TOKEN, ETHERSCAN_API_KEY, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    METRICS_ENABLED, METRICS_PATH,
+)
+
 
 def check_config():
     """检查配置是否完整"""
@@ -20,6 +28,11 @@ def check_config():
     if ETHERSCAN_API_KEY == 'YourApiKeyToken':
         print("❌ 错误: 请在 .env 文件中设置 ETHERSCAN_API_KEY")
         return False
+
+    if BOT_MODE == 'webhook' and not WEBHOOK_URL and not WEBHOOK_SECRET:
+        # 不调用setWebhook时无法自动生成密钥，Update由前置代理转发，必须显式配置
+        print("❌ 错误: Webhook模式下未设置 WEBHOOK_URL 时必须设置 WEBHOOK_SECRET")
+        return False
     
     return True
 
@@ -27,6 +40,8 @@ class GasAlertService:
     def __init__(self):
         self.bot = None
         self.monitor = None
+        self.webhook_server = None
+        self.metrics_runner = None
         self.running = False
     
     async def start(self):
@@ -42,6 +57,9 @@ class GasAlertService:
             
             # 初始化监控器
             self.monitor = BalanceMonitor(self.bot)
+
+            # 启动警告消息后台发送队列
+            self.bot.alert_dispatcher.start()
             
             # 启动监控
             self.monitor.start_monitoring()
@@ -58,7 +76,12 @@ class GasAlertService:
             # 运行机器人（阻塞）
             await self.bot.application.initialize()
             await self.bot.application.start()
-            await self.bot.application.updater.start_polling()
+            if BOT_MODE == 'webhook':
+                await self.start_webhook()
+            else:
+                await self.bot.application.updater.start_polling()
+                if METRICS_ENABLED:
+                    self.metrics_runner = await start_metrics_server()
             
             # 保持运行直到收到停止信号
             while self.running:
@@ -81,8 +104,16 @@ class GasAlertService:
             self.monitor.stop_monitoring()
         
         if self.bot:
+            await self.bot.alert_dispatcher.stop()
+            self.bot.balance_history.close()
+            await self.bot.balance_checker.close_session()
             try:
-                await self.bot.application.updater.stop()
+                if self.metrics_runner:
+                    await self.metrics_runner.cleanup()
+                if self.webhook_server:
+                    await self.webhook_server.stop()
+                elif self.bot.application.updater.running:
+                    await self.bot.application.updater.stop()
                 await self.bot.application.stop()
                 await self.bot.application.shutdown()
             except Exception as e:
@@ -90,6 +121,33 @@ class GasAlertService:
         
         print("✅ Service stopped")
     
+    async def start_webhook(self):
+        """启动内置Webhook服务器，配置了WEBHOOK_URL时向Telegram注册推送地址
+
+        没有设置WEBHOOK_SECRET时每次启动生成随机密钥，随setWebhook一起注册
+        """
+        secret_token = WEBHOOK_SECRET
+        if not secret_token:
+            secret_token = secrets.token_urlsafe(32)
+            print("🔑 WEBHOOK_SECRET not set, generated a random secret token for this run")
+        self.webhook_server = WebhookServer(self.bot.application, secret_token=secret_token)
+        if METRICS_ENABLED:
+            # 指标接口与Webhook共用同一个HTTP服务器
+            self.webhook_server.add_route('GET', METRICS_PATH, metrics_handler)
+        await self.webhook_server.start()
+        if WEBHOOK_URL:
+            url = WEBHOOK_URL.rstrip('/')
+            if not url.endswith(WEBHOOK_PATH):
+                url += WEBHOOK_PATH
+            await self.bot.application.bot.set_webhook(
+                url=url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+            print(f"🔗 Webhook registered: {url}")
+        else:
+            print("⚠️ WEBHOOK_URL not set, skipping setWebhook (expecting updates to be POSTed directly)")
+
     def setup_signal_handlers(self):
         """设置信号处理器"""
         def signal_handler(signum, frame):
@@ -117,6 +175,9 @@ TELEGRAM_BOT_TOKEN=your_telegram_bot_token_here
 
 # Etherscan API Key (从 https://etherscan.io/apis 获取)
 ETHERSCAN_API_KEY=your_etherscan_api_key_here
+
+# BSC RPC节点列表（可选，逗号分隔，默认使用bsc-dataseed1~4）
+# BSC_RPC_URLS=https://bsc-dataseed1.binance.org,https://bsc-dataseed2.binance.org
 """)
         print("📝 Created .env.example file")
     except:
@@ -0,0 +1,140 @@
+"""
+Telegram消息工具
+"""
+
+import asyncio
+from datetime import timedelta
+from typing import Callable, Iterable, List, Optional
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from config import TELEGRAM_EDIT_INTERVAL
+
+# Telegram单条消息的最大长度
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def split_message(blocks: Iterable[str], header: str = '', footer: str = '',
+                  limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """把多个文本块拼接成若干条不超过limit的消息，尽量不在块内部断开
+
+    每条消息都带header；footer只附加在最后一条消息末尾（放不下时单独成一条）
+    """
+    messages = []
+    current = header
+    for block in blocks:
+        # 单个块本身超长时按长度硬切分
+        while len(header) + len(block) > limit:
+            room = limit - len(header)
+            if current != header:
+                messages.append(current)
+                current = header
+            messages.append(header + block[:room])
+            block = block[room:]
+        if len(current) + len(block) > limit:
+            messages.append(current)
+            current = header
+        current += block
+
+    if footer:
+        if len(current) + len(footer) > limit:
+            messages.append(current)
+            current = footer[:limit]
+        else:
+            current += footer
+
+    if current and current != header or not messages:
+        messages.append(current)
+    return messages
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class LiveReport:
+    """随查询进度原地更新的回复消息
+
+    render() 返回当前完整内容的消息列表（通常由split_message生成）。refresh() 只标记内容已变化，
+    实际编辑按min_interval节流，期间的多次refresh合并为一次；内容变长时追加新消息，变短时删除多余的消息
+    """
+
+    def __init__(self, origin, render: Callable[[], List[str]], min_interval: float = TELEGRAM_EDIT_INTERVAL,
+                 messages=None, reply_markup: Optional[Callable] = None):
+        self.origin = origin  # 用户发来的命令消息，结果作为它的回复发送
+        self.render = render
+        self.min_interval = min_interval
+        # messages: 接管已发送的消息（如点击了内联按钮的消息），之后直接编辑它们
+        self.messages = list(messages or [])
+        self.texts: List[str] = [message.text for message in self.messages]
+        # reply_markup(): 附加在最后一条消息上的内联键盘（随内容一起更新）
+        self.reply_markup = reply_markup
+        self.last_call = 0.0
+        self.dirty = False
+        self.flush_task = None
+        self.lock = asyncio.Lock()
+
+    async def start(self):
+        """发送初始内容"""
+        await self._sync()
+
+    def refresh(self):
+        self.dirty = True
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush())
+
+    async def finish(self):
+        """等待排队中的编辑完成，并同步最终内容"""
+        if self.flush_task is not None:
+            await self.flush_task
+        self.dirty = False
+        await self._sync()
+
+    async def _flush(self):
+        while self.dirty:
+            self.dirty = False
+            await self._sync()
+
+    async def _sync(self):
+        async with self.lock:
+            texts = self.render()
+            markup = self.reply_markup() if self.reply_markup is not None else None
+            for i, text in enumerate(texts):
+                reply_markup = markup if i == len(texts) - 1 else None
+                if i < len(self.messages):
+                    if text != self.texts[i] and await self._call(self.messages[i].edit_text, text, reply_markup=reply_markup) is not None:
+                        self.texts[i] = text
+                else:
+                    message = await self._call(self.origin.reply_text, text, reply_markup=reply_markup)
+                    if message is None:
+                        return
+                    self.messages.append(message)
+                    self.texts.append(text)
+            while len(self.messages) > len(texts):
+                message = self.messages.pop()
+                self.texts.pop()
+                await self._call(message.delete)
+
+    async def _call(self, method, *args, **kwargs):
+        """按min_interval节流调用Telegram接口，失败时返回None（遇到RetryAfter时等待后重试一次）"""
+        loop = asyncio.get_running_loop()
+        for _ in range(2):
+            wait = self.last_call + self.min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_call = loop.time()
+            try:
+                return await method(*args, **kwargs)
+            except RetryAfter as e:
+                await asyncio.sleep(retry_after_seconds(e))
+            except BadRequest as e:
+                # 内容与当前消息相同时Telegram会拒绝编辑，视为成功
+                if 'not modified' in str(e).lower():
+                    return True
+                print(f"⚠️ Failed to update reply: {str(e)}")
+                return None
+            except TelegramError as e:
+                print(f"⚠️ Failed to update reply: {str(e)}")
+                return None
+        return None
@@ -0,0 +1,257 @@
+"""
+进程内指标统计（Prometheus文本格式）
+计数器、仪表和直方图按标签值分组，由 /metrics 接口输出。未启用METRICS_ENABLED时
+所有指标都是空操作对象，热路径上只剩一次空方法调用
+"""
+
+import bisect
+import time
+from aiohttp import web
+from typing import Dict, List, Sequence, Tuple
+from config import METRICS_ENABLED, METRICS_LISTEN, METRICS_PORT, METRICS_PATH
+
+# 默认直方图分桶（秒），覆盖RPC请求从几毫秒到超时的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Timer:
+    """with histogram.time(...): 统计代码块耗时"""
+
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.started, *self.labels)
+        return False
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        for labels, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: Dict[Tuple, list] = {}  # 标签值 -> [各分桶计数..., 总和, 总数]
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [0] * (len(self.buckets) + 2)
+        # 只记录落入的分桶，输出时再累加
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[index] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def time(self, *labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, state in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            inf = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{inf} {state[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}')
+        return lines
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NoopMetric:
+    """未启用指标时使用的空操作对象"""
+
+    __slots__ = ()
+    _timer = _NoopTimer()
+
+    def inc(self, *labels, amount: float = 1):
+        pass
+
+    def observe(self, value: float, *labels):
+        pass
+
+    def set(self, value: float, *labels):
+        pass
+
+    def time(self, *labels):
+        return self._timer
+
+
+_NOOP = _NoopMetric()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        if not self.enabled:
+            return _NOOP
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        if not self.enabled:
+            return _NOOP
+        metric = Gauge(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS):
+        if not self.enabled:
+            return _NOOP
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
+
+
+# RPC节点
+RPC_REQUESTS = _registry.counter(
+    'gas_rpc_requests_total', 'JSON-RPC HTTP requests by endpoint and outcome', ('endpoint', 'outcome'))
+RPC_REQUEST_SECONDS = _registry.histogram(
+    'gas_rpc_request_seconds', 'JSON-RPC HTTP request latency', ('endpoint',))
+RPC_HEDGES = _registry.counter(
+    'gas_rpc_hedges_total', 'Hedged JSON-RPC requests by outcome (sent, won, lost, failed, budget_exhausted)', ('outcome',))
+RPC_CONCURRENCY_LIMIT = _registry.gauge(
+    'gas_rpc_concurrency_limit', 'Current adaptive (AIMD) concurrency limit per RPC endpoint', ('endpoint',))
+RPC_CONCURRENCY_DECREASES = _registry.counter(
+    'gas_rpc_concurrency_decreases_total', 'AIMD concurrency limit cuts by endpoint and signal', ('endpoint', 'signal'))
+CIRCUIT_TRANSITIONS = _registry.counter(
+    'gas_circuit_transitions_total', 'Circuit breaker transitions by endpoint and new state', ('endpoint', 'state'))
+
+# Etherscan（BscScan）API
+ETHERSCAN_REQUESTS = _registry.counter(
+    'gas_etherscan_requests_total', 'Etherscan API requests by outcome', ('outcome',))
+ETHERSCAN_REQUEST_SECONDS = _registry.histogram(
+    'gas_etherscan_request_seconds', 'Etherscan API request latency')
+ETHERSCAN_FALLBACKS = _registry.counter(
+    'gas_etherscan_fallbacks_total', 'Single-address queries that fell back from RPC to Etherscan', ('asset',))
+
+# 单地址余额查询（get_bnb_balance / get_token_balance）
+BALANCE_QUERIES = _registry.counter(
+    'gas_balance_queries_total', 'Single-address balance queries by asset and result source', ('asset', 'source'))
+BALANCE_QUERY_SECONDS = _registry.histogram(
+    'gas_balance_query_seconds', 'Single-address balance query latency including fallback', ('asset',))
+
+# 监控轮次
+SWEEP_SECONDS = _registry.histogram(
+    'gas_sweep_seconds', 'Duration of a balance check over all queried addresses',
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+SWEEP_ROUNDS = _registry.counter(
+    'gas_sweep_rounds_total', 'Query rounds executed by balance checks (first round plus retries)', ('round',))
+SWEEP_ADDRESSES = _registry.counter(
+    'gas_sweep_addresses_total', 'Addresses processed by balance checks by result', ('result',))
+
+# 警告发送
+ALERTS = _registry.counter(
+    'gas_alerts_total', 'Low-balance alert messages by outcome', ('outcome',))
+ALERT_SEND_SECONDS = _registry.histogram(
+    'gas_alert_send_seconds', 'Telegram sendMessage latency for alerts')
+
+
+async def metrics_handler(request):
+    """GET /metrics"""
+    return web.Response(text=_registry.render(), content_type='text/plain', charset='utf-8',
+                        headers={'X-Content-Type-Options': 'nosniff'})
+
+
+async def start_metrics_server(listen: str = METRICS_LISTEN, port: int = METRICS_PORT, path: str = METRICS_PATH):
+    """单独启动只提供 /metrics 的HTTP服务器，返回AppRunner（停止时调用cleanup）"""
+    app = web.Application()
+    app.router.add_get(path, metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    print(f"📈 Metrics available on {listen}:{port}{path}")
+    return runner
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+本地模拟BSC JSON-RPC节点和BscScan API（用于基准测试和离线调试）
+
+支持单个和批量JSON-RPC请求、Multicall3 aggregate3、区块和日志查询，
+可配置延迟分布、HTTP错误、单个调用错误和429限流注入。
+余额由地址哈希确定性生成，也可以通过 set_balance 指定
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from typing import Dict, Optional
+from aiohttp import web
+from multicall import (
+    MULTICALL3_ADDRESS, AGGREGATE3_SELECTOR, GET_ETH_BALANCE_SELECTOR, BALANCE_OF_SELECTOR,
+    DECIMALS_SELECTOR, SYMBOL_SELECTOR,
+)
+from config import TOKEN_CONTRACTS
+
+BSC_CHAIN_ID_HEX = '0x38'
+BLOCK_TIME = 3
+
+
+def _word(value: int) -> bytes:
+    return value.to_bytes(32, 'big')
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b'\x00' * (-len(data) % 32)
+
+
+def decode_aggregate3_calls(call_data: bytes):
+    """解析aggregate3((address,bool,bytes)[])的参数，返回 [(目标地址, calldata), ...]"""
+    def word(offset: int) -> int:
+        return int.from_bytes(call_data[offset:offset + 32], 'big')
+
+    array_start = word(0)
+    count = word(array_start)
+    base = array_start + 32
+    calls = []
+    for i in range(count):
+        tuple_start = base + word(base + 32 * i)
+        target = '0x' + call_data[tuple_start + 12:tuple_start + 32].hex()
+        bytes_start = tuple_start + word(tuple_start + 64)
+        length = word(bytes_start)
+        calls.append((target, call_data[bytes_start + 32:bytes_start + 32 + length]))
+    return calls
+
+
+def encode_aggregate3_results(results) -> str:
+    """编码aggregate3的返回值 (bool success, bytes returnData)[]"""
+    encoded = [_word(1 if success else 0) + _word(0x40) + _word(len(data)) + _pad(data) for success, data in results]
+    offsets = []
+    position = 32 * len(encoded)
+    for item in encoded:
+        offsets.append(_word(position))
+        position += len(item)
+    return '0x' + (_word(0x20) + _word(len(encoded)) + b''.join(offsets) + b''.join(encoded)).hex()
+
+
+def _encode_string(value: str) -> bytes:
+    raw = value.encode()
+    return _word(0x20) + _word(len(raw)) + _pad(raw)
+
+
+class MockBSCServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 distribution: str = 'uniform', per_call_latency: float = 0.0, error_rate: float = 0.0,
+                 call_error_rate: float = 0.0, rate_limit_rate: float = 0.0, max_batch: int = 1000,
+                 seed: Optional[int] = None, max_concurrency: int = 0):
+        """
+        latency/jitter/distribution: 每个HTTP请求的延迟（秒），distribution为uniform（latency±jitter）
+            或lognormal（中位数latency，jitter为对数标准差）
+        per_call_latency: 批量请求中每个调用额外增加的延迟
+        error_rate: 整个HTTP请求返回500的概率
+        call_error_rate: 单个JSON-RPC调用返回错误的概率
+        rate_limit_rate: 返回429的概率
+        max_batch: 单个批量请求允许的最大调用数，超出时返回JSON-RPC错误
+        max_concurrency: 同时处理的JSON-RPC请求数上限，超出时返回429（0表示不限制），模拟按负载限流的公共节点
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.per_call_latency = per_call_latency
+        self.error_rate = error_rate
+        self.call_error_rate = call_error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_batch = max_batch
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.random = random.Random(seed)
+
+        self.balances: Dict[str, int] = {}
+        self.token_balances: Dict[tuple, int] = {}
+        self.tokens = {contract.lower(): symbol for symbol, contract in TOKEN_CONTRACTS.items()}
+        self.token_decimals: Dict[str, int] = {}
+        self.started_at = time.time()
+        self.genesis_block = 40_000_000
+
+        self.http_requests = 0
+        self.rpc_calls = 0
+        self.api_requests = 0
+        self.injected_errors = 0
+        self.injected_rate_limits = 0
+        self.overload_rate_limits = 0
+
+        self.app = web.Application(client_max_size=64 * 1024 * 1024)
+        self.app.router.add_post('/', self.handle_rpc)
+        self.app.router.add_get('/api', self.handle_api)
+        self.runner = None
+
+    @property
+    def rpc_url(self) -> str:
+        return f"http://{self.host}:{self.port}/"
+
+    @property
+    def api_url(self) -> str:
+        return f"http://{self.host}:{self.port}/api"
+
+    def reset_stats(self):
+        self.http_requests = 0
+        self.rpc_calls = 0
+        self.api_requests = 0
+        self.injected_errors = 0
+        self.injected_rate_limits = 0
+        self.overload_rate_limits = 0
+        self.peak_in_flight = 0
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = self.runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    # 模拟链上状态
+
+    @staticmethod
+    def _hash_int(*parts) -> int:
+        return int.from_bytes(hashlib.sha256(':'.join(parts).encode()).digest()[:8], 'big')
+
+    def set_balance(self, address: str, wei: int):
+        self.balances[address.lower()] = wei
+
+    def set_token_balance(self, contract: str, address: str, amount: int):
+        self.token_balances[(contract.lower(), address.lower())] = amount
+
+    def add_token(self, contract: str, symbol: str, decimals: int = 18):
+        """部署一个模拟BEP-20代币（未添加的合约地址调用时会revert）"""
+        self.tokens[contract.lower()] = symbol
+        self.token_decimals[contract.lower()] = decimals
+
+    def balance_of(self, address: str) -> int:
+        """BNB余额：未指定时按地址哈希生成 0 ~ 0.2 BNB"""
+        address = address.lower()
+        if address not in self.balances:
+            return self._hash_int('bnb', address) % (2 * 10**17)
+        return self.balances[address]
+
+    def token_balance_of(self, contract: str, address: str) -> int:
+        key = (contract.lower(), address.lower())
+        if key not in self.token_balances:
+            return self._hash_int(*key) % (1000 * 10**18)
+        return self.token_balances[key]
+
+    def block_number(self) -> int:
+        return self.genesis_block + int((time.time() - self.started_at) / BLOCK_TIME)
+
+    # 故障注入
+
+    def _delay(self, calls: int) -> float:
+        if self.distribution == 'lognormal' and self.latency > 0:
+            delay = self.random.lognormvariate(0, self.jitter) * self.latency
+        else:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay + self.per_call_latency * calls)
+
+    def _injected_failure(self) -> Optional[web.Response]:
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            self.injected_rate_limits += 1
+            return web.Response(status=429, text='Too Many Requests')
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.injected_errors += 1
+            return web.Response(status=500, text='Internal Server Error')
+        return None
+
+    # JSON-RPC
+
+    async def handle_rpc(self, request: web.Request) -> web.Response:
+        self.http_requests += 1
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': 'Parse error'}})
+
+        calls = payload if isinstance(payload, list) else [payload]
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            self.overload_rate_limits += 1
+            return web.Response(status=429, text='Too Many Requests')
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self._delay(len(calls)))
+        finally:
+            self.in_flight -= 1
+
+        failure = self._injected_failure()
+        if failure is not None:
+            return failure
+
+        if isinstance(payload, list) and len(payload) > self.max_batch:
+            return web.json_response({'jsonrpc': '2.0', 'id': None,
+                                      'error': {'code': -32600, 'message': f'batch too large (max {self.max_batch})'}})
+
+        self.rpc_calls += len(calls)
+        responses = [self._handle_call(call) for call in calls]
+        return web.json_response(responses if isinstance(payload, list) else responses[0])
+
+    def _handle_call(self, call) -> dict:
+        call_id = call.get('id') if isinstance(call, dict) else None
+        if self.call_error_rate and self.random.random() < self.call_error_rate:
+            self.injected_errors += 1
+            return {'jsonrpc': '2.0', 'id': call_id, 'error': {'code': -32000, 'message': 'header not found'}}
+        try:
+            result = self._dispatch(call['method'], call.get('params', []))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return {'jsonrpc': '2.0', 'id': call_id, 'error': {'code': -32602, 'message': f'invalid params: {e}'}}
+        if result is NotImplemented:
+            return {'jsonrpc': '2.0', 'id': call_id, 'error': {'code': -32601, 'message': 'method not found'}}
+        return {'jsonrpc': '2.0', 'id': call_id, 'result': result}
+
+    def _dispatch(self, method: str, params: list):
+        if method == 'eth_chainId':
+            return BSC_CHAIN_ID_HEX
+        if method == 'eth_blockNumber':
+            return hex(self.block_number())
+        if method == 'eth_getBalance':
+            return hex(self.balance_of(params[0]))
+        if method == 'eth_call':
+            return '0x' + self._eth_call(params[0]['to'], bytes.fromhex(params[0]['data'][2:])).hex()
+        if method == 'eth_getBlockByNumber':
+            number = int(params[0], 16) if params[0] not in ('latest', 'pending') else self.block_number()
+            if number > self.block_number():
+                return None
+            return {
+                'number': hex(number),
+                'hash': '0x' + hashlib.sha256(str(number).encode()).hexdigest(),
+                'timestamp': hex(int(self.started_at) + (number - self.genesis_block) * BLOCK_TIME),
+                'transactions': [],
+            }
+        if method == 'eth_getLogs':
+            return []
+        return NotImplemented
+
+    def _eth_call(self, to: str, data: bytes) -> bytes:
+        to = to.lower()
+        selector = data[:4].hex()
+        if to == MULTICALL3_ADDRESS.lower():
+            if selector == AGGREGATE3_SELECTOR:
+                results = []
+                for target, call_data in decode_aggregate3_calls(data[4:]):
+                    try:
+                        results.append((True, self._eth_call(target, call_data)))
+                    except ValueError:
+                        results.append((False, b''))
+                return bytes.fromhex(encode_aggregate3_results(results)[2:])
+            if selector == GET_ETH_BALANCE_SELECTOR:
+                return _word(self.balance_of('0x' + data[16:36].hex()))
+        elif to in self.tokens:
+            if selector == BALANCE_OF_SELECTOR:
+                return _word(self.token_balance_of(to, '0x' + data[16:36].hex()))
+            if selector == DECIMALS_SELECTOR:
+                return _word(self.token_decimals.get(to, 18))
+            if selector == SYMBOL_SELECTOR:
+                return _encode_string(self.tokens[to])
+        raise ValueError('execution reverted')
+
+    # BscScan API
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        self.http_requests += 1
+        self.api_requests += 1
+        await asyncio.sleep(self._delay(1))
+        failure = self._injected_failure()
+        if failure is not None:
+            return failure
+
+        params = request.query
+        action = params.get('action')
+        address = params.get('address', '')
+        if params.get('module') != 'account' or len(address) != 42:
+            return web.json_response({'status': '0', 'message': 'NOTOK', 'result': 'Error! Invalid parameters'})
+        if action == 'balance':
+            result = self.balance_of(address)
+        elif action == 'tokenbalance':
+            result = self.token_balance_of(params.get('contractaddress', ''), address)
+        else:
+            return web.json_response({'status': '0', 'message': 'NOTOK', 'result': 'Error! Missing Or invalid Action name'})
+        return web.json_response({'status': '1', 'message': 'OK', 'result': str(result)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock BSC JSON-RPC / BscScan API server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8545)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--distribution', choices=('uniform', 'lognormal'), default='uniform')
+    parser.add_argument('--per-call-latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--call-error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--max-batch', type=int, default=1000)
+    parser.add_argument('--max-concurrency', type=int, default=0)
+    args = parser.parse_args()
+
+    async def run():
+        server = MockBSCServer(args.host, args.port, args.latency, args.jitter, args.distribution,
+                               args.per_call_latency, args.error_rate, args.call_error_rate,
+                               args.rate_limit_rate, args.max_batch, max_concurrency=args.max_concurrency)
+        await server.start()
+        print(f"🧪 Mock BSC RPC on {server.rpc_url}, BscScan API on {server.api_url}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,42 @@
 import asyncio
 import time
-from bsc_api import BSCBalanceChecker
-from user_manager import UserManager
 from telegram_bot import GasAlertBot
-from config import LOW_BALANCE_THRESHOLD, CHECK_INTERVAL, API_QUERY_INTERVAL
+from block_follower import BlockFollower
+from config import (
+    LOW_BALANCE_THRESHOLD, CHECK_INTERVAL, API_QUERY_INTERVAL, MONITOR_MODE, BLOCK_POLL_INTERVAL,
+    TOKEN_TRACKING, TOKEN_SYNC_INTERVAL, ADAPTIVE_RETRY_INTERVAL, ADAPTIVE_MAX_BATCH,
+    ADAPTIVE_MIN_INTERVAL, MONITOR_SHARDING, MONITOR_LEASE_RENEW_INTERVAL,
+)
+from scheduler import AdaptiveScheduler
+from shard_coordinator import ShardCoordinator
+from metrics import SWEEP_SECONDS, SWEEP_ROUNDS, SWEEP_ADDRESSES
+from units import format_units, format_amount
 
 class BalanceMonitor:
     def __init__(self, bot: GasAlertBot):
-        self.balance_checker = BSCBalanceChecker()
-        self.user_manager = UserManager()
+        # 与机器人共用余额查询器（共享HTTP会话、节点池和余额缓存）
+        self.balance_checker = bot.balance_checker
+        # 与机器人共用同一个用户管理器：增删地址和阈值修改立即反映在地址索引中
+        self.user_manager = bot.user_manager
         self.bot = bot
         self.is_running = False
+        self.block_follower = BlockFollower(self.balance_checker)
+        self.scheduler = AdaptiveScheduler()
+        self.balance_history = bot.balance_history
+        # 分片监控：只检查本worker持有租约的分区内的地址
+        self.shards = None
+        if MONITOR_SHARDING:
+            if self.user_manager.store is None:
+                raise ValueError("MONITOR_SHARDING requires USER_STORAGE_BACKEND=sqlite")
+            self.shards = ShardCoordinator()
+
+    def watched_addresses(self, addresses=None):
+        """本worker负责检查的监控地址（未启用分片时为全部地址）"""
+        if addresses is None:
+            addresses = self.user_manager.address_index.keys()
+        if self.shards is None:
+            return list(addresses)
+        return self.shards.filter_owned(addresses)
     
     async def query_single_address(self, address: str):
         """查询单个地址的余额（单次尝试）"""
@@ -18,51 +44,68 @@ class BalanceMonitor:
             balance = await self.balance_checker.get_bnb_balance(address)
             return {'address': address, 'balance': balance, 'success': True, 'error': None}
         except Exception as e:
-            return {'address': address, 'balance': 0.0, 'success': False, 'error': str(e)}
+            return {'address': address, 'balance': 0, 'success': False, 'error': str(e)}
 
-    async def query_batch_with_delay(self, addresses, delay_between_requests=0.3):
-        """批量查询地址，请求之间有延迟以避免触发API限制"""
+    async def query_batch_via_rpc(self, addresses):
+        """通过JSON-RPC批量请求查询多个地址（一次往返查询数百个地址）"""
+        balances, errors = await self.balance_checker.get_bnb_balances(addresses)
         results = []
-        for i, address in enumerate(addresses):
-            result = await self.query_single_address(address)
-            results.append(result)
-            # 每个请求后都添加延迟，包括最后一个（0.3秒 = 每秒3.3次，安全余量）
-            await asyncio.sleep(delay_between_requests)
+        for address in addresses:
+            if address in balances:
+                results.append({'address': address, 'balance': balances[address], 'success': True, 'error': None})
+            else:
+                results.append({'address': address, 'balance': 0, 'success': False, 'error': errors.get(address, 'Unknown error')})
         return results
 
+    async def query_batch(self, addresses):
+        """并发查询多个地址，速率由共享限速器按端点控制"""
+        return await self.balance_checker.rate_limiter.map(self.query_single_address, addresses)
+
     async def check_all_balances(self):
         """检查所有监控地址的余额 - 使用限速并发查询和重试机制"""
         print(f"⏰ Starting balance check at {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-        # 重新加载用户数据以获取最新的地址列表
-        self.user_manager.users_data = self.user_manager.load_data()
-
-        address_to_users = self.user_manager.get_user_addresses_mapping()
-        current_time = time.time()
+        all_addresses = self.watched_addresses()
 
-        if not address_to_users:
+        if not all_addresses:
             print("ℹ️ No addresses to check")
             return
 
+        await self.check_addresses(all_addresses)
+        limits = [f"{entry['url']}={entry['limit']}" for entry in self.balance_checker.endpoint_status() if 'limit' in entry]
+        if limits:
+            print(f"🔧 RPC concurrency limits: {', '.join(limits)}")
+
+        # 本轮检查产生的警告按用户合并后立即发送
+        self.bot.alert_dispatcher.flush_digests()
+
+    async def check_addresses(self, all_addresses, max_retry_rounds=10):
+        """查询指定地址的余额并为低于阈值的订阅用户发送警告，返回查询成功的{地址: 余额wei}"""
+        current_time = time.time()
+        started = time.monotonic()
+
         # 批次重试逻辑：持续重试直到所有地址都成功
-        all_addresses = list(address_to_users.keys())
-        successful_results = {}  # 存储成功的结果 {address: balance}
+        successful_results = {}  # 存储成功的结果 {address: 余额wei}
         addresses_to_query = all_addresses.copy()
-        retry_round = 0
-        max_retry_rounds = 10  # 最多重试10轮，避免无限循环
+        retry_round = 0  # 最多重试max_retry_rounds轮，避免无限循环
 
         print(f"🔄 Starting rate-limited query for {len(all_addresses)} addresses...")
 
         while addresses_to_query and retry_round < max_retry_rounds:
             retry_round += 1
+            SWEEP_ROUNDS.inc('first' if retry_round == 1 else 'retry')
 
             if retry_round > 1:
                 wait_time = min(retry_round * 2, 10)  # 等待2秒、4秒、6秒...最多10秒
                 print(f"⏳ Retry round {retry_round}, waiting {wait_time}s before querying {len(addresses_to_query)} failed addresses...")
                 await asyncio.sleep(wait_time)
 
-            # 限速查询：请求之间有0.3秒延迟（每秒3.3次）
-            results = await self.query_batch_with_delay(addresses_to_query, delay_between_requests=0.3)
+            if retry_round == 1:
+                # 首轮使用JSON-RPC批量请求，批内失败的条目会单独重试
+                results = await self.query_batch_via_rpc(addresses_to_query)
+            else:
+                # 批量请求仍失败的地址逐个并发查询（带Etherscan备用），由限速器控制速率
+                results = await self.query_batch(addresses_to_query)
 
             # 分离成功和失败的结果
             failed_addresses = []
@@ -70,7 +113,7 @@ class BalanceMonitor:
                 if result['success']:
                     successful_results[result['address']] = result['balance']
                     if retry_round > 1:
-                        print(f"✅ Retry succeeded: {result['address'][:10]}...{result['address'][-8:]} = {result['balance']:.6f} BNB")
+                        print(f"✅ Retry succeeded: {result['address'][:10]}...{result['address'][-8:]} = {format_units(result['balance'])} BNB")
                 else:
                     failed_addresses.append(result['address'])
                     print(f"⚠️ Query failed for {result['address'][:10]}...{result['address'][-8:]}: {result['error']}")
@@ -81,6 +124,9 @@ class BalanceMonitor:
         total_count = len(all_addresses)
         success_count = len(successful_results)
         failed_count = len(addresses_to_query)
+        SWEEP_SECONDS.observe(time.monotonic() - started)
+        SWEEP_ADDRESSES.inc('success', amount=success_count)
+        SWEEP_ADDRESSES.inc('failed', amount=failed_count)
 
         if failed_count > 0:
             print(f"⚠️ Warning: {failed_count} addresses still failed after {retry_round} rounds")
@@ -89,32 +135,45 @@ class BalanceMonitor:
 
         print(f"📊 Query completed: {success_count}/{total_count} successful")
 
-        # 只处理成功查询的地址
+        # 记录余额历史（供 /forecast 使用）；分片监控时只写入仍由本worker持有的分区，
+        # 检查期间已交给其他worker的分区由新的持有者写入，保证每个历史文件只有一个写入者
+        for address in self.watched_addresses(successful_results):
+            self.balance_history.append(address, current_time, successful_results[address])
+        self.balance_history.flush()
+
+        # 所有订阅的阈值判断一次完成（查询期间被移除的订阅不在订阅对数组中，自动跳过）
+        threshold_pairs = self.user_manager.get_threshold_pairs()
+        triggered = threshold_pairs.evaluate(successful_results)
+
+        for user_id, address, balance, threshold in triggered:
+            print(f"🔴 Low balance detected for user {user_id}: {address[:10]}...{address[-8:]} = {format_units(balance)} BNB (threshold: {format_amount(threshold)})")
+
+        # 本轮所有警告在一个事务中申请：冷却期内已发送过的（包括其他监控进程刚发送的）不再重复发送
+        claimed = self.user_manager.claim_alerts([(user_id, address) for user_id, address, _, _ in triggered], current_time)
+
         alerts_sent = 0
-        for address, balance in successful_results.items():
-            user_ids = address_to_users[address]
-
-            # 为每个用户检查其自定义阈值
-            for user_id in user_ids:
-                threshold = self.user_manager.get_threshold(user_id)
-
-                if balance < threshold:
-                    print(f"🔴 Low balance detected for user {user_id}: {address[:10]}...{address[-8:]} = {balance:.6f} BNB (threshold: {threshold})")
-
-                    if self.user_manager.should_send_alert(user_id, address, current_time):
-                        await self.bot.send_low_balance_alert(user_id, address, balance)
-                        self.user_manager.record_alert(user_id, address, current_time)
-                        alerts_sent += 1
-                        print(f"📤 Alert sent to user {user_id} for address {address[:10]}...")
-                    else:
-                        print(f"⏭️ Skipping alert for user {user_id} (recently sent)")
-                else:
-                    print(f"✅ Balance OK for user {user_id}: {address[:10]}...{address[-8:]} = {balance:.6f} BNB (threshold: {threshold})")
+        for user_id, address, balance, threshold in triggered:
+            if (user_id, address) not in claimed:
+                print(f"⏭️ Skipping alert for user {user_id} (recently sent)")
+                continue
+            # 只入队，由后台发送队列按Telegram限速发送；没有送达时由发送队列撤销申请
+            if self.bot.enqueue_low_balance_alert(user_id, address, balance, current_time):
+                alerts_sent += 1
+                print(f"📤 Alert queued for user {user_id} for address {address[:10]}...")
 
-        print(f"✅ Balance check completed: {success_count} successful, {failed_count} failed, {alerts_sent} alerts sent")
+        print(f"✅ Balance check completed: {success_count} successful, {failed_count} failed, "
+              f"{len(triggered)} low-balance subscriptions, {alerts_sent} alerts queued")
+        return successful_results
     
     async def monitor_loop(self):
         """监控循环"""
+        if MONITOR_MODE == 'blocks':
+            await self.block_monitor_loop()
+            return
+        if MONITOR_MODE == 'adaptive':
+            await self.adaptive_monitor_loop()
+            return
+
         while self.is_running:
             try:
                 await self.check_all_balances()
@@ -124,21 +183,112 @@ class BalanceMonitor:
             # 等待下次检查
             await asyncio.sleep(CHECK_INTERVAL * 60)  # 转换为秒
     
-    def start_monitoring(self):
-        """开始监控"""
+    async def block_monitor_loop(self):
+        """区块跟随模式：只重新查询新区块中被触及的地址，并定期全量检查兜底"""
+        next_full_sweep = 0.0
+        while self.is_running:
+            if time.time() >= next_full_sweep or self.block_follower.fell_behind:
+                self.block_follower.fell_behind = False
+                try:
+                    await self.check_all_balances()
+                except Exception as e:
+                    print(f"❌ Error in full sweep: {str(e)}")
+                next_full_sweep = time.time() + CHECK_INTERVAL * 60
+
+            try:
+                touched = self.watched_addresses(await self.block_follower.poll(self.user_manager.address_index))
+                if touched:
+                    print(f"🧱 Block {self.block_follower.last_block}: {len(touched)} watched addresses touched")
+                    await self.check_addresses(list(touched), max_retry_rounds=3)
+            except Exception as e:
+                print(f"❌ Error in block follower: {str(e)}")
+
+            await asyncio.sleep(BLOCK_POLL_INTERVAL)
+
+    async def adaptive_monitor_loop(self):
+        """自适应模式：只检查到期的地址，并根据余量和消耗速度安排各自的下次检查"""
+        while self.is_running:
+            try:
+                self.scheduler.sync(self.watched_addresses())
+                due = self.scheduler.pop_due(limit=ADAPTIVE_MAX_BATCH)
+                if due:
+                    balances = await self.check_addresses(due, max_retry_rounds=3)
+                    now = time.time()
+                    for address in due:
+                        subscribers = self.user_manager.get_address_subscribers(address)
+                        if not subscribers:
+                            continue
+                        if address in balances:
+                            # 按余额最先会跌破的阈值（低于当前余额的最高阈值）安排检查；已低于所有阈值时按最高阈值
+                            balance = balances[address]
+                            below = [threshold for threshold in subscribers.values() if threshold < balance]
+                            threshold = max(below) if below else max(subscribers.values())
+                            self.scheduler.reschedule(address, balance, threshold, now)
+                        else:
+                            self.scheduler.schedule(address, now + ADAPTIVE_RETRY_INTERVAL)
+            except Exception as e:
+                print(f"❌ Error in adaptive monitor loop: {str(e)}")
+
+            # 睡到下一个地址到期（至少1秒，最多一个最短检查间隔，以便及时发现新增地址）
+            next_due = self.scheduler.next_due()
+            delay = ADAPTIVE_MIN_INTERVAL if next_due is None else next_due - time.time()
+            await asyncio.sleep(max(1.0, min(delay, ADAPTIVE_MIN_INTERVAL)))
+
+    async def lease_loop(self):
+        """分片监控：定期续约并重新加载其他进程修改的用户数据
+
+        续约（等待写锁）和读取修改都在线程中执行，不阻塞事件循环；只有合并修改在事件循环中完成
+        """
+        while self.is_running:
+            try:
+                await asyncio.to_thread(self.shards.heartbeat)
+                changes = await asyncio.to_thread(self.user_manager.fetch_changes)
+                self.user_manager.apply_changes(changes)
+            except Exception as e:
+                print(f"❌ Error renewing monitor leases: {str(e)}")
+            await asyncio.sleep(MONITOR_LEASE_RENEW_INTERVAL)
+
+    async def token_tracker_loop(self):
+        """按Transfer日志增量同步USDT/USDC余额"""
+        token_tracker = self.bot.token_tracker
+        while self.is_running:
+            try:
+                await token_tracker.sync(list(self.user_manager.address_index.keys()))
+            except Exception as e:
+                print(f"❌ Error in token tracker: {str(e)}")
+            await asyncio.sleep(TOKEN_SYNC_INTERVAL)
+
+    def start_monitoring(self, token_tracking: bool = TOKEN_TRACKING):
+        """开始监控（token_tracking：是否同步USDT/USDC余额，只在响应命令的机器人进程中需要）"""
         if self.is_running:
             print("⚠️ Monitor is already running")
             return
         
         self.is_running = True
-        print(f"🚀 Starting balance monitor (check interval: {CHECK_INTERVAL} minutes)")
+        print(f"🚀 Starting balance monitor (mode: {MONITOR_MODE}, check interval: {CHECK_INTERVAL} minutes)")
         
+        # 分片监控时先取得租约再开始检查
+        if self.shards is not None:
+            try:
+                self.shards.heartbeat()
+            except Exception as e:
+                print(f"❌ Error acquiring monitor leases: {str(e)}")
+            asyncio.create_task(self.lease_loop())
+
         # 在后台任务中运行监控循环
         asyncio.create_task(self.monitor_loop())
+        if token_tracking:
+            asyncio.create_task(self.token_tracker_loop())
     
     def stop_monitoring(self):
         """停止监控"""
         self.is_running = False
+        if self.shards is not None:
+            # 立即释放租约，其他worker无需等待租约过期即可接管
+            try:
+                self.shards.leave()
+            except Exception as e:
+                print(f"Warning: Error releasing monitor leases: {e}")
         print("🛑 Balance monitor stopped")
     
     async def manual_check(self):
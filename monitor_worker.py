@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+独立的余额监控worker（分片监控）
+不接收Telegram消息，只检查本worker持有租约的地址分区并发送低余额警告；
+与 main.py 共用同一个SQLite数据库（USER_DB_FILE），可以在同一容器内启动多个进程或作为独立副本部署
+
+用法: MONITOR_SHARDING=true python monitor_worker.py
+"""
+
+import asyncio
+import signal
+import sys
+from telegram_bot import GasAlertBot
+from monitor import BalanceMonitor
+from metrics import start_metrics_server
+from main import check_config
+from config import MONITOR_SHARDING, MONITOR_WORKER_ID, METRICS_ENABLED
+
+
+async def main():
+    if not check_config():
+        sys.exit(1)
+    if not MONITOR_SHARDING:
+        print("❌ 错误: 独立监控worker需要设置 MONITOR_SHARDING=true（否则每个进程都会检查全部地址）")
+        sys.exit(1)
+
+    print(f"🚀 Monitor worker {MONITOR_WORKER_ID} starting...")
+    bot = GasAlertBot()
+    monitor = BalanceMonitor(bot)
+    metrics_runner = None
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop_event.set)
+
+    try:
+        # 只初始化Bot用于发送警告，不启动轮询或Webhook
+        await bot.application.initialize()
+        bot.alert_dispatcher.start()
+        monitor.start_monitoring(token_tracking=False)
+        if METRICS_ENABLED:
+            metrics_runner = await start_metrics_server()
+        await stop_event.wait()
+        print("\n🛑 Received stop signal")
+    finally:
+        monitor.stop_monitoring()
+        await bot.alert_dispatcher.stop()
+        bot.balance_history.close()
+        await bot.balance_checker.close_session()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        try:
+            await bot.application.shutdown()
+        except Exception as e:
+            print(f"Warning: Error stopping bot: {e}")
+        print("✅ Monitor worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+Multicall3 ABI编解码
+将多个合约只读调用打包进一次 eth_call（aggregate3），并解析返回结果
+"""
+
+from typing import List, Tuple
+
+# Multicall3在BSC（及大多数EVM链）上的部署地址
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+
+# 函数选择器
+AGGREGATE3_SELECTOR = '82ad56cb'       # aggregate3((address,bool,bytes)[])
+GET_ETH_BALANCE_SELECTOR = '4d2301cc'  # getEthBalance(address)
+BALANCE_OF_SELECTOR = '70a08231'       # balanceOf(address)
+DECIMALS_SELECTOR = '313ce567'         # decimals()
+SYMBOL_SELECTOR = '95d89b41'           # symbol()
+
+
+def _word(value: int) -> str:
+    """编码为32字节的十六进制字"""
+    return f"{value:064x}"
+
+
+def encode_address(address: str) -> str:
+    """地址参数（去掉0x，左侧补零到32字节）"""
+    return address[2:].lower().zfill(64)
+
+
+def encode_get_eth_balance(address: str) -> Tuple[str, str]:
+    """Multicall3.getEthBalance(address) 子调用"""
+    return MULTICALL3_ADDRESS, GET_ETH_BALANCE_SELECTOR + encode_address(address)
+
+
+def encode_balance_of(contract_address: str, address: str) -> Tuple[str, str]:
+    """ERC20.balanceOf(address) 子调用"""
+    return contract_address, BALANCE_OF_SELECTOR + encode_address(address)
+
+
+def encode_decimals(contract_address: str) -> Tuple[str, str]:
+    """ERC20.decimals() 子调用"""
+    return contract_address, DECIMALS_SELECTOR
+
+
+def encode_symbol(contract_address: str) -> Tuple[str, str]:
+    """ERC20.symbol() 子调用"""
+    return contract_address, SYMBOL_SELECTOR
+
+
+def encode_aggregate3(calls: List[Tuple[str, str]]) -> str:
+    """编码aggregate3调用数据
+
+    calls: [(目标合约地址, 不带0x的calldata十六进制), ...]，每个子调用都允许失败
+    """
+    encoded_calls = []
+    for target, call_data in calls:
+        padded = call_data.ljust((len(call_data) + 63) // 64 * 64, '0')
+        encoded_calls.append(
+            encode_address(target)     # target
+            + _word(1)                 # allowFailure = true
+            + _word(0x60)              # callData在元组内的偏移
+            + _word(len(call_data) // 2)
+            + padded
+        )
+
+    # 动态元组数组：长度 + 每个元素相对于偏移区起点的偏移 + 元素内容
+    offsets = []
+    position = 32 * len(calls)
+    for encoded in encoded_calls:
+        offsets.append(_word(position))
+        position += len(encoded) // 2
+
+    return '0x' + AGGREGATE3_SELECTOR + _word(0x20) + _word(len(calls)) + ''.join(offsets) + ''.join(encoded_calls)
+
+
+def decode_aggregate3(result_hex: str) -> List[Tuple[bool, bytes]]:
+    """解析aggregate3返回的 (bool success, bytes returnData)[]"""
+    data = bytes.fromhex(result_hex[2:] if result_hex.startswith('0x') else result_hex)
+
+    def word(offset: int) -> int:
+        if offset + 32 > len(data):
+            raise ValueError("Multicall result truncated")
+        return int.from_bytes(data[offset:offset + 32], 'big')
+
+    array_start = word(0)
+    count = word(array_start)
+    base = array_start + 32
+
+    results = []
+    for i in range(count):
+        tuple_start = base + word(base + 32 * i)
+        success = word(tuple_start) != 0
+        bytes_start = tuple_start + word(tuple_start + 32)
+        length = word(bytes_start)
+        results.append((success, data[bytes_start + 32:bytes_start + 32 + length]))
+    return results
+
+
+def decode_uint256(return_data: bytes) -> int:
+    """解析单个uint256返回值"""
+    if len(return_data) < 32:
+        raise ValueError("Invalid uint256 return data")
+    return int.from_bytes(return_data[:32], 'big')
+
+
+def decode_string(return_data: bytes) -> str:
+    """解析string返回值；兼容早期代币以bytes32返回symbol的写法"""
+    if len(return_data) == 32:
+        return return_data.rstrip(b'\x00').decode('utf-8', errors='replace')
+    if len(return_data) < 64:
+        raise ValueError("Invalid string return data")
+    offset = int.from_bytes(return_data[:32], 'big')
+    if offset + 32 > len(return_data):
+        raise ValueError("Invalid string return data")
+    length = int.from_bytes(return_data[offset:offset + 32], 'big')
+    if offset + 32 + length > len(return_data):
+        raise ValueError("String return data truncated")
+    return return_data[offset + 32:offset + 32 + length].decode('utf-8', errors='replace')
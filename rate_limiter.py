@@ -0,0 +1,264 @@
+"""
+异步限速器
+RPC节点按AIMD自适应并发上限（或固定速率的令牌桶）控制，全局信号量限制同时在途的请求数，
+机器人命令和监控循环共用同一个实例。
+备用通道（BscScan API）使用独立的有界通道：排队超过上限时立即拒绝，而不是无限等待
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from config import (
+    RPC_RATE_LIMIT, RPC_RATE_BURST, RPC_MAX_CONCURRENCY,
+    RPC_AIMD_INITIAL, RPC_AIMD_MIN, RPC_AIMD_MAX, RPC_AIMD_INCREASE, RPC_AIMD_DECREASE,
+)
+from circuit_breaker import DegradedError
+from metrics import RPC_CONCURRENCY_LIMIT, RPC_CONCURRENCY_DECREASES
+
+
+class TokenBucket:
+    """令牌桶：平均速率rate（次/秒），允许capacity次突发"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """非阻塞获取令牌，成功返回True"""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def pause(self, seconds: float):
+        """seconds秒内不再发放令牌（服务端要求等待时使用；已有更长的暂停时不缩短）"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    async def acquire(self, tokens: float = 1.0):
+        """获取令牌，不足时等待补充（排队者按先后顺序获得令牌）"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrencyLimit:
+    """AIMD并发上限
+
+    每个成功的请求使上限增加 increase/上限（即每完成一轮满并发的请求约增加increase），
+    拥塞信号（429、限流错误、超时）使上限乘以decrease；
+    在上次下降之前发出的请求带回的拥塞信号属于同一次拥塞，不再重复下降
+    """
+
+    def __init__(self, key: str, initial: float = RPC_AIMD_INITIAL, minimum: float = RPC_AIMD_MIN,
+                 maximum: float = RPC_AIMD_MAX, increase: float = RPC_AIMD_INCREASE, decrease: float = RPC_AIMD_DECREASE):
+        self.key = key
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self.last_decrease_at = 0.0
+        self.decreases = 0
+        self._waiters = deque()
+        RPC_CONCURRENCY_LIMIT.set(self.current, key)
+
+    @property
+    def current(self) -> int:
+        """当前允许的并发数"""
+        return max(int(self.minimum), int(self.limit))
+
+    def _wake(self):
+        free = self.current - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def acquire(self):
+        while self.in_flight >= self.current:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 已被唤醒但随即取消，把名额让给下一个等待者
+                    self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        previous = self.current
+        self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+        if self.current != previous:
+            RPC_CONCURRENCY_LIMIT.set(self.current, self.key)
+            self._wake()
+
+    def on_congestion(self, started_at: float, signal: str):
+        """started_at: 收到拥塞信号的请求发出时的time.monotonic()"""
+        if started_at < self.last_decrease_at:
+            return
+        previous = self.current
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        self.last_decrease_at = time.monotonic()
+        self.decreases += 1
+        RPC_CONCURRENCY_LIMIT.set(self.current, self.key)
+        RPC_CONCURRENCY_DECREASES.inc(self.key, signal)
+        if self.current != previous:
+            print(f"📉 RPC concurrency for {self.key} reduced to {self.current} ({signal})")
+
+    def snapshot(self) -> dict:
+        return {'limit': self.current, 'in_flight': self.in_flight, 'decreases': self.decreases}
+
+
+class BoundedLane:
+    """有界限速通道：按令牌桶速率放行并限制并发；排队的请求已够max_wait秒处理时，新请求立即抛出DegradedError"""
+
+    def __init__(self, name: str, rate: float, burst: float, max_wait: float, max_concurrency: int):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_waiting = max(1, int(rate * max_wait))
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.rejected = 0
+
+    def saturated(self) -> bool:
+        return self.waiting >= self.max_waiting
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.saturated():
+            self.rejected += 1
+            raise DegradedError(f"{self.name} fallback is saturated ({self.waiting} requests queued)")
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                self.semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self.semaphore.release()
+
+
+class RateLimiter:
+    """按端点限速并限制全局并发数"""
+
+    def __init__(self, rate: float = RPC_RATE_LIMIT, burst: float = RPC_RATE_BURST,
+                 max_concurrency: int = RPC_MAX_CONCURRENCY):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.adaptive: Dict[str, AdaptiveConcurrencyLimit] = {}
+        self.lanes: Dict[str, BoundedLane] = {}
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    def get_bucket(self, key: str, rate: Optional[float] = None, burst: Optional[float] = None) -> TokenBucket:
+        """获取（或创建）某个端点的令牌桶"""
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(rate or self.rate, burst or self.burst)
+        return self.buckets[key]
+
+    def get_adaptive(self, key: str) -> AdaptiveConcurrencyLimit:
+        """为端点启用（或获取）AIMD并发上限，启用后该端点不再使用令牌桶"""
+        if key not in self.adaptive:
+            self.adaptive[key] = AdaptiveConcurrencyLimit(key)
+        return self.adaptive[key]
+
+    def record_success(self, key: str):
+        adaptive = self.adaptive.get(key)
+        if adaptive is not None:
+            adaptive.on_success()
+
+    def record_congestion(self, key: str, started_at: float, signal: str):
+        adaptive = self.adaptive.get(key)
+        if adaptive is not None:
+            adaptive.on_congestion(started_at, signal)
+
+    def get_lane(self, key: str, rate: float, burst: float, max_wait: float, max_concurrency: int) -> BoundedLane:
+        """获取（或创建）独立于全局并发限制的有界通道"""
+        if key not in self.lanes:
+            self.lanes[key] = BoundedLane(key, rate, burst, max_wait, max_concurrency)
+        return self.lanes[key]
+
+    @asynccontextmanager
+    async def limit(self, key: str):
+        """占用一个并发名额并消耗该端点的一个令牌（启用AIMD的端点占用其并发名额），请求完成后释放名额"""
+        adaptive = self.adaptive.get(key)
+        if adaptive is not None:
+            # 先占用端点自己的名额，拥塞节点的排队请求不会占住全局名额
+            async with adaptive.slot():
+                async with self.semaphore:
+                    yield
+            return
+        # 先等令牌再占用全局名额：等待某个端点令牌的请求不会占住其他端点可用的全局名额
+        await self.get_bucket(key).acquire()
+        async with self.semaphore:
+            yield
+
+    async def map(self, func, items, concurrency: Optional[int] = None):
+        """并发执行func(item)，保持结果顺序；实际速率由各端点的令牌桶控制"""
+        items = list(items)
+        results = [None] * len(items)
+        queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            queue.put_nowait((index, item))
+
+        async def worker():
+            while True:
+                try:
+                    index, item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results[index] = await func(item)
+
+        worker_count = min(concurrency or self.max_concurrency, len(items))
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+        return results
+
+
+_shared_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程内共享的限速器"""
+    global _shared_limiter
+    if _shared_limiter is None:
+        _shared_limiter = RateLimiter()
+    return _shared_limiter
@@ -0,0 +1,190 @@
+"""
+RPC节点池
+按节点记录EWMA延迟、错误率和最近的429限流，把请求路由到最健康的节点；
+每个节点一个熔断器：连续失败或错误率过高时打开（剔除），冷却结束后放行一个探测请求，成功即恢复。
+同时为每个节点保留最近的延迟样本，用于计算对冲请求的等待时间
+"""
+
+import random
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED
+from metrics import CIRCUIT_TRANSITIONS
+from config import (
+    RPC_POOL_EWMA_ALPHA, RPC_POOL_EJECT_FAILURES, RPC_POOL_EJECT_ERROR_RATE,
+    RPC_POOL_EJECT_SECONDS, RPC_POOL_MAX_EJECT_SECONDS, RPC_POOL_RATE_LIMIT_PENALTY,
+    RPC_POOL_EXPLORE_RATE, RPC_HEDGE_PERCENTILE, RPC_HEDGE_WINDOW, RPC_HEDGE_MIN_SAMPLES,
+    RPC_HEDGE_MIN_DELAY, RPC_HEDGE_MAX_DELAY, RPC_HEDGE_BUDGET_RATIO, RPC_HEDGE_BUDGET_BURST,
+)
+
+
+class RPCEndpoint:
+    """单个RPC节点的健康状态"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.ewma_latency: Optional[float] = None  # 秒
+        self.error_rate = 0.0                      # EWMA错误率 0~1
+        self.last_rate_limited_at = 0.0
+        self.breaker = CircuitBreaker(url, RPC_POOL_EJECT_FAILURES, RPC_POOL_EJECT_SECONDS, RPC_POOL_MAX_EJECT_SECONDS)
+        self.total_requests = 0
+        self.total_failures = 0
+        self.latencies = deque(maxlen=RPC_HEDGE_WINDOW)  # 最近的延迟样本（秒）
+
+    def percentile(self, q: float) -> Optional[float]:
+        """最近延迟样本的分位数，样本不足时返回None"""
+        if len(self.latencies) < RPC_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def observe_latency(self, latency: float):
+        self.latencies.append(latency)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += RPC_POOL_EWMA_ALPHA * (latency - self.ewma_latency)
+
+    def is_available(self, now: float) -> bool:
+        """熔断器关闭；或处于half_open且还没有探测请求在途"""
+        return self.breaker.allow_request(now)
+
+    def score(self, now: float) -> float:
+        """得分越低越好：延迟按错误率放大，最近被限流的节点额外加罚"""
+        latency = self.ewma_latency if self.ewma_latency is not None else 0.0
+        score = latency * (1 + 4 * self.error_rate)
+        if now - self.last_rate_limited_at < RPC_POOL_RATE_LIMIT_PENALTY:
+            score += 1.0
+        return score
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            'url': self.url,
+            'ewma_latency': self.ewma_latency,
+            'p95_latency': self.percentile(0.95),
+            'error_rate': round(self.error_rate, 4),
+            'circuit': self.breaker.state(now),
+            'consecutive_failures': self.breaker.consecutive_failures,
+            'total_requests': self.total_requests,
+            'total_failures': self.total_failures,
+        }
+
+
+class HedgeBudget:
+    """对冲请求预算：每个普通请求积累ratio次额度，每次对冲消耗1次，使对冲流量不超过普通请求的ratio倍"""
+
+    def __init__(self, ratio: float = RPC_HEDGE_BUDGET_RATIO, burst: float = RPC_HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.credits = 0.0
+        self.requests = 0
+        self.hedges = 0
+
+    def record_request(self):
+        self.requests += 1
+        self.credits = min(self.burst, self.credits + self.ratio)
+
+    def try_acquire(self) -> bool:
+        if self.credits < 1:
+            return False
+        self.credits -= 1
+        self.hedges += 1
+        return True
+
+
+class RPCEndpointPool:
+    """按健康评分选择RPC节点"""
+
+    def __init__(self, urls: Iterable[str]):
+        self.endpoints: Dict[str, RPCEndpoint] = {url: RPCEndpoint(url) for url in urls}
+        if not self.endpoints:
+            raise ValueError("RPC endpoint pool requires at least one URL")
+        self.hedge_budget = HedgeBudget()
+
+    @property
+    def urls(self) -> List[str]:
+        return list(self.endpoints.keys())
+
+    def available(self) -> bool:
+        """是否还有熔断器允许请求的节点"""
+        now = time.monotonic()
+        return any(ep.is_available(now) for ep in self.endpoints.values())
+
+    def select(self, exclude: Iterable[str] = ()) -> str:
+        """选择当前最优的节点URL；所有节点的熔断器都打开时抛出CircuitOpenError，不再向故障节点发送请求"""
+        now = time.monotonic()
+        exclude = set(exclude)
+        candidates = [ep for ep in self.endpoints.values() if ep.url not in exclude and ep.is_available(now)]
+
+        if not candidates:
+            retry_in = min(ep.breaker.open_until for ep in self.endpoints.values()) - now
+            raise CircuitOpenError(f"All RPC endpoints are unavailable (circuit open, retry in {max(retry_in, 0):.0f}s)")
+
+        # 少量随机探索，让延迟统计保持更新
+        if len(candidates) > 1 and random.random() < RPC_POOL_EXPLORE_RATE:
+            endpoint = random.choice(candidates)
+        else:
+            endpoint = min(candidates, key=lambda ep: ep.score(now))
+
+        endpoint.breaker.on_request(now)
+        return endpoint.url
+
+    def record_success(self, url: str, latency: float):
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            return
+        endpoint.total_requests += 1
+        endpoint.observe_latency(latency)
+        endpoint.error_rate *= (1 - RPC_POOL_EWMA_ALPHA)
+        if endpoint.breaker.record_success():
+            # 探测成功，节点恢复
+            print(f"✅ RPC endpoint recovered: {url}")
+            CIRCUIT_TRANSITIONS.inc(url, CLOSED)
+            endpoint.error_rate = 0.0
+
+    def record_cancelled(self, url: str, elapsed: Optional[float] = None):
+        """请求被取消（对冲中落败），不算成功或失败
+
+        elapsed: 已等待的时间；主请求被对冲请求超过时它是真实延迟的下限，计入延迟统计
+        """
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            return
+        if elapsed is not None:
+            endpoint.observe_latency(elapsed)
+        # 探测请求没有结果，允许再次探测
+        endpoint.breaker.release_probe()
+
+    def hedge_delay(self, url: str) -> float:
+        """向该节点发出请求后等待多久再发送对冲请求：该节点最近延迟的分位数，限制在上下限之间"""
+        endpoint = self.endpoints.get(url)
+        delay = endpoint.percentile(RPC_HEDGE_PERCENTILE) if endpoint is not None else None
+        if delay is None:
+            return RPC_HEDGE_MAX_DELAY
+        return min(RPC_HEDGE_MAX_DELAY, max(RPC_HEDGE_MIN_DELAY, delay))
+
+    def record_failure(self, url: str, rate_limited: bool = False):
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            return
+        now = time.monotonic()
+        endpoint.total_requests += 1
+        endpoint.total_failures += 1
+        endpoint.error_rate += RPC_POOL_EWMA_ALPHA * (1 - endpoint.error_rate)
+        if rate_limited:
+            endpoint.last_rate_limited_at = now
+
+        if endpoint.breaker.state(now) != CLOSED and not endpoint.breaker.probing:
+            # 熔断器打开前发出的请求晚到的失败，不再延长冷却时间
+            return
+        # 打开熔断器（剔除节点），冷却时间随连续打开次数指数增长
+        duration = endpoint.breaker.record_failure(force_trip=endpoint.error_rate >= RPC_POOL_EJECT_ERROR_RATE, now=now)
+        if duration is not None:
+            CIRCUIT_TRANSITIONS.inc(url, 'open')
+            print(f"⚠️ RPC endpoint ejected for {duration:.0f}s: {endpoint.url}")
+
+    def snapshot(self) -> List[dict]:
+        """各节点的健康状态（用于日志和观测）"""
+        return [ep.snapshot() for ep in self.endpoints.values()]
@@ -0,0 +1,93 @@
+"""
+自适应检查调度
+按每个地址距最低订阅阈值的余量和观测到的消耗速度计算下次检查时间：
+接近阈值、消耗快的地址频繁检查，余额充足的地址几小时才检查一次
+"""
+
+import heapq
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import (
+    ADAPTIVE_MIN_INTERVAL, ADAPTIVE_MAX_INTERVAL, ADAPTIVE_SAFETY_FACTOR,
+    ADAPTIVE_HEADROOM_FULL, ADAPTIVE_BURN_ALPHA, CHECK_INTERVAL,
+)
+
+
+class AdaptiveScheduler:
+    def __init__(self):
+        self.heap: List[Tuple[float, str]] = []          # (到期时间, 地址)，惰性删除
+        self.due_at: Dict[str, float] = {}                # 地址 -> 当前有效的到期时间
+        self.last_seen: Dict[str, Tuple[int, float]] = {}    # 地址 -> (余额wei, 观测时间)
+        self.burn_rate: Dict[str, float] = {}             # 地址 -> 消耗速度（wei/秒，EWMA）
+
+    def schedule(self, address: str, due_at: float):
+        self.due_at[address] = due_at
+        heapq.heappush(self.heap, (due_at, address))
+
+    def sync(self, addresses: Iterable[str], now: Optional[float] = None):
+        """新增的地址立即到期，不再监控的地址移出调度"""
+        now = time.time() if now is None else now
+        addresses = set(addresses)
+        for address in addresses:
+            if address not in self.due_at:
+                self.schedule(address, now)
+        for address in list(self.due_at):
+            if address not in addresses:
+                del self.due_at[address]
+                self.last_seen.pop(address, None)
+                self.burn_rate.pop(address, None)
+
+    def pop_due(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[str]:
+        """取出所有已到期的地址（最多limit个）"""
+        now = time.time() if now is None else now
+        due = []
+        while self.heap and self.heap[0][0] <= now and (limit is None or len(due) < limit):
+            due_at, address = heapq.heappop(self.heap)
+            # 跳过已移除或已被重新调度的旧条目
+            if self.due_at.get(address) != due_at:
+                continue
+            del self.due_at[address]
+            due.append(address)
+        return due
+
+    def next_due(self) -> Optional[float]:
+        while self.heap and self.due_at.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def observe(self, address: str, balance: int, now: Optional[float] = None):
+        """记录一次余额观测并更新消耗速度（充值不计入消耗）"""
+        now = time.time() if now is None else now
+        previous = self.last_seen.get(address)
+        self.last_seen[address] = (balance, now)
+        if previous is None or now <= previous[1]:
+            return
+        sample = max(0.0, (previous[0] - balance) / (now - previous[1]))
+        rate = self.burn_rate.get(address)
+        self.burn_rate[address] = sample if rate is None else rate + ADAPTIVE_BURN_ALPHA * (sample - rate)
+
+    def compute_interval(self, address: str, balance: int, threshold: int) -> float:
+        """根据余量和消耗速度计算距下次检查的秒数（余额和阈值均为wei）"""
+        headroom = balance - threshold
+        if headroom <= 0:
+            # 已低于阈值：警告已发出（24小时内不重复），按常规间隔复查即可
+            return CHECK_INTERVAL * 60
+
+        # 余量相对阈值越大，检查越稀疏
+        ratio = headroom / threshold if threshold > 0 else ADAPTIVE_HEADROOM_FULL
+        interval = ADAPTIVE_MIN_INTERVAL + (ADAPTIVE_MAX_INTERVAL - ADAPTIVE_MIN_INTERVAL) * min(1.0, ratio / ADAPTIVE_HEADROOM_FULL)
+
+        # 按当前消耗速度，在预计跌破阈值前留出安全余量
+        rate = self.burn_rate.get(address, 0.0)
+        if rate > 0:
+            interval = min(interval, headroom / rate * ADAPTIVE_SAFETY_FACTOR)
+
+        return max(ADAPTIVE_MIN_INTERVAL, min(ADAPTIVE_MAX_INTERVAL, interval))
+
+    def reschedule(self, address: str, balance: int, threshold: int, now: Optional[float] = None) -> float:
+        """记录观测并安排下次检查，返回间隔秒数"""
+        now = time.time() if now is None else now
+        self.observe(address, balance, now)
+        interval = self.compute_interval(address, balance, threshold)
+        self.schedule(address, now + interval)
+        return interval
@@ -0,0 +1,141 @@
+"""
+分片监控的租约协调
+监控地址按 crc32(地址) % MONITOR_PARTITIONS 划分为固定数量的分区，多个监控worker（同一容器内的多个进程或多个副本）
+通过共享SQLite数据库中的租约表分配分区：每个worker定期写心跳并续约，按存活worker数均分分区，
+多出的分区主动释放，过期（worker退出或失联）的租约由其他worker接管。
+租约交接期间两个worker可能短暂检查同一地址，重复的警告由alerts表的条件写入去重
+"""
+
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterable, List, Optional, Set
+from config import USER_DB_FILE, MONITOR_PARTITIONS, MONITOR_WORKER_ID, MONITOR_LEASE_TTL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS monitor_workers (
+    worker_id    TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS monitor_leases (
+    partition  INTEGER PRIMARY KEY,
+    worker_id  TEXT,
+    expires_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def address_partition(address: str, partitions: int = MONITOR_PARTITIONS) -> int:
+    """地址（小写）所属的分区，所有进程计算结果一致"""
+    return zlib.crc32(address.encode('utf-8')) % partitions
+
+
+class ShardCoordinator:
+    def __init__(self, db_path: str = USER_DB_FILE, worker_id: str = MONITOR_WORKER_ID,
+                 partitions: int = MONITOR_PARTITIONS, lease_ttl: float = MONITOR_LEASE_TTL):
+        self.worker_id = worker_id
+        self.partitions = partitions
+        self.lease_ttl = lease_ttl
+        self.owned: Set[int] = set()
+        self.lease_expires_at = 0.0  # 本worker租约的到期时间（续约失败时到期后不再认为持有任何分区）
+        self.live_workers = 0
+        # heartbeat在线程中执行：与leave互斥，避免同一连接上的事务交错
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # 分区数调小后多余的租约行不再使用
+        self.conn.execute("DELETE FROM monitor_leases WHERE partition >= ?", (partitions,))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO monitor_leases (partition) VALUES (?)",
+            [(partition,) for partition in range(partitions)],
+        )
+
+    def _target_share(self, live: List[str]) -> int:
+        """按worker_id排序均分分区：前 partitions % n 个worker各多分一个，总数恰好等于分区数"""
+        base, extra = divmod(self.partitions, len(live))
+        return base + (1 if live.index(self.worker_id) < extra else 0)
+
+    def heartbeat(self, now: Optional[float] = None) -> Set[int]:
+        """写心跳、续约并按当前存活worker数调整持有的分区，返回本worker持有的分区"""
+        with self.lock:
+            return self._heartbeat(time.time() if now is None else now)
+
+    def _heartbeat(self, now: float) -> Set[int]:
+        expires_at = now + self.lease_ttl
+        # IMMEDIATE：一开始就取得写锁，多个worker的分配过程串行执行
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "INSERT INTO monitor_workers (worker_id, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (self.worker_id, now),
+            )
+            self.conn.execute("DELETE FROM monitor_workers WHERE heartbeat_at <= ?", (now - self.lease_ttl,))
+            live = [row[0] for row in self.conn.execute("SELECT worker_id FROM monitor_workers ORDER BY worker_id")]
+            target = self._target_share(live)
+
+            mine, free = [], []
+            for partition, owner, lease_expires in self.conn.execute(
+                    "SELECT partition, worker_id, expires_at FROM monitor_leases ORDER BY partition"):
+                if owner == self.worker_id:
+                    mine.append(partition)
+                elif owner is None or lease_expires <= now:
+                    free.append(partition)
+
+            # 超出份额的分区释放给新加入的worker；份额不足时接管空闲或过期的分区
+            released = mine[target:]
+            mine = mine[:target] + free[:max(0, target - len(mine))]
+            self.conn.executemany(
+                "UPDATE monitor_leases SET worker_id = NULL, expires_at = 0 WHERE partition = ?",
+                [(partition,) for partition in released],
+            )
+            self.conn.executemany(
+                "UPDATE monitor_leases SET worker_id = ?, expires_at = ? WHERE partition = ?",
+                [(self.worker_id, expires_at, partition) for partition in mine],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        mine = set(mine)
+        if mine != self.owned or len(live) != self.live_workers:
+            print(f"🧩 Worker {self.worker_id} owns {len(mine)}/{self.partitions} partitions ({len(live)} live workers)")
+        self.owned = mine
+        self.lease_expires_at = expires_at
+        self.live_workers = len(live)
+        return mine
+
+    def filter_owned(self, addresses: Iterable[str]) -> List[str]:
+        """只保留属于本worker当前有效租约内分区的地址"""
+        now = time.time()
+        if now >= self.lease_expires_at:
+            return []
+        return [address for address in addresses if address_partition(address, self.partitions) in self.owned]
+
+    def leave(self):
+        """正常退出：删除心跳并释放全部租约，其他worker在下次续约时立即接管（无需等待租约过期）"""
+        with self.lock:
+            self._leave()
+
+    def _leave(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM monitor_workers WHERE worker_id = ?", (self.worker_id,))
+            self.conn.execute(
+                "UPDATE monitor_leases SET worker_id = NULL, expires_at = 0 WHERE worker_id = ?",
+                (self.worker_id,),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.owned = set()
+        self.lease_expires_at = 0.0
+
+    def close(self):
+        self.conn.close()
@@ -1,15 +1,58 @@
 import asyncio
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import time
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, filters, ContextTypes
 from bsc_api import BSCBalanceChecker
 from user_manager import UserManager
-from config import TELEGRAM_BOT_TOKEN, LOW_BALANCE_THRESHOLD
+from token_tracker import TokenBalanceTracker
+from balance_history import BalanceHistory, PartitionedBalanceHistory
+from alert_dispatcher import AlertDispatcher
+from circuit_breaker import DegradedError
+from message_utils import split_message, LiveReport
+from metrics import ALERTS, ALERT_SEND_SECONDS
+from units import to_wei, format_units, format_amount
+from config import (
+    TELEGRAM_BOT_TOKEN, LOW_BALANCE_THRESHOLD, BALANCE_CACHE_BOT_MAX_AGE, ALERT_DIGEST,
+    BOT_UPDATE_CONCURRENCY, MAX_WATCHED_TOKENS, MONITOR_SHARDING, BOT_QUERY_CHUNK_SIZE, BOT_QUERY_ROUNDS,
+    LIST_PAGE_SIZE, LIST_PAGE_CACHE_TTL, LIST_VIEW_MAX,
+)
+
+class ListView:
+    """一条分页 /list 消息的翻页状态，由report原地编辑该消息"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.page = 0
+        self.pages = 1
+        self.total = 0
+        self.offset = 0            # 本页第一个地址在列表中的位置
+        self.addresses = []        # 本页地址
+        self.token_metadata = {}
+        self.threshold = 0
+        self.entry = None          # 本页的查询状态（来自页面缓存）
+        self.report = None
+
 
 class GasAlertBot:
     def __init__(self):
         self.balance_checker = BSCBalanceChecker()
         self.user_manager = UserManager()
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        # USDT/USDC余额的增量跟踪表（由监控器在启用TOKEN_TRACKING时同步）
+        self.token_tracker = TokenBalanceTracker(self.balance_checker)
+        # 余额历史（由监控器写入，/forecast 只读本地数据；分片监控时各分区一个文件，由持有该分区的worker写入）
+        self.balance_history = PartitionedBalanceHistory() if MONITOR_SHARDING else BalanceHistory()
+        self.application = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(BOT_UPDATE_CONCURRENCY)
+            .build()
+        )
+        # 警告消息后台发送队列（遵守Telegram的全局和单聊天限速）
+        self.alert_dispatcher = AlertDispatcher(self.application.bot, digest_formatter=self.format_low_balance_digest,
+                                                on_give_up=self.release_alerts)
+        # /list 分页：(user_id, 本页地址, 代币) -> 页面查询状态；(chat_id, message_id) -> 翻页状态
+        self.list_pages = {}
+        self.list_views = {}
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -18,9 +61,13 @@ class GasAlertBot:
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("add", self.add_address_command))
         self.application.add_handler(CommandHandler("list", self.list_addresses_command))
+        self.application.add_handler(CallbackQueryHandler(self.list_page_callback, pattern=r'^list:(\d+:)?\d+$'))
         self.application.add_handler(CommandHandler("remove", self.remove_address_command))
         self.application.add_handler(CommandHandler("check", self.check_balance_command))
         self.application.add_handler(CommandHandler("setthreshold", self.set_threshold_command))
+        self.application.add_handler(CommandHandler("forecast", self.forecast_command))
+        self.application.add_handler(CommandHandler("watch", self.watch_token_command))
+        self.application.add_handler(CommandHandler("unwatch", self.unwatch_token_command))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_address))
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -36,8 +83,10 @@ class GasAlertBot:
             "• /remove <地址> - 移除监控\n"
             "• /check - 立即检查所有地址\n"
             "• /setthreshold <数值> - 设置余额阈值\n"
+            "• /forecast [地址] - 预估余额耗尽时间\n"
+            "• /watch <代币合约> - 关注BEP-20代币余额\n"
             "• /help - 查看帮助\n\n"
-            f"⚠️ 当前余额阈值: {threshold} BNB\n"
+            f"⚠️ 当前余额阈值: {format_amount(threshold)} BNB\n"
             f"余额低于该值时会自动推送提醒"
         )
         await update.message.reply_text(welcome_message)
@@ -50,15 +99,18 @@ class GasAlertBot:
             "📋 命令列表：\n\n"
             "/start - 开始使用机器人\n"
             "/add <地址> - 添加监控地址\n"
-            "/list - 查看当前监控的地址\n"
+            "/list - 查看当前监控的地址（分页显示）\n"
             "/remove <地址> - 移除监控地址\n"
             "/check - 立即检查所有地址余额\n"
             "/setthreshold <数值> - 设置余额阈值\n"
+            "/forecast [地址] - 根据历史消耗预估余额跌破阈值的时间\n"
+            "/watch [代币合约] - 关注BEP-20代币，/list中显示各地址的代币余额（不带参数时查看已关注的代币）\n"
+            "/unwatch <代币合约> - 取消关注代币\n"
             "/help - 显示此帮助信息\n\n"
             "💡 提示：\n"
             "• 直接发送钱包地址也可以添加监控\n"
             "• 地址格式：0x开头的42位十六进制字符\n"
-            f"• 当前余额阈值: {threshold} BNB\n"
+            f"• 当前余额阈值: {format_amount(threshold)} BNB\n"
             "• 设置阈值示例: /setthreshold 0.1"
         )
         await update.message.reply_text(help_message)
@@ -100,8 +152,12 @@ class GasAlertBot:
 
         for attempt in range(max_retries):
             try:
-                balance = await self.balance_checker.get_bnb_balance(address)
+                balance = await self.balance_checker.get_bnb_balance(address, max_age=BALANCE_CACHE_BOT_MAX_AGE)
                 break  # 成功则跳出
+            except DegradedError:
+                # RPC节点全部熔断且备用API已饱和，重试只会加重拥堵
+                await update.message.reply_text("⚠️ 节点和备用API暂时不可用（服务降级），请稍后再试")
+                return
             except Exception as e:
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 2
@@ -117,18 +173,18 @@ class GasAlertBot:
             await update.message.reply_text(
                 f"✅ 地址添加成功！\n\n"
                 f"📍 地址: {address[:10]}...{address[-8:]}\n"
-                f"💰 当前余额: {balance:.6f} BNB\n"
-                f"⚠️ 阈值设置: {threshold} BNB\n"
+                f"💰 当前余额: {format_units(balance)} BNB\n"
+                f"⚠️ 阈值设置: {format_amount(threshold)} BNB\n"
                 f"📊 状态: {status}"
             )
         else:
             await update.message.reply_text("ℹ️ 该地址已在监控列表中")
     
     async def query_address_with_retry(self, address: str):
-        """查询单个地址余额（单次尝试）- 包含BNB、USDT、USDC"""
+        """查询单个地址余额（单次尝试）- 包含BNB、USDT、USDC（均为最小单位的整数）"""
         try:
             # 同时查询BNB、USDT、USDC
-            balances = await self.balance_checker.get_all_balances(address)
+            balances = await self.balance_checker.get_all_balances(address, max_age=BALANCE_CACHE_BOT_MAX_AGE)
             return {
                 'address': address,
                 'balance': balances['BNB'],
@@ -140,86 +196,304 @@ class GasAlertBot:
         except Exception as e:
             return {
                 'address': address,
-                'balance': 0.0,
-                'usdt': 0.0,
-                'usdc': 0.0,
-                'total_u': 0.0,
+                'balance': 0,
+                'usdt': 0,
+                'usdc': 0,
+                'total_u': 0,
                 'success': False,
                 'error': str(e)
             }
 
-    async def query_batch_with_delay(self, addresses, delay_between_requests=0.3):
-        """批量查询地址，请求之间有延迟以避免触发API限制"""
-        results = []
-        for address in addresses:
-            result = await self.query_address_with_retry(address)
-            results.append(result)
-            # 每个请求后都添加延迟，包括最后一个（0.3秒 = 每秒3.3次）
-            await asyncio.sleep(delay_between_requests)
-        return results
-
-    async def list_addresses_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """列出监控地址（带批次重试机制）"""
-        user_id = update.effective_user.id
-        addresses = self.user_manager.get_addresses(user_id)
-
-        if not addresses:
-            await update.message.reply_text("📝 您还没有添加任何监控地址\n\n发送钱包地址开始监控！")
-            return
+    async def query_batch_balances(self, addresses):
+        """批量查询多个地址的BNB、USDT、USDC余额（允许使用有限陈旧的缓存）
 
-        await update.message.reply_text("🔄 正在查询地址余额...")
+        代币余额已由Transfer日志增量跟踪的地址直接读取本地余额表，只需批量查询BNB；
+        其余地址通过Multicall3一次性读取全部余额
+        """
+        balances = {}
+        errors = {}
+        tracked = {}
+        for address in addresses:
+            token_balances = self.token_tracker.get_balances(address)
+            if token_balances is not None:
+                tracked[address] = token_balances
+
+        if tracked:
+            bnb_balances, bnb_errors = await self.balance_checker.get_bnb_balances(list(tracked), max_age=BALANCE_CACHE_BOT_MAX_AGE)
+            for address, token_balances in tracked.items():
+                if address in bnb_balances:
+                    balances[address] = {'BNB': bnb_balances[address], **token_balances}
+                else:
+                    errors[address] = bnb_errors.get(address, 'Unknown error')
 
-        # 批次重试逻辑
-        successful_results = {}
-        addresses_to_query = addresses.copy()
-        retry_round = 0
-        max_retry_rounds = 5  # list命令最多重试5轮
+        untracked = [address for address in addresses if address not in tracked]
+        if untracked:
+            multicall_balances, multicall_errors = await self.balance_checker.get_all_balances_batch(untracked, max_age=BALANCE_CACHE_BOT_MAX_AGE)
+            balances.update(multicall_balances)
+            errors.update(multicall_errors)
 
-        while addresses_to_query and retry_round < max_retry_rounds:
-            retry_round += 1
+        results = []
+        for address in addresses:
+            if address in balances:
+                address_balances = balances[address]
+                results.append({
+                    'address': address,
+                    'balance': address_balances['BNB'],
+                    'usdt': address_balances['USDT'],
+                    'usdc': address_balances['USDC'],
+                    'total_u': address_balances['USDT'] + address_balances['USDC'],
+                    'success': True
+                })
+            else:
+                results.append({
+                    'address': address,
+                    'balance': 0,
+                    'usdt': 0,
+                    'usdc': 0,
+                    'total_u': 0,
+                    'success': False,
+                    'error': errors.get(address, 'Unknown error')
+                })
+        return results
 
-            if retry_round > 1:
-                wait_time = min(retry_round * 2, 10)
-                await asyncio.sleep(wait_time)
+    async def stream_balances(self, context: ContextTypes.DEFAULT_TYPE, reports, addresses, state, on_success=None):
+        """分批并发查询地址余额，每批完成后刷新结果消息；失败的地址交给后台重试，命令处理函数不必等待
 
-            # 限速查询：请求之间有0.3秒延迟（每秒3.3次）
-            results = await self.query_batch_with_delay(addresses_to_query, delay_between_requests=0.3)
+        reports: 显示这些地址的LiveReport集合（查询期间可以加入新的订阅者；预取时为空）
+        state: {'results': {地址: 结果}, 'failed': 首轮失败的地址, 'round': 当前轮数, 'done': 是否全部结束}
+        on_success(地址列表): 地址查询成功后的附加查询（如自选代币余额），完成后再刷新消息
+        """
 
-            # 分离成功和失败
-            failed_addresses = []
-            for result in results:
+        chunks = [addresses[i:i + BOT_QUERY_CHUNK_SIZE] for i in range(0, len(addresses), BOT_QUERY_CHUNK_SIZE)]
+        failed = []
+        for batch in asyncio.as_completed([self.query_batch_balances(chunk) for chunk in chunks]):
+            succeeded = []
+            for result in await batch:
                 if result['success']:
-                    successful_results[result['address']] = result
+                    state['results'][result['address']] = result
+                    succeeded.append(result['address'])
                 else:
-                    failed_addresses.append(result['address'])
+                    failed.append(result['address'])
+                    state['failed'].add(result['address'])
+            if succeeded and on_success is not None:
+                await on_success(succeeded)
+            self.refresh_reports(reports)
+
+        if failed:
+            context.application.create_task(self.retry_failed(reports, failed, state, on_success))
+        else:
+            state['done'] = True
+            await self.finish_reports(reports)
 
-            addresses_to_query = failed_addresses
+    @staticmethod
+    def refresh_reports(reports):
+        for report in list(reports):
+            report.refresh()
 
-        # 生成消息并统计总U
-        threshold = self.user_manager.get_threshold(user_id)
-        total_u = 0.0
-        message = f"📋 您的监控列表：\n\n⚠️ 当前阈值: {threshold} BNB\n\n"
+    @staticmethod
+    async def finish_reports(reports):
+        await asyncio.gather(*(report.finish() for report in list(reports)))
 
-        for i, address in enumerate(addresses, 1):
-            if address in successful_results:
-                result = successful_results[address]
-                balance = result['balance']
-                u_amount = result['total_u']
-                total_u += u_amount
+    async def retry_failed(self, reports, failed, state, on_success=None):
+        """后台逐轮重试失败的地址，每个地址成功后立即补进结果消息"""
+        async def query(address):
+            result = await self.query_address_with_retry(address)
+            if result['success']:
+                state['results'][address] = result
+                if on_success is not None:
+                    await on_success([address])
+                self.refresh_reports(reports)
+            return result
 
-                status = "🔴" if balance < threshold else "✅"
-                message += f"{i}. {status} {address[:10]}...{address[-8:]}\n"
-                message += f"   💰 BNB: {balance:.6f}\n"
-                message += f"   💵 U: {u_amount:.2f}\n\n"
+        try:
+            while failed and state['round'] < BOT_QUERY_ROUNDS:
+                state['round'] += 1
+                self.refresh_reports(reports)
+                await asyncio.sleep(min(state['round'] * 2, 10))
+                results = await self.balance_checker.rate_limiter.map(query, failed)
+                failed = [result['address'] for result in results if not result['success']]
+        finally:
+            state['done'] = True
+            await self.finish_reports(reports)
+
+    def list_page_size(self, token_count: int) -> int:
+        """每页地址数：关注的代币越多每个地址占的行越多，保证一页能放进一条消息"""
+        return max(1, min(LIST_PAGE_SIZE, 3600 // (100 + 30 * token_count)))
+
+    def list_page_entry(self, user_id: int, addresses, contracts):
+        """获取一页地址的查询状态，LIST_PAGE_CACHE_TTL内查询过的页面直接复用；返回 (状态, 是否需要查询)"""
+        now = time.monotonic()
+        for key in [key for key, entry in self.list_pages.items() if now - entry['created'] > LIST_PAGE_CACHE_TTL]:
+            del self.list_pages[key]
+
+        key = (user_id, tuple(addresses), tuple(contracts))
+        entry = self.list_pages.get(key)
+        if entry is not None:
+            return entry, False
+        entry = {
+            'created': now,
+            'state': {'results': {}, 'failed': set(), 'round': 1, 'done': False},
+            'token_balances': {},
+            'reports': set(),  # 正在显示该页的LiveReport，查询任务刷新其中每一个
+        }
+        self.list_pages[key] = entry
+        return entry, True
+
+    def token_balance_fetcher(self, entry, token_metadata):
+        """返回把查询成功地址的自选代币余额写入页面状态的on_success回调（没有关注代币时为None）"""
+        if not token_metadata:
+            return None
+
+        async def fetch(succeeded):
+            # 一批地址的全部代币余额在一次批量读取中完成
+            balances, _ = await self.balance_checker.get_token_balances_batch(
+                succeeded, list(token_metadata), max_age=BALANCE_CACHE_BOT_MAX_AGE
+            )
+            entry['token_balances'].update(balances)
+        return fetch
+
+    def create_list_view(self, user_id: int, origin, messages=None) -> ListView:
+        view = ListView(user_id)
+        view.report = LiveReport(origin, lambda: self.render_list_page(view), messages=messages,
+                                 reply_markup=lambda: self.list_keyboard(view))
+        return view
+
+    def remember_list_view(self, view: ListView):
+        """记录消息对应的翻页状态，超过LIST_VIEW_MAX时丢弃最早的（翻页时会重新创建）"""
+        for message in view.report.messages:
+            key = (message.chat_id, message.message_id)
+            self.list_views.pop(key, None)
+            self.list_views[key] = view
+        while len(self.list_views) > LIST_VIEW_MAX:
+            del self.list_views[next(iter(self.list_views))]
+
+    async def show_list_page(self, context: ContextTypes.DEFAULT_TYPE, view: ListView, page: int):
+        """切换到第page页：缓存中的页面直接显示，否则只查询本页地址；然后在后台预取下一页"""
+        addresses = self.user_manager.get_addresses(view.user_id)
+        token_metadata = {}
+        tokens = self.user_manager.get_tokens(view.user_id)
+        if tokens:
+            token_metadata, _ = await self.balance_checker.get_token_metadata(tokens)
+
+        page_size = self.list_page_size(len(token_metadata))
+        view.total = len(addresses)
+        view.pages = max(1, -(-len(addresses) // page_size))
+        view.page = min(max(page, 0), view.pages - 1)
+        view.offset = view.page * page_size
+        view.addresses = addresses[view.offset:view.offset + page_size]
+        view.token_metadata = token_metadata
+        view.threshold = self.user_manager.get_threshold(view.user_id)
+        if view.entry is not None:
+            view.entry['reports'].discard(view.report)
+        view.entry, needs_query = self.list_page_entry(view.user_id, view.addresses, token_metadata)
+        view.entry['reports'].add(view.report)
+
+        if view.entry['state']['done']:
+            await view.report.finish()
+        else:
+            # 该页正在查询时（如预取尚未完成，或另一条消息发起的查询），之后的结果由查询任务刷新每个订阅的消息
+            await view.report.start()
+        self.remember_list_view(view)
+        if needs_query:
+            await self.stream_balances(context, view.entry['reports'], view.addresses, view.entry['state'],
+                                       self.token_balance_fetcher(view.entry, token_metadata))
+
+        next_addresses = addresses[view.offset + page_size:view.offset + 2 * page_size]
+        if next_addresses:
+            entry, needs_query = self.list_page_entry(view.user_id, next_addresses, token_metadata)
+            if needs_query:
+                # 预取时没有订阅者，翻到该页时再加入
+                context.application.create_task(self.stream_balances(
+                    context, entry['reports'], next_addresses, entry['state'], self.token_balance_fetcher(entry, token_metadata)
+                ))
+
+    def render_list_page(self, view: ListView):
+        state = view.entry['state']
+        token_balances = view.entry['token_balances']
+        page_u = 0
+        blocks = []
+        for i, address in enumerate(view.addresses, view.offset + 1):
+            result = state['results'].get(address)
+            if result is not None:
+                balance = result['balance']
+                page_u += result['total_u']
+                status = "🔴" if balance < view.threshold else "✅"
+                block = f"{i}. {status} {address[:10]}...{address[-8:]}\n"
+                block += f"   💰 BNB: {format_units(balance)}\n"
+                block += f"   💵 U: {format_units(result['total_u'], 2)}\n"
+                for contract, metadata in view.token_metadata.items():
+                    amount = token_balances.get(address, {}).get(contract)
+                    if amount is not None:
+                        amount_text = format_units(amount, 4, metadata['decimals'])
+                    else:
+                        amount_text = "查询失败" if state['done'] else "⏳"
+                    block += f"   🪙 {metadata['symbol']}: {amount_text}\n"
+                blocks.append(block + "\n")
+            elif address not in state['failed']:
+                continue  # 还在查询中的地址不占位，结果返回后按顺序插入
+            elif state['done']:
+                blocks.append(f"{i}. ❌ {address[:10]}...{address[-8:]}\n   ⚠️ 查询失败（已重试{state['round']}次）\n\n")
             else:
-                message += f"{i}. ❌ {address[:10]}...{address[-8:]}\n   ⚠️ 查询失败（已重试{retry_round}次）\n\n"
+                blocks.append(f"{i}. 🔁 {address[:10]}...{address[-8:]}\n   ⚠️ 查询失败，后台重试中（第{state['round']}轮）\n\n")
+
+        footer = f"━━━━━━━━━━━━━━━━\n💵 本页合计 U: {format_units(page_u, 2)}\n"
+        if not state['done']:
+            footer += f"🔄 已完成 {len(state['results'])}/{len(view.addresses)}，其余地址查询中...\n"
+        header = f"📋 您的监控列表（共 {view.total} 个地址"
+        if view.pages > 1:
+            header += f"，第 {view.page + 1}/{view.pages} 页"
+        header += f"）：\n\n⚠️ 当前阈值: {format_amount(view.threshold)} BNB\n\n"
+        return split_message(blocks, header=header, footer=footer)
+
+    def list_keyboard(self, view: ListView):
+        """翻页按钮（只有一页时不显示）"""
+        if view.pages <= 1:
+            return None
+        # callback_data带上列表所有者：群组中只有所有者能翻页，重启后也能按所有者重建翻页状态
+        prefix = f"list:{view.user_id}:"
+        buttons = []
+        if view.page > 0:
+            buttons.append(InlineKeyboardButton("◀️ 上一页", callback_data=f"{prefix}{view.page - 1}"))
+        buttons.append(InlineKeyboardButton(f"{view.page + 1}/{view.pages}", callback_data=f"{prefix}{view.page}"))
+        if view.page < view.pages - 1:
+            buttons.append(InlineKeyboardButton("下一页 ▶️", callback_data=f"{prefix}{view.page + 1}"))
+        return InlineKeyboardMarkup([buttons])
 
-        # 添加总计
-        message += f"━━━━━━━━━━━━━━━━\n"
-        message += f"💵 总计 U: {total_u:.2f}\n"
+    async def list_addresses_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """列出监控地址（分页显示，每页只查询本页地址）"""
+        user_id = update.effective_user.id
+        if not self.user_manager.get_addresses(user_id):
+            await update.message.reply_text("📝 您还没有添加任何监控地址\n\n发送钱包地址开始监控！")
+            return
+
+        view = self.create_list_view(user_id, update.message)
+        await self.show_list_page(context, view, 0)
+
+    async def list_page_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/list 的翻页按钮（只有列表所有者可以翻页）"""
+        query = update.callback_query
+        parts = query.data.split(':')
+        page = int(parts[-1])
+        view = self.list_views.get((query.message.chat_id, query.message.message_id))
+        if len(parts) == 3:
+            owner_id = int(parts[1])
+        elif view is not None:
+            owner_id = view.user_id
+        else:
+            # 旧版本的按钮没有记录所有者，无法确认是谁的列表
+            await query.answer("⚠️ 列表已过期，请重新发送 /list", show_alert=True)
+            return
+
+        if query.from_user.id != owner_id:
+            await query.answer("⚠️ 只有发送 /list 的用户可以翻页", show_alert=True)
+            return
+        await query.answer()
+
+        if view is None or view.user_id != owner_id:
+            # 重启后或较早的列表消息：按所有者接管这条消息重新建立翻页状态
+            view = self.create_list_view(owner_id, query.message, messages=[query.message])
+        await self.show_list_page(context, view, page)
 
-        await update.message.reply_text(message)
-    
     async def remove_address_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """移除监控地址"""
         user_id = update.effective_user.id
@@ -236,7 +510,7 @@ class GasAlertBot:
             await update.message.reply_text("❌ 地址不在监控列表中")
     
     async def check_balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """立即检查余额（带批次重试机制）"""
+        """立即检查余额（分批返回结果，失败的地址在后台重试）"""
         user_id = update.effective_user.id
         addresses = self.user_manager.get_addresses(user_id)
 
@@ -244,74 +518,199 @@ class GasAlertBot:
             await update.message.reply_text("📝 您还没有添加任何监控地址")
             return
 
-        await update.message.reply_text("🔄 正在检查所有地址余额...")
-
-        # 批次重试逻辑
-        successful_results = {}
-        addresses_to_query = addresses.copy()
-        retry_round = 0
-        max_retry_rounds = 5
+        threshold = self.user_manager.get_threshold(user_id)
+        state = {'results': {}, 'failed': set(), 'round': 1, 'done': False}
+
+        def render():
+            # 余额不足和查询失败的地址合并为一份报告，超长时按Telegram消息长度拆分
+            low_balance_count = 0
+            blocks = []
+            for address in addresses:
+                result = state['results'].get(address)
+                if result is not None:
+                    balance = result['balance']
+                    if balance < threshold:
+                        low_balance_count += 1
+                        blocks.append(
+                            f"🔴 {address[:10]}...{address[-8:]}\n"
+                            f"   💰 BNB余额: {format_units(balance)}\n"
+                            f"   💵 U余额: {format_units(result['total_u'], 2)}\n\n"
+                        )
+                elif address in state['failed']:
+                    if state['done']:
+                        blocks.append(f"❌ {address[:10]}...{address[-8:]}\n   ⚠️ 检查失败（已重试{state['round']}次）\n\n")
+                    else:
+                        blocks.append(f"🔁 {address[:10]}...{address[-8:]}\n   ⚠️ 检查失败，后台重试中（第{state['round']}轮）\n\n")
+
+            success_count = len(state['results'])
+            if state['done']:
+                summary = (f"✅ 检查完成！\n📊 总计: {len(addresses)} 个地址\n✅ 成功: {success_count} 个\n"
+                           f"❌ 失败: {len(addresses) - success_count} 个\n🔴 余额不足: {low_balance_count} 个")
+            else:
+                summary = (f"🔄 正在检查所有地址余额... {success_count}/{len(addresses)}\n"
+                           f"🔴 余额不足: {low_balance_count} 个")
+            if not blocks:
+                return [summary]
+            header = f"⚠️ 余额不足/检查失败的地址（阈值: {format_amount(threshold)} BNB）：\n\n"
+            return split_message(blocks, header=header, footer="━━━━━━━━━━━━━━━━\n" + summary)
+
+        report = LiveReport(update.message, render)
+        await report.start()
+        await self.stream_balances(context, {report}, addresses, state)
+    
+    def format_low_balance_alert(self, user_id: int, address: str, balance: int) -> str:
+        """生成余额不足警告消息（余额为wei）"""
+        threshold = self.user_manager.get_threshold(user_id)
+        return (
+            f"🚨 GAS余额不足警告！\n\n"
+            f"📍 地址: {address[:10]}...{address[-8:]}\n"
+            f"💰 当前余额: {format_units(balance)} BNB\n"
+            f"⚠️ 阈值: {format_amount(threshold)} BNB\n\n"
+            f"请及时充值以确保交易正常进行！"
+        )
 
-        while addresses_to_query and retry_round < max_retry_rounds:
-            retry_round += 1
+    def format_low_balance_digest(self, user_id: int, items: list) -> list:
+        """把同一用户的多条警告 [(address, balance), ...] 合并为一条或多条摘要消息"""
+        if len(items) == 1:
+            return [self.format_low_balance_alert(user_id, *items[0])]
 
-            if retry_round > 1:
-                wait_time = min(retry_round * 2, 10)
-                await asyncio.sleep(wait_time)
+        threshold = self.user_manager.get_threshold(user_id)
+        header = f"🚨 GAS余额不足警告！共 {len(items)} 个地址\n⚠️ 阈值: {format_amount(threshold)} BNB\n\n"
+        blocks = [
+            f"📍 {address[:10]}...{address[-8:]}\n   💰 {format_units(balance)} BNB\n"
+            for address, balance in items
+        ]
+        return split_message(blocks, header=header, footer="\n请及时充值以确保交易正常进行！")
+
+    def enqueue_low_balance_alert(self, user_id: int, address: str, balance: int, claimed_at: float) -> bool:
+        """将余额不足警告放入后台发送队列，返回是否成功入队
+
+        摘要模式下先加入该用户的摘要，在一轮检查结束或合并窗口到期时合并发送。
+        claimed_at 是claim_alerts申请警告的时间，警告最终没有送达时用它撤销申请
+        """
+        claim = (address, claimed_at)
+        if ALERT_DIGEST:
+            return self.alert_dispatcher.add_to_digest(user_id, (address, balance), claim)
+        return self.alert_dispatcher.enqueue(user_id, self.format_low_balance_alert(user_id, address, balance), [claim])
+
+    def release_alerts(self, user_id: int, claims: list):
+        """撤销没有送达的警告申请，下一轮检查可以重新发送"""
+        for address, claimed_at in claims:
+            self.user_manager.release_alert(user_id, address, claimed_at)
+
+    async def send_low_balance_alert(self, user_id: int, address: str, balance: int):
+        """发送余额不足警告"""
+        try:
+            message = self.format_low_balance_alert(user_id, address, balance)
+            with ALERT_SEND_SECONDS.time():
+                await self.application.bot.send_message(chat_id=user_id, text=message)
+            ALERTS.inc('sent')
+        except Exception as e:
+            ALERTS.inc('failed')
+            print(f"Failed to send alert to user {user_id}: {str(e)}")
 
-            # 限速查询：请求之间有0.3秒延迟（每秒3.3次）
-            results = await self.query_batch_with_delay(addresses_to_query, delay_between_requests=0.3)
+    async def forecast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """根据余额历史预估跌破阈值的时间（不发起RPC请求）"""
+        user_id = update.effective_user.id
+        addresses = self.user_manager.get_addresses(user_id)
 
-            # 分离成功和失败
-            failed_addresses = []
-            for result in results:
-                if result['success']:
-                    successful_results[result['address']] = result
-                else:
-                    failed_addresses.append(result['address'])
+        if context.args:
+            address = context.args[0].strip().lower()
+            if address not in addresses:
+                await update.message.reply_text("❌ 地址不在监控列表中")
+                return
+            addresses = [address]
 
-            addresses_to_query = failed_addresses
+        if not addresses:
+            await update.message.reply_text("📝 您还没有添加任何监控地址")
+            return
 
-        # 统计并发送警告
-        threshold = self.user_manager.get_threshold(user_id)
-        low_balance_count = 0
-        failed_count = len(addresses) - len(successful_results)
+        threshold_wei = self.user_manager.get_threshold(user_id)
+        header = f"📈 余额消耗预估（阈值: {format_amount(threshold_wei)} BNB）\n\n"
 
-        for address in addresses:
-            if address in successful_results:
-                result = successful_results[address]
-                balance = result['balance']
-                if balance < threshold:
-                    low_balance_count += 1
-                    await update.message.reply_text(
-                        f"🔴 余额不足警告！\n\n"
-                        f"📍 地址: {address[:10]}...{address[-8:]}\n"
-                        f"💰 BNB余额: {balance:.6f}\n"
-                        f"💵 U余额: {result['total_u']:.2f}\n"
-                        f"⚠️ 低于阈值: {threshold} BNB"
-                    )
+        # 每个地址一个文本块，地址多时拆成多条不超过Telegram长度限制的消息
+        blocks = []
+        for i, address in enumerate(addresses, 1):
+            forecast = self.balance_history.forecast(address, threshold_wei)
+            block = f"{i}. {address[:10]}...{address[-8:]}\n"
+            if forecast is None:
+                blocks.append(block + "   ℹ️ 历史数据不足\n\n")
+                continue
+
+            block += f"   💰 最近余额: {format_units(forecast['balance_wei'])} BNB\n"
+            block += f"   🔥 消耗速度: {forecast['burn_per_hour']:.6f} BNB/小时\n"
+            if forecast['hours_left'] is None:
+                block += "   ✅ 余额未在减少\n\n"
+            elif forecast['hours_left'] <= 0:
+                block += "   🔴 已低于阈值\n\n"
             else:
+                block += f"   ⏳ 预计 {forecast['hours_left']:.1f} 小时后低于阈值\n\n"
+            blocks.append(block)
+
+        for message in split_message(blocks, header=header):
+            await update.message.reply_text(message)
+
+    async def watch_token_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """关注BEP-20代币；不带参数时列出已关注的代币"""
+        user_id = update.effective_user.id
+        tokens = self.user_manager.get_tokens(user_id)
+
+        if not context.args:
+            if not tokens:
                 await update.message.reply_text(
-                    f"❌ 检查失败\n📍 地址: {address[:10]}...{address[-8:]}\n⚠️ 已重试{retry_round}次仍失败"
+                    "📝 您还没有关注任何代币\n\n"
+                    "使用方法：/watch <代币合约地址>\n"
+                    "例如：/watch 0x0e09fabb73bd3ade0a17ecc321fd13a19e81ce82"
                 )
+                return
+            metadata, _ = await self.balance_checker.get_token_metadata(tokens)
+            message = f"🪙 已关注的代币（{len(tokens)}/{MAX_WATCHED_TOKENS}）：\n\n"
+            for i, contract in enumerate(tokens, 1):
+                entry = metadata.get(contract)
+                name = f"{entry['symbol']}（{entry['decimals']}位小数）" if entry else "未知代币"
+                message += f"{i}. {name}\n   📍 {contract}\n"
+            await update.message.reply_text(message)
+            return
 
-        summary = f"✅ 检查完成！\n📊 总计: {len(addresses)} 个地址\n✅ 成功: {len(successful_results)} 个\n❌ 失败: {failed_count} 个\n🔴 余额不足: {low_balance_count} 个"
-        await update.message.reply_text(summary)
-    
-    async def send_low_balance_alert(self, user_id: int, address: str, balance: float):
-        """发送余额不足警告"""
-        try:
-            threshold = self.user_manager.get_threshold(user_id)
-            message = (
-                f"🚨 GAS余额不足警告！\n\n"
-                f"📍 地址: {address[:10]}...{address[-8:]}\n"
-                f"💰 当前余额: {balance:.6f} BNB\n"
-                f"⚠️ 阈值: {threshold} BNB\n\n"
-                f"请及时充值以确保交易正常进行！"
-            )
-            await self.application.bot.send_message(chat_id=user_id, text=message)
-        except Exception as e:
-            print(f"Failed to send alert to user {user_id}: {str(e)}")
+        contract = context.args[0].strip()
+        if not self.balance_checker.is_valid_address(contract):
+            await update.message.reply_text("❌ 无效的合约地址格式")
+            return
+        if contract.lower() in tokens:
+            await update.message.reply_text("ℹ️ 该代币已在关注列表中")
+            return
+        if len(tokens) >= MAX_WATCHED_TOKENS:
+            await update.message.reply_text(f"❌ 最多关注{MAX_WATCHED_TOKENS}个代币，请先使用 /unwatch 取消关注")
+            return
+
+        # 读取decimals和symbol（同时验证是BEP-20合约），结果持久化缓存
+        metadata, errors = await self.balance_checker.get_token_metadata([contract])
+        entry = metadata.get(contract.lower())
+        if entry is None:
+            await update.message.reply_text(f"❌ 无法读取代币信息: {errors.get(contract.lower(), 'Unknown error')}")
+            return
+
+        self.user_manager.add_token(user_id, contract)
+        await update.message.reply_text(
+            f"✅ 已关注代币 {entry['symbol']}\n\n"
+            f"📍 合约: {contract[:10]}...{contract[-8:]}\n"
+            f"🔢 小数位数: {entry['decimals']}\n\n"
+            f"使用 /list 查看各地址的代币余额"
+        )
+
+    async def unwatch_token_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """取消关注代币"""
+        user_id = update.effective_user.id
+
+        if not context.args:
+            await update.message.reply_text("❌ 请提供要取消关注的代币合约地址\n例如：/unwatch 0x0e09fabb73bd3ade0a17ecc321fd13a19e81ce82")
+            return
+
+        contract = context.args[0].strip()
+        if self.user_manager.remove_token(user_id, contract):
+            await update.message.reply_text(f"✅ 已取消关注代币 {contract[:10]}...{contract[-8:]}")
+        else:
+            await update.message.reply_text("❌ 代币不在关注列表中")
 
     async def set_threshold_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """设置余额阈值命令"""
@@ -321,27 +720,27 @@ class GasAlertBot:
             current_threshold = self.user_manager.get_threshold(user_id)
             await update.message.reply_text(
                 f"⚠️ 请提供阈值数值\n\n"
-                f"当前阈值: {current_threshold} BNB\n\n"
+                f"当前阈值: {format_amount(current_threshold)} BNB\n\n"
                 f"使用方法：/setthreshold 0.1\n"
                 f"示例：设置为0.1个BNB"
             )
             return
 
         try:
-            threshold = float(context.args[0])
+            threshold_wei = to_wei(context.args[0])
 
-            if threshold <= 0:
+            if threshold_wei <= 0:
                 await update.message.reply_text("❌ 阈值必须大于0")
                 return
 
-            if threshold > 100:
+            if threshold_wei > to_wei(100):
                 await update.message.reply_text("❌ 阈值不能超过100 BNB")
                 return
 
-            self.user_manager.set_threshold(user_id, threshold)
+            self.user_manager.set_threshold(user_id, threshold_wei)
             await update.message.reply_text(
                 f"✅ 余额阈值已更新！\n\n"
-                f"⚠️ 新阈值: {threshold} BNB\n"
+                f"⚠️ 新阈值: {format_amount(threshold_wei)} BNB\n"
                 f"当余额低于此值时会收到提醒"
             )
         except ValueError:
@@ -3,10 +3,12 @@
 简单测试BSC API功能
 """
 
+import asyncio
 from bsc_api import BSCBalanceChecker
-from config import LOW_BALANCE_THRESHOLD
+from config import LOW_BALANCE_THRESHOLD_WEI
+from units import format_units, format_amount
 
-def test_api():
+async def run_api_test():
     """测试BSC API"""
     print("🔄 Testing BSC API...")
     
@@ -21,15 +23,20 @@ def test_api():
     
     # 测试余额查询
     try:
-        balance = checker.get_bnb_balance(test_address)
-        print(f"💰 Balance for {test_address[:10]}...{test_address[-8:]}: {balance:.6f} BNB")
+        balance = await checker.get_bnb_balance(test_address)
+        print(f"💰 Balance for {test_address[:10]}...{test_address[-8:]}: {format_units(balance)} BNB")
         
-        is_low, _ = checker.check_low_balance(test_address, LOW_BALANCE_THRESHOLD)
+        is_low, _ = await checker.check_low_balance(test_address, LOW_BALANCE_THRESHOLD_WEI)
         status = "🔴 Low" if is_low else "✅ OK"
-        print(f"📊 Balance status: {status} (threshold: {LOW_BALANCE_THRESHOLD} BNB)")
+        print(f"📊 Balance status: {status} (threshold: {format_amount(LOW_BALANCE_THRESHOLD_WEI)} BNB)")
         
     except Exception as e:
         print(f"❌ Error querying balance: {str(e)}")
+    finally:
+        await checker.close_session()
+
+def test_api():
+    asyncio.run(run_api_test())
 
 if __name__ == "__main__":
     test_api()
\ No newline at end of file
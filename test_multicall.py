@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""测试Multicall3 aggregate3编解码：按ABI规范逐字写出的已知编码，以及与模拟节点编解码器之间的往返"""
+
+import pytest
+from multicall import (
+    MULTICALL3_ADDRESS, encode_aggregate3, decode_aggregate3, decode_string, decode_uint256,
+    encode_get_eth_balance, encode_decimals, encode_balance_of, encode_symbol,
+)
+from mock_bsc_server import decode_aggregate3_calls, encode_aggregate3_results
+
+HOLDER = '0x' + 'ab' * 20
+TOKEN = '0x55d398326f99059fF775485246999027B3197955'
+
+
+def words(*values) -> str:
+    """把整数或十六进制串拼接为连续的32字节字（十六进制串按左对齐补零）"""
+    encoded = ''
+    for value in values:
+        if isinstance(value, int):
+            encoded += f"{value:064x}"
+        else:
+            encoded += value.ljust((len(value) + 63) // 64 * 64, '0')
+    return encoded
+
+
+def address_word(address: str) -> str:
+    return address[2:].lower().rjust(64, '0')
+
+
+def test_encode_aggregate3_known_vector():
+    calls = [encode_get_eth_balance(HOLDER), encode_decimals(TOKEN)]
+    expected = '0x82ad56cb' + words(
+        0x20,                             # 参数 calls 的偏移
+        2,                                # 数组长度
+        0x40,                             # calls[0] 相对偏移（2个偏移字之后）
+        0x40 + 0xc0,                      # calls[1] 相对偏移（calls[0]占6个字）
+        # calls[0]: getEthBalance(HOLDER)，calldata 36字节，补齐到64字节
+        address_word(MULTICALL3_ADDRESS), 1, 0x60, 36, '4d2301cc' + address_word(HOLDER),
+        # calls[1]: decimals()，calldata 4字节，补齐到32字节
+        address_word(TOKEN), 1, 0x60, 4, '313ce567',
+    )
+    assert encode_aggregate3(calls) == expected
+
+
+def test_encode_aggregate3_empty():
+    assert encode_aggregate3([]) == '0x82ad56cb' + words(0x20, 0)
+
+
+def test_decode_aggregate3_known_vector():
+    balance = 12345 * 10 ** 18
+    result = '0x' + words(
+        0x20,
+        3,
+        0x60, 0x60 + 0x80, 0x60 + 0x80 + 0x60,
+        # (true, uint256)
+        1, 0x40, 32, balance,
+        # (false, 空bytes)：子调用失败
+        0, 0x40, 0,
+        # (true, 36字节)：长度不是32的整数倍，末尾补零不属于返回数据
+        1, 0x40, 36, 'deadbeef' * 9,
+    )
+    decoded = decode_aggregate3(result)
+    assert decoded == [
+        (True, balance.to_bytes(32, 'big')),
+        (False, b''),
+        (True, bytes.fromhex('deadbeef' * 9)),
+    ]
+    assert decode_uint256(decoded[0][1]) == balance
+
+
+def test_decode_aggregate3_without_prefix():
+    result = words(0x20, 1, 0x20, 1, 0x40, 32, 18)
+    assert decode_aggregate3(result) == [(True, (18).to_bytes(32, 'big'))]
+
+
+def test_aggregate3_round_trip():
+    calls = [
+        encode_get_eth_balance(HOLDER),
+        encode_balance_of(TOKEN, HOLDER),
+        encode_decimals(TOKEN),
+        encode_symbol(TOKEN),
+    ]
+    call_data = bytes.fromhex(encode_aggregate3(calls)[2 + 8:])
+    assert decode_aggregate3_calls(call_data) == [(target.lower(), bytes.fromhex(data)) for target, data in calls]
+
+    results = [
+        (True, (10 ** 18).to_bytes(32, 'big')),
+        (False, b''),
+        (True, (18).to_bytes(32, 'big')),
+        (True, bytes.fromhex(words(0x20, 4, b'USDT'.hex()))),
+    ]
+    decoded = decode_aggregate3(encode_aggregate3_results(results))
+    assert decoded == results
+    assert decode_string(decoded[3][1]) == 'USDT'
+
+
+def test_decode_aggregate3_truncated():
+    result = '0x' + words(0x20, 2, 0x40)
+    with pytest.raises(ValueError):
+        decode_aggregate3(result)
+
+
+def test_balance_of_calldata():
+    target, call_data = encode_balance_of(TOKEN, HOLDER)
+    assert target == TOKEN
+    assert call_data == '70a08231' + address_word(HOLDER)
+
+
+def test_decode_string_dynamic():
+    data = bytes.fromhex(words(0x20, 4, b'USDT'.hex()))
+    assert decode_string(data) == 'USDT'
+
+    # 超过32字节的字符串占多个字
+    name = 'Binance-Peg BSC-USD Token Long Name'
+    data = bytes.fromhex(words(0x20, len(name), name.encode().hex()))
+    assert decode_string(data) == name
+
+    assert decode_string(bytes.fromhex(words(0x20, 0))) == ''
+
+
+def test_decode_string_bytes32():
+    # 早期代币（如MKR）以bytes32返回symbol：右侧补零
+    assert decode_string(bytes.fromhex(words(b'MKR'.hex()))) == 'MKR'
+    assert decode_string(bytes(32)) == ''
+
+
+def test_decode_string_invalid():
+    with pytest.raises(ValueError):
+        decode_string(b'\x00' * 16)
+    # 偏移超出数据范围
+    with pytest.raises(ValueError):
+        decode_string(bytes.fromhex(words(0x80, 4)))
+    # 长度超出数据范围
+    with pytest.raises(ValueError):
+        decode_string(bytes.fromhex(words(0x20, 64, b'USDT'.hex())))
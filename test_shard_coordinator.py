@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""测试分片监控的租约分配和警告去重（两个worker共用一个临时数据库）"""
+
+import os
+import tempfile
+from shard_coordinator import ShardCoordinator
+from user_store import SQLiteUserStore
+
+PARTITIONS = 8
+TTL = 30
+
+
+def make_pair(db_path):
+    a = ShardCoordinator(db_path, worker_id='worker-a', partitions=PARTITIONS, lease_ttl=TTL)
+    b = ShardCoordinator(db_path, worker_id='worker-b', partitions=PARTITIONS, lease_ttl=TTL)
+    return a, b
+
+
+def assert_split(a, b):
+    """两个worker持有的分区不重叠，并且覆盖全部分区"""
+    assert not a.owned & b.owned
+    assert a.owned | b.owned == set(range(PARTITIONS))
+
+
+def test_join_splits_partitions():
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = make_pair(os.path.join(tmp, 'shards.db'))
+        assert a.heartbeat(now=100) == set(range(PARTITIONS))
+
+        # 新worker加入时分区仍由a持有，a下次续约时释放多出的部分，b再接管
+        assert b.heartbeat(now=101) == set()
+        assert len(a.heartbeat(now=102)) == PARTITIONS // 2
+        assert len(b.heartbeat(now=103)) == PARTITIONS // 2
+        assert_split(a, b)
+
+        # 稳定后继续续约，分配不变
+        owned_a, owned_b = set(a.owned), set(b.owned)
+        a.heartbeat(now=110)
+        b.heartbeat(now=111)
+        assert (a.owned, b.owned) == (owned_a, owned_b)
+        a.close()
+        b.close()
+
+
+def test_leave_hands_over_immediately():
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = make_pair(os.path.join(tmp, 'shards.db'))
+        a.heartbeat(now=100)
+        b.heartbeat(now=101)
+        a.heartbeat(now=102)
+        b.heartbeat(now=103)
+        assert_split(a, b)
+
+        # 正常退出：不必等待租约过期
+        b.leave()
+        assert b.owned == set()
+        assert a.heartbeat(now=104) == set(range(PARTITIONS))
+        a.close()
+        b.close()
+
+
+def test_expired_worker_is_taken_over():
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = make_pair(os.path.join(tmp, 'shards.db'))
+        a.heartbeat(now=100)
+        b.heartbeat(now=101)
+        a.heartbeat(now=102)
+        b.heartbeat(now=103)
+        owned_b = set(b.owned)
+        assert owned_b
+
+        # b失联：租约到期前a不能接管b的分区
+        assert a.heartbeat(now=103 + TTL - 1) & owned_b == set()
+        # 租约到期后b被视为退出，a接管全部分区
+        assert a.heartbeat(now=103 + TTL + 1) == set(range(PARTITIONS))
+        assert a.live_workers == 1
+        a.close()
+        b.close()
+
+
+def test_claim_alerts_is_exclusive():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'users.db')
+        first = SQLiteUserStore(db_path)
+        second = SQLiteUserStore(db_path)
+        alert = [(1, '0xaa', 1000.0)]
+
+        # 两个进程在同一轮判断同一订阅：只有一个申请成功
+        assert first.claim_alerts(alert, 100, 0) == {(1, '0xaa')}
+        assert second.claim_alerts(alert, 100, 0) == set()
+        # 冷却期内不再申请成功，冷却期过后可以
+        assert second.claim_alerts([(1, '0xaa', 1050.0)], 100, 0) == set()
+        assert second.claim_alerts([(1, '0xaa', 1101.0)], 100, 0) == {(1, '0xaa')}
+
+        # 撤销只影响对应时间的申请：旧时间的撤销不生效，撤销后可以重新申请
+        first.release_alert(1, '0xaa', 1000.0)
+        assert first.claim_alerts([(1, '0xaa', 1102.0)], 100, 0) == set()
+        second.release_alert(1, '0xaa', 1101.0)
+        assert first.claim_alerts([(1, '0xaa', 1102.0)], 100, 0) == {(1, '0xaa')}
+        first.close()
+        second.close()
+
+
+if __name__ == "__main__":
+    test_join_splits_partitions()
+    test_leave_hands_over_immediately()
+    test_expired_worker_is_taken_over()
+    test_claim_alerts_is_exclusive()
+    print("✅ 测试成功！")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""测试批量阈值判断：NumPy向量化结果与纯Python实现在边界值上一致"""
+
+import pytest
+import threshold_eval
+from threshold_eval import ThresholdPairs
+from units import WEI_PER_UNIT
+
+ADDRESS = '0x' + '11' * 20
+
+# (阈值wei, 余额wei) 覆盖相等、相差1 wei、超出int64（2**63以上）和小数部分进位/借位的情况
+CASES = [
+    (0, 0),
+    (1, 0),
+    (WEI_PER_UNIT, WEI_PER_UNIT),
+    (WEI_PER_UNIT, WEI_PER_UNIT - 1),
+    (WEI_PER_UNIT, WEI_PER_UNIT + 1),
+    (5 * 10 ** 16, 5 * 10 ** 16),
+    (5 * 10 ** 16, 5 * 10 ** 16 - 1),
+    (2 ** 63, 2 ** 63),
+    (2 ** 63, 2 ** 63 - 1),
+    (2 ** 63 + 1, 2 ** 63),
+    (2 ** 64 + 7, 2 ** 64 + 6),
+    (2 ** 64 + 7, 2 ** 64 + 8),
+    (10 ** 30, 10 ** 30 - 1),
+    (10 ** 30, 10 ** 30),
+    # 整数部分相同，只有小数部分不同
+    (3 * WEI_PER_UNIT + WEI_PER_UNIT - 1, 3 * WEI_PER_UNIT + WEI_PER_UNIT - 2),
+    (3 * WEI_PER_UNIT + WEI_PER_UNIT - 1, 3 * WEI_PER_UNIT + WEI_PER_UNIT - 1),
+    # 小数部分更大但整数部分更小
+    (4 * WEI_PER_UNIT, 3 * WEI_PER_UNIT + WEI_PER_UNIT - 1),
+    (4 * WEI_PER_UNIT + 1, 4 * WEI_PER_UNIT),
+    (3 * WEI_PER_UNIT + WEI_PER_UNIT - 1, 4 * WEI_PER_UNIT),
+]
+
+
+def evaluate_each():
+    """逐个边界值判断，返回 [(阈值, 余额, 是否触发)]"""
+    results = []
+    for threshold_wei, balance_wei in CASES:
+        pairs = ThresholdPairs({ADDRESS: {1: threshold_wei}})
+        triggered = pairs.evaluate({ADDRESS: balance_wei})
+        results.append((threshold_wei, balance_wei, bool(triggered)))
+        if triggered:
+            assert triggered == [(1, ADDRESS, balance_wei, threshold_wei)]
+            assert isinstance(triggered[0][0], int)
+    return results
+
+
+def test_python_fallback_boundaries(monkeypatch):
+    monkeypatch.setattr(threshold_eval, 'np', None)
+    for threshold_wei, balance_wei, triggered in evaluate_each():
+        assert triggered == (balance_wei < threshold_wei), (threshold_wei, balance_wei)
+
+
+def test_numpy_matches_fallback(monkeypatch):
+    if threshold_eval.np is None:
+        pytest.skip("NumPy not installed")
+    vectorized = evaluate_each()
+    monkeypatch.setattr(threshold_eval, 'np', None)
+    assert vectorized == evaluate_each()
+
+
+def test_numpy_matches_fallback_many_pairs(monkeypatch):
+    """多个地址、多个用户同时判断，结果（包括顺序）一致"""
+    address_index = {}
+    balances = {}
+    for i, (threshold_wei, balance_wei) in enumerate(CASES):
+        address = '0x%040x' % (i + 1)
+        address_index[address] = {10 + i: threshold_wei, 1000 + i: balance_wei}
+        balances[address] = balance_wei
+    # 没有余额数据的地址不触发
+    address_index['0x' + 'ff' * 20] = {1: 10 ** 30}
+
+    vectorized = ThresholdPairs(address_index).evaluate(balances)
+    monkeypatch.setattr(threshold_eval, 'np', None)
+    fallback = ThresholdPairs(address_index).evaluate(balances)
+    assert vectorized == fallback
+    assert len(fallback) == sum(1 for threshold_wei, balance_wei in CASES if balance_wei < threshold_wei)
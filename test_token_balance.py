@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """测试USDT和USDC余额查询功能"""
 
+import asyncio
 from bsc_api import BSCBalanceChecker
+from units import format_units
 
-def test_token_balances():
+async def run_token_balances_test():
     checker = BSCBalanceChecker()
 
     # 测试地址（一个有USDT/USDC余额的地址）
@@ -14,16 +16,21 @@ def test_token_balances():
 
     try:
         # 获取所有余额
-        balances = checker.get_all_balances(test_address)
+        balances = await checker.get_all_balances(test_address)
 
-        print(f"💰 BNB:  {balances['BNB']:.6f}")
-        print(f"💵 USDT: {balances['USDT']:.2f}")
-        print(f"💵 USDC: {balances['USDC']:.2f}")
+        print(f"💰 BNB:  {format_units(balances['BNB'])}")
+        print(f"💵 USDT: {format_units(balances['USDT'], 2)}")
+        print(f"💵 USDC: {format_units(balances['USDC'], 2)}")
         print()
         print("✅ 测试成功！")
 
     except Exception as e:
         print(f"❌ 测试失败: {str(e)}")
+    finally:
+        await checker.close_session()
+
+def test_token_balances():
+    asyncio.run(run_token_balances_test())
 
 if __name__ == "__main__":
-    test_token_balances()
+    test_token_balances()
\ No newline at end of file
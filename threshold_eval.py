@@ -0,0 +1,79 @@
+"""
+批量阈值判断
+把地址倒排索引展开为 (地址, 用户, 阈值) 订阅对的扁平数组，一轮检查的全部余额一次性与阈值比较。
+wei可能超出int64范围，比较时拆成 (整数部分, 小数部分) 两个int64按字典序比较，结果精确。
+安装了NumPy时使用向量化计算，否则退化为纯Python循环
+"""
+
+from typing import Dict, List, Tuple
+from units import WEI_PER_UNIT
+
+try:
+    import numpy as np
+except ImportError:  # NumPy是可选依赖
+    np = None
+
+
+class ThresholdPairs:
+    def __init__(self, address_index: Dict[str, Dict[int, int]]):
+        """address_index: 地址 -> {user_id: 阈值wei}"""
+        self.addresses: List[str] = list(address_index)
+        self.positions = {address: i for i, address in enumerate(self.addresses)}
+
+        pair_address = []
+        pair_user = []
+        self.pair_threshold: List[int] = []
+        for position, subscribers in enumerate(address_index.values()):
+            for user_id, threshold_wei in subscribers.items():
+                pair_address.append(position)
+                pair_user.append(user_id)
+                self.pair_threshold.append(threshold_wei)
+        self.size = len(pair_user)
+
+        if np is not None:
+            self.pair_address = np.array(pair_address, dtype=np.int64)
+            self.pair_user = np.array(pair_user, dtype=np.int64)
+            self.threshold_high = np.array([t // WEI_PER_UNIT for t in self.pair_threshold], dtype=np.int64)
+            self.threshold_low = np.array([t % WEI_PER_UNIT for t in self.pair_threshold], dtype=np.int64)
+        else:
+            self.pair_address = pair_address
+            self.pair_user = pair_user
+
+    def evaluate(self, balances: Dict[str, int]) -> List[Tuple[int, str, int, int]]:
+        """返回余额低于阈值的订阅 [(user_id, 地址, 余额wei, 阈值wei), ...]，按地址顺序；balances中没有的地址跳过"""
+        if not self.size or not balances:
+            return []
+        if np is None:
+            return self._evaluate_python(balances)
+
+        count = len(self.addresses)
+        high = np.zeros(count, dtype=np.int64)
+        low = np.zeros(count, dtype=np.int64)
+        present = np.zeros(count, dtype=bool)
+        for address, wei in balances.items():
+            position = self.positions.get(address)
+            if position is not None:
+                high[position], low[position] = divmod(wei, WEI_PER_UNIT)
+                present[position] = True
+
+        pair_high = high[self.pair_address]
+        pair_low = low[self.pair_address]
+        below = present[self.pair_address] & (
+            (pair_high < self.threshold_high)
+            | ((pair_high == self.threshold_high) & (pair_low < self.threshold_low))
+        )
+
+        triggered = []
+        for i in np.flatnonzero(below).tolist():
+            address = self.addresses[self.pair_address[i]]
+            triggered.append((int(self.pair_user[i]), address, balances[address], self.pair_threshold[i]))
+        return triggered
+
+    def _evaluate_python(self, balances: Dict[str, int]) -> List[Tuple[int, str, int, int]]:
+        triggered = []
+        for i in range(self.size):
+            address = self.addresses[self.pair_address[i]]
+            balance = balances.get(address)
+            if balance is not None and balance < self.pair_threshold[i]:
+                triggered.append((self.pair_user[i], address, balance, self.pair_threshold[i]))
+        return triggered
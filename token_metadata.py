@@ -0,0 +1,65 @@
+"""
+代币元数据缓存
+每个BEP-20合约的decimals()和symbol()只在第一次用到时通过Multicall3读取一次，之后持久化到本地JSON文件，
+重启后直接复用（这两个值在合约部署后不会变化）
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+from config import TOKEN_METADATA_FILE
+
+
+class TokenMetadataCache:
+    def __init__(self, path: str = TOKEN_METADATA_FILE):
+        self.path = path
+        self.tokens: Dict[str, dict] = {}  # 合约地址（小写） -> {'symbol': str, 'decimals': int}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error loading token metadata: {e}")
+            return
+        for contract, metadata in data.items():
+            self.tokens[contract.lower()] = {'symbol': str(metadata['symbol']), 'decimals': int(metadata['decimals'])}
+
+    def save(self):
+        """先写临时文件再替换，避免进程中断时留下损坏的文件"""
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.tokens, f, indent=2, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except IOError as e:
+            print(f"Error saving token metadata: {e}")
+
+    def get(self, contract: str) -> Optional[dict]:
+        return self.tokens.get(contract.lower())
+
+    def missing(self, contracts: Iterable[str]) -> List[str]:
+        """返回尚未缓存元数据的合约地址（小写，去重）"""
+        return [contract for contract in dict.fromkeys(c.lower() for c in contracts) if contract not in self.tokens]
+
+    def update(self, entries: Dict[str, dict]):
+        """写入新读取的元数据并持久化"""
+        if not entries:
+            return
+        for contract, metadata in entries.items():
+            self.tokens[contract.lower()] = metadata
+        self.save()
+
+
+_shared_metadata = None
+
+
+def get_token_metadata_cache() -> TokenMetadataCache:
+    """获取进程内共享的代币元数据缓存"""
+    global _shared_metadata
+    if _shared_metadata is None:
+        _shared_metadata = TokenMetadataCache()
+    return _shared_metadata
@@ -0,0 +1,140 @@
+"""
+USDT/USDC余额增量跟踪
+启动时通过Multicall3读取一次balanceOf，之后按区块范围拉取TOKEN_CONTRACTS的Transfer事件，
+把转入/转出金额应用到本地余额表；定期重新读取balanceOf进行校准
+"""
+
+import time
+from typing import Dict, Iterable, Optional, Tuple
+from config import (
+    TOKEN_CONTRACTS, TOKEN_LOG_MAX_RANGE, TOKEN_LOG_CONFIRMATIONS, TOKEN_LOG_TOPIC_CHUNK,
+    TOKEN_RECONCILE_INTERVAL, TOKEN_TRACKER_MAX_STALENESS,
+)
+
+# Transfer(address,address,uint256) 事件签名
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+
+def address_topic(address: str) -> str:
+    """地址编码为32字节的topic"""
+    return '0x' + address[2:].lower().zfill(64)
+
+
+class TokenBalanceTracker:
+    def __init__(self, balance_checker, tokens: Optional[Dict[str, str]] = None):
+        self.balance_checker = balance_checker
+        self.tokens = dict(tokens or TOKEN_CONTRACTS)  # 符号 -> 合约地址
+        self.symbols_by_contract = {contract.lower(): symbol for symbol, contract in self.tokens.items()}
+        self.balances: Dict[Tuple[str, str], int] = {}  # (地址, 符号) -> 最小单位余额
+        self.tracked = set()                             # 已完成初始读取的地址
+        self.last_block: Optional[int] = None            # 已应用到余额表的最新区块
+        self.synced_at = 0.0
+        self.last_reconcile = 0.0
+
+    def get_balances(self, address: str) -> Optional[Dict[str, int]]:
+        """读取本地余额表（最小单位的整数）；地址未跟踪或数据过旧时返回None"""
+        address = address.lower()
+        if address not in self.tracked or time.time() - self.synced_at > TOKEN_TRACKER_MAX_STALENESS:
+            return None
+        return {symbol: self.balances.get((address, symbol), 0) for symbol in self.tokens}
+
+    async def sync(self, watched: Iterable[str]):
+        """同步到最新的已确认区块：为新地址做初始读取，应用Transfer日志，必要时校准"""
+        watched = {address.lower() for address in watched}
+        target = await self.balance_checker.get_block_number() - TOKEN_LOG_CONFIRMATIONS
+
+        # 不再监控的地址直接丢弃
+        for address in self.tracked - watched:
+            self.tracked.discard(address)
+            for symbol in self.tokens:
+                self.balances.pop((address, symbol), None)
+
+        if self.last_block is None:
+            # 首次同步：初始读取即为最新的校准结果
+            self.last_block = target
+            self.last_reconcile = time.time()
+
+        # 新地址：在已同步区块上读取balanceOf，之后的变化由日志补上
+        new_addresses = watched - self.tracked
+        if new_addresses:
+            await self._load_balances(new_addresses, self.last_block)
+
+        # 逐段拉取Transfer日志，每次最多TOKEN_LOG_MAX_RANGE个区块
+        while self.last_block < target:
+            end = min(target, self.last_block + TOKEN_LOG_MAX_RANGE)
+            await self._apply_logs(self.last_block + 1, end)
+            self.last_block = end
+
+        self.synced_at = time.time()
+
+        if self.tracked and time.time() - self.last_reconcile >= TOKEN_RECONCILE_INTERVAL:
+            await self.reconcile()
+
+    async def reconcile(self):
+        """重新读取所有跟踪地址的balanceOf，修正日志遗漏（如重组）造成的偏差"""
+        drifted = await self._load_balances(self.tracked, self.last_block)
+        self.last_reconcile = time.time()
+        if drifted:
+            print(f"⚠️ Token tracker reconciled {drifted} drifted balances at block {self.last_block}")
+
+    async def _load_balances(self, addresses, block_number: int) -> int:
+        """在指定区块读取余额写入本地表，返回与原值不一致的条目数"""
+        balances, errors = await self.balance_checker.get_all_balances_raw(list(addresses), block_tag=hex(block_number))
+        if errors:
+            print(f"⚠️ Token tracker failed to load {len(errors)} addresses")
+
+        drifted = 0
+        for address, address_balances in balances.items():
+            address = address.lower()
+            for symbol in self.tokens:
+                key = (address, symbol)
+                value = address_balances.get(symbol, 0)
+                if address in self.tracked and self.balances.get(key, 0) != value:
+                    drifted += 1
+                self.balances[key] = value
+            self.tracked.add(address)
+        return drifted
+
+    async def _apply_logs(self, from_block: int, to_block: int):
+        """拉取区块范围内涉及跟踪地址的Transfer事件并应用到余额表"""
+        if not self.tracked:
+            return
+
+        contracts = list(self.tokens.values())
+        topics = [address_topic(address) for address in sorted(self.tracked)]
+        filters = []
+        for start in range(0, len(topics), TOKEN_LOG_TOPIC_CHUNK):
+            chunk = topics[start:start + TOKEN_LOG_TOPIC_CHUNK]
+            base = {'fromBlock': hex(from_block), 'toBlock': hex(to_block), 'address': contracts}
+            # topic位置之间是AND关系，转出和转入需要分别查询
+            filters.append({**base, 'topics': [TRANSFER_TOPIC, chunk]})
+            filters.append({**base, 'topics': [TRANSFER_TOPIC, None, chunk]})
+
+        logs, failed = await self.balance_checker.get_logs(filters)
+        if failed:
+            # 保持last_block不变，下次重新拉取这一段
+            raise Exception(f"eth_getLogs failed for {failed} filters in blocks {from_block}-{to_block}")
+
+        seen = set()
+        for log in logs:
+            # 同一笔转账可能同时命中转出和转入两个查询
+            log_id = (log.get('transactionHash'), log.get('logIndex'))
+            if log_id in seen or log.get('removed'):
+                continue
+            seen.add(log_id)
+
+            symbol = self.symbols_by_contract.get((log.get('address') or '').lower())
+            log_topics = log.get('topics') or []
+            if symbol is None or len(log_topics) < 3:
+                continue
+            try:
+                value = int(log.get('data') or '0x0', 16)
+            except ValueError:
+                continue
+
+            sender = '0x' + log_topics[1][-40:].lower()
+            recipient = '0x' + log_topics[2][-40:].lower()
+            if sender in self.tracked:
+                self.balances[(sender, symbol)] = self.balances.get((sender, symbol), 0) - value
+            if recipient in self.tracked:
+                self.balances[(recipient, symbol)] = self.balances.get((recipient, symbol), 0) + value
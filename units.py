@@ -0,0 +1,48 @@
+"""
+余额单位换算
+程序内部的余额和阈值一律使用整数wei（BNB、USDT、USDC都是18位小数），
+只在解析用户输入和生成显示文本时与十进制数互相转换，避免浮点误差
+"""
+
+from decimal import Decimal, DecimalException, ROUND_DOWN, localcontext
+
+DECIMALS = 18
+WEI_PER_UNIT = 10 ** DECIMALS
+MAX_AMOUNT_EXPONENT = 60  # uint256最多约1.2e77 wei，即约1.2e59个单位；更大的数量直接拒绝
+
+
+def to_wei(amount) -> int:
+    """把十进制数量（字符串、int、Decimal或float）转换为wei，超出18位的小数部分舍去
+
+    无效或数量级过大的输入（如 1e999999）一律抛出ValueError
+    """
+    try:
+        value = Decimal(str(amount).strip())
+        if not value.is_finite() or value.adjusted() > MAX_AMOUNT_EXPONENT:
+            raise ValueError(f"Invalid amount: {amount}")
+        with localcontext() as ctx:
+            ctx.prec = 100  # 足够精确表示uint256范围内的wei，乘法不会被舍入
+            return int((value * WEI_PER_UNIT).to_integral_value(rounding=ROUND_DOWN))
+    except DecimalException:
+        raise ValueError(f"Invalid amount: {amount}")
+
+
+def from_wei(wei: int) -> float:
+    """wei转换为浮点数（仅用于速率估算等不要求精确的计算）"""
+    return wei / WEI_PER_UNIT
+
+
+def format_units(wei: int, places: int = 6, decimals: int = DECIMALS) -> str:
+    """按固定小数位数格式化（向下截断，低于阈值的余额不会被显示成等于阈值）
+
+    decimals: 代币的小数位数（自选代币从元数据缓存读取，BNB/USDT/USDC均为18）
+    """
+    with localcontext() as ctx:
+        ctx.prec = 100  # uint256最多78位十进制数，避免quantize超出默认精度
+        value = Decimal(wei).scaleb(-decimals).quantize(Decimal(1).scaleb(-places), rounding=ROUND_DOWN)
+    return f"{value:.{places}f}"
+
+
+def format_amount(wei: int) -> str:
+    """按最简形式格式化（用于阈值等用户输入的数值，例如 0.05）"""
+    return f"{(Decimal(wei) / WEI_PER_UNIT).normalize():f}"
@@ -1,15 +1,113 @@
 import json
 import os
-from typing import List, Set
-from config import USER_DATA_FILE
+from typing import Dict, Iterable, List, Set, Tuple
+from config import (
+    USER_DATA_FILE, USER_STORAGE_BACKEND, USER_DB_FILE, LOW_BALANCE_THRESHOLD_WEI, MAX_WATCHED_TOKENS,
+    ALERT_COOLDOWN,
+)
+from user_store import SQLiteUserStore, user_threshold_wei
+from threshold_eval import ThresholdPairs
 
 class UserManager:
     def __init__(self):
         self.data_file = USER_DATA_FILE
+        self.store = None
+        self.change_seq = 0  # 已加载到的user_changes序号（SQLite存储，增量重新加载用）
+        if USER_STORAGE_BACKEND == 'sqlite':
+            self.store = SQLiteUserStore(USER_DB_FILE)
+            self.migrate_from_json()
+            self.change_seq = self.store.change_seq()
         self.users_data = self.load_data()
-    
+        # 倒排索引：地址 -> {user_id: 阈值wei}，随增删地址和设置阈值原地更新
+        self.address_index: Dict[str, Dict[int, int]] = {}
+        # 由倒排索引展开的订阅对数组（批量阈值判断用），索引变化时置空、下次使用时重建
+        self._threshold_pairs = None
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        """根据users_data重建地址倒排索引"""
+        self.address_index = {}
+        self._threshold_pairs = None
+        for user_id_str, user_data in self.users_data.items():
+            user_id = int(user_id_str)
+            threshold_wei = user_data['threshold_wei']
+            for address in user_data['addresses']:
+                self.address_index.setdefault(address, {})[user_id] = threshold_wei
+
+    def reload(self):
+        """重新从SQLite加载其他进程修改过的用户数据（分片监控时其他进程增删的地址和阈值）"""
+        self.apply_changes(self.fetch_changes())
+
+    def fetch_changes(self):
+        """读取上次加载后被修改过的用户（只读数据库、不修改内存数据，可以在线程中执行）"""
+        return self.store.conn.total_changes, self.store.load_changes(self.change_seq, LOW_BALANCE_THRESHOLD_WEI)
+
+    def apply_changes(self, changes) -> bool:
+        """把fetch_changes读到的修改合并到内存数据和倒排索引中，只更新被修改的用户，返回是否已合并
+
+        读取期间本进程自己写过数据库时，读到的快照可能比内存旧，放弃本次合并（下次重新读取）
+        """
+        total_changes, (seq, user_ids, users) = changes
+        if total_changes != self.store.conn.total_changes:
+            return False
+        if user_ids is None:
+            self.users_data = users
+            self.rebuild_index()
+        elif user_ids:
+            for user_id in user_ids:
+                user_id_str = str(user_id)
+                old = self.users_data.pop(user_id_str, None)
+                if old is not None:
+                    for address in old['addresses']:
+                        subscribers = self.address_index.get(address)
+                        if subscribers is not None:
+                            subscribers.pop(user_id, None)
+                            if not subscribers:
+                                del self.address_index[address]
+                user_data = users.get(user_id_str)
+                if user_data is not None:
+                    self.users_data[user_id_str] = user_data
+                    for address in user_data['addresses']:
+                        self.address_index.setdefault(address, {})[user_id] = user_data['threshold_wei']
+            self._threshold_pairs = None
+        self.change_seq = max(self.change_seq, seq)
+        return True
+
+    def get_threshold_pairs(self) -> ThresholdPairs:
+        """获取当前所有订阅的 (地址, 用户, 阈值) 数组"""
+        if self._threshold_pairs is None:
+            self._threshold_pairs = ThresholdPairs(self.address_index)
+        return self._threshold_pairs
+
+    def migrate_from_json(self):
+        """一次性把旧的JSON用户数据迁移到SQLite（仅在数据库为空时执行）"""
+        if not self.store.is_empty() or not os.path.exists(self.data_file):
+            return
+        users_data = self.load_json_data()
+        if not users_data:
+            return
+        self.store.import_users(users_data, LOW_BALANCE_THRESHOLD_WEI)
+        migrated_file = f"{self.data_file}.migrated"
+        try:
+            os.replace(self.data_file, migrated_file)
+        except OSError as e:
+            print(f"Warning: could not rename {self.data_file}: {e}")
+        print(f"📦 Migrated {len(users_data)} users from {self.data_file} to {USER_DB_FILE}")
+
     def load_data(self) -> dict:
-        """从文件加载用户数据"""
+        """加载用户数据"""
+        if self.store is not None:
+            return self.store.load_all(LOW_BALANCE_THRESHOLD_WEI)
+        users_data = self.load_json_data()
+        # 旧数据的阈值是BNB浮点数，统一换算为wei
+        for user_data in users_data.values():
+            user_data['threshold_wei'] = user_threshold_wei(user_data, LOW_BALANCE_THRESHOLD_WEI)
+            user_data.pop('threshold', None)
+            user_data.setdefault('tokens', [])
+        return users_data
+
+    def load_json_data(self) -> dict:
+        """从JSON文件加载用户数据"""
         if os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r', encoding='utf-8') as f:
@@ -20,7 +118,9 @@ class UserManager:
         return {}
     
     def save_data(self):
-        """保存用户数据到文件"""
+        """保存用户数据到文件（仅JSON存储；SQLite存储在每次修改时按行写入）"""
+        if self.store is not None:
+            return
         try:
             with open(self.data_file, 'w', encoding='utf-8') as f:
                 json.dump(self.users_data, f, indent=2, ensure_ascii=False)
@@ -36,14 +136,21 @@ class UserManager:
             self.users_data[user_id_str] = {
                 'addresses': [],
                 'last_alert': {},
-                'threshold': 0.05  # 默认阈值
+                'threshold_wei': LOW_BALANCE_THRESHOLD_WEI,  # 默认阈值
+                'tokens': []
             }
 
         addresses = self.users_data[user_id_str]['addresses']
 
         if address not in addresses:
             addresses.append(address)
-            self.save_data()
+            threshold_wei = self.users_data[user_id_str]['threshold_wei']
+            self.address_index.setdefault(address, {})[user_id] = threshold_wei
+            self._threshold_pairs = None
+            if self.store is not None:
+                self.store.add_address(user_id, address, threshold_wei)
+            else:
+                self.save_data()
             return True
         return False
     
@@ -56,10 +163,19 @@ class UserManager:
             addresses = self.users_data[user_id_str]['addresses']
             if address in addresses:
                 addresses.remove(address)
+                subscribers = self.address_index.get(address)
+                if subscribers is not None:
+                    subscribers.pop(user_id, None)
+                    if not subscribers:
+                        del self.address_index[address]
+                self._threshold_pairs = None
                 # 同时移除该地址的警告记录
                 if address in self.users_data[user_id_str]['last_alert']:
                     del self.users_data[user_id_str]['last_alert'][address]
-                self.save_data()
+                if self.store is not None:
+                    self.store.remove_address(user_id, address)
+                else:
+                    self.save_data()
                 return True
         return False
     
@@ -76,10 +192,11 @@ class UserManager:
     
     def get_all_addresses(self) -> Set[str]:
         """获取所有被监控的地址"""
-        all_addresses = set()
-        for user_data in self.users_data.values():
-            all_addresses.update(user_data['addresses'])
-        return all_addresses
+        return set(self.address_index.keys())
+
+    def get_address_subscribers(self, address: str) -> Dict[int, int]:
+        """获取监控该地址的用户及其阈值 {user_id: 阈值wei}"""
+        return self.address_index.get(address.lower(), {})
     
     def should_send_alert(self, user_id: int, address: str, current_time: float) -> bool:
         """检查是否应该发送警告（避免重复发送）"""
@@ -90,8 +207,8 @@ class UserManager:
             return True
         
         last_alert_time = self.users_data[user_id_str]['last_alert'].get(address, 0)
-        # 24小时内不重复发送同一地址的警告
-        return current_time - last_alert_time > 24 * 3600
+        # ALERT_COOLDOWN（24小时）内不重复发送同一地址的警告
+        return current_time - last_alert_time > ALERT_COOLDOWN
     
     def record_alert(self, user_id: int, address: str, current_time: float):
         """记录警告发送时间"""
@@ -102,43 +219,131 @@ class UserManager:
             self.users_data[user_id_str] = {
                 'addresses': [],
                 'last_alert': {},
-                'threshold': 0.05
+                'threshold_wei': LOW_BALANCE_THRESHOLD_WEI,
+                'tokens': []
             }
 
         self.users_data[user_id_str]['last_alert'][address] = current_time
-        self.save_data()
-    
+        if self.store is not None:
+            self.store.record_alerts([(user_id, address, current_time)], LOW_BALANCE_THRESHOLD_WEI)
+        else:
+            self.save_data()
+
+    def claim_alerts(self, candidates: Iterable[Tuple[int, str]], current_time: float) -> Set[Tuple[int, str]]:
+        """为一轮检查中低于阈值的订阅批量申请发送警告，返回应由本进程发送的 (user_id, address)
+
+        SQLite存储时在一个事务中条件写入警告时间，多个监控进程之间每条警告只会被一个进程申请成功；
+        JSON存储时按内存中的警告时间判断
+        """
+        candidates = [(user_id, address.lower()) for user_id, address in candidates]
+        if self.store is not None:
+            claimed = self.store.claim_alerts(
+                [(user_id, address, current_time) for user_id, address in candidates],
+                ALERT_COOLDOWN, LOW_BALANCE_THRESHOLD_WEI,
+            )
+        else:
+            claimed = {(user_id, address) for user_id, address in candidates
+                       if self.should_send_alert(user_id, address, current_time)}
+
+        for user_id, address in claimed:
+            user_data = self.users_data.setdefault(str(user_id), {
+                'addresses': [],
+                'last_alert': {},
+                'threshold_wei': LOW_BALANCE_THRESHOLD_WEI,
+                'tokens': []
+            })
+            user_data['last_alert'][address] = current_time
+        if claimed and self.store is None:
+            self.save_data()
+        return claimed
+
+    def release_alert(self, user_id: int, address: str, current_time: float):
+        """撤销claim_alerts申请到但没有发出的警告，下一轮检查可以重新发送"""
+        address = address.lower()
+        last_alert = self.users_data.get(str(user_id), {}).get('last_alert', {})
+        if last_alert.get(address) == current_time:
+            del last_alert[address]
+        if self.store is not None:
+            self.store.release_alert(user_id, address, current_time)
+        else:
+            self.save_data()
+
     def get_user_addresses_mapping(self) -> dict:
         """获取地址到用户的映射"""
-        address_to_users = {}
-        for user_id_str, user_data in self.users_data.items():
-            user_id = int(user_id_str)
-            for address in user_data['addresses']:
-                if address not in address_to_users:
-                    address_to_users[address] = []
-                address_to_users[address].append(user_id)
-        return address_to_users
+        return {address: list(subscribers.keys()) for address, subscribers in self.address_index.items()}
 
-    def get_threshold(self, user_id: int) -> float:
-        """获取用户的余额阈值"""
+    def get_tokens(self, user_id: int) -> List[str]:
+        """获取用户关注的代币合约地址列表"""
         user_id_str = str(user_id)
         if user_id_str in self.users_data:
-            # 兼容旧数据，如果没有threshold字段则返回默认值
-            return self.users_data[user_id_str].get('threshold', 0.05)
-        return 0.05
+            return list(self.users_data[user_id_str].get('tokens', []))
+        return []
 
-    def set_threshold(self, user_id: int, threshold: float) -> bool:
-        """设置用户的余额阈值"""
+    def add_token(self, user_id: int, contract: str) -> bool:
+        """关注代币，已关注或达到MAX_WATCHED_TOKENS时返回False"""
         user_id_str = str(user_id)
+        contract = contract.lower()
 
         if user_id_str not in self.users_data:
             self.users_data[user_id_str] = {
                 'addresses': [],
                 'last_alert': {},
-                'threshold': threshold
+                'threshold_wei': LOW_BALANCE_THRESHOLD_WEI,
+                'tokens': []
             }
+
+        tokens = self.users_data[user_id_str].setdefault('tokens', [])
+        if contract in tokens or len(tokens) >= MAX_WATCHED_TOKENS:
+            return False
+        tokens.append(contract)
+        if self.store is not None:
+            self.store.add_token(user_id, contract, self.users_data[user_id_str]['threshold_wei'])
         else:
-            self.users_data[user_id_str]['threshold'] = threshold
+            self.save_data()
+        return True
+
+    def remove_token(self, user_id: int, contract: str) -> bool:
+        """取消关注代币"""
+        user_id_str = str(user_id)
+        contract = contract.lower()
 
-        self.save_data()
+        tokens = self.users_data.get(user_id_str, {}).get('tokens', [])
+        if contract not in tokens:
+            return False
+        tokens.remove(contract)
+        if self.store is not None:
+            self.store.remove_token(user_id, contract)
+        else:
+            self.save_data()
+        return True
+
+    def get_threshold(self, user_id: int) -> int:
+        """获取用户的余额阈值（wei）"""
+        user_id_str = str(user_id)
+        if user_id_str in self.users_data:
+            return self.users_data[user_id_str]['threshold_wei']
+        return LOW_BALANCE_THRESHOLD_WEI
+
+    def set_threshold(self, user_id: int, threshold_wei: int) -> bool:
+        """设置用户的余额阈值（wei）"""
+        user_id_str = str(user_id)
+
+        if user_id_str not in self.users_data:
+            self.users_data[user_id_str] = {
+                'addresses': [],
+                'last_alert': {},
+                'threshold_wei': threshold_wei,
+                'tokens': []
+            }
+        else:
+            self.users_data[user_id_str]['threshold_wei'] = threshold_wei
+
+        for address in self.users_data[user_id_str]['addresses']:
+            self.address_index.setdefault(address, {})[user_id] = threshold_wei
+        self._threshold_pairs = None
+
+        if self.store is not None:
+            self.store.set_threshold(user_id, threshold_wei)
+        else:
+            self.save_data()
         return True
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""
+SQLite用户数据存储（WAL模式）
+用户、监控地址和警告时间分表存储，每次修改只写入受影响的行。
+阈值以wei的十进制字符串保存在threshold_wei列（超出SQLite的64位整数范围），
+threshold列只保留对应的BNB数值便于人工查看。
+users/addresses/tokens的修改由触发器记录到user_changes（只保留最近USER_CHANGES_KEEP条），
+多个进程共用数据库时据此只重新加载被修改过的用户
+"""
+
+import sqlite3
+from typing import Iterable, List, Optional, Set, Tuple
+from units import to_wei, from_wei
+
+USER_CHANGES_KEEP = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id       INTEGER PRIMARY KEY,
+    threshold     REAL NOT NULL,
+    threshold_wei TEXT
+);
+CREATE TABLE IF NOT EXISTS addresses (
+    user_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    PRIMARY KEY (user_id, address)
+);
+CREATE INDEX IF NOT EXISTS idx_addresses_address ON addresses(address);
+CREATE TABLE IF NOT EXISTS tokens (
+    user_id  INTEGER NOT NULL,
+    contract TEXT NOT NULL,
+    PRIMARY KEY (user_id, contract)
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    user_id    INTEGER NOT NULL,
+    address    TEXT NOT NULL,
+    last_alert REAL NOT NULL,
+    PRIMARY KEY (user_id, address)
+);
+CREATE TABLE IF NOT EXISTS user_changes (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS user_changes_prune AFTER INSERT ON user_changes BEGIN
+    DELETE FROM user_changes WHERE seq <= NEW.seq - %(keep)d;
+END;
+""" % {'keep': USER_CHANGES_KEEP} + "".join(
+    f"""
+CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_changes AFTER {event} ON {table} BEGIN
+    INSERT INTO user_changes (user_id) VALUES ({row}.user_id);
+END;
+"""
+    for table in ('users', 'addresses', 'tokens')
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'))
+)
+
+
+def user_threshold_wei(user_data: dict, default_wei: int) -> int:
+    """读取用户数据中的阈值（wei），兼容只有threshold（BNB浮点数）的旧数据"""
+    if user_data.get('threshold_wei') is not None:
+        return int(user_data['threshold_wei'])
+    if user_data.get('threshold') is not None:
+        return to_wei(user_data['threshold'])
+    return default_wei
+
+
+class SQLiteUserStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # isolation_level=None：由本类显式管理事务
+        self.conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate_threshold_wei()
+        # 只读连接：在线程中读取其他进程的修改，不与self.conn上的事务交错
+        self.read_conn = None
+
+    def _migrate_threshold_wei(self):
+        """旧版本数据库只有REAL类型的threshold列：补充threshold_wei列并换算已有阈值"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(users)")}
+        with self.transaction():
+            if 'threshold_wei' not in columns:
+                self.conn.execute("ALTER TABLE users ADD COLUMN threshold_wei TEXT")
+            rows = self.conn.execute("SELECT user_id, threshold FROM users WHERE threshold_wei IS NULL").fetchall()
+            self.conn.executemany(
+                "UPDATE users SET threshold_wei = ? WHERE user_id = ?",
+                [(str(to_wei(threshold)), user_id) for user_id, threshold in rows],
+            )
+
+    def transaction(self):
+        """返回事务上下文：正常退出时提交，异常时回滚"""
+        return _Transaction(self.conn)
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is None
+
+    def load_all(self, default_threshold_wei: int) -> dict:
+        """加载全部用户数据，结构与JSON存储一致：{user_id_str: {'addresses', 'last_alert', 'threshold_wei', 'tokens'}}"""
+        return _load_users(self.conn, default_threshold_wei)
+
+    def change_seq(self) -> int:
+        """当前最新的修改序号"""
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM user_changes").fetchone()[0]
+
+    def load_changes(self, since_seq: int, default_threshold_wei: int) -> Tuple[int, Optional[List[int]], dict]:
+        """读取修改序号since_seq之后被修改过的用户（只读，可以在线程中执行）
+
+        返回 (最新序号, 修改过的user_id, 这些用户的当前数据)；数据中没有的用户已被删除。
+        记录已被清理、无法确定修改了哪些用户时user_id为None，数据为全部用户
+        """
+        if self.read_conn is None:
+            self.read_conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn = self.read_conn
+        # 在一个读事务中完成，读到的修改记录和用户数据来自同一个快照
+        conn.execute("BEGIN")
+        try:
+            first_seq, last_seq = conn.execute("SELECT MIN(seq), MAX(seq) FROM user_changes").fetchone()
+            if last_seq is None or last_seq <= since_seq:
+                return since_seq, [], {}
+            if first_seq > since_seq + 1:
+                return last_seq, None, _load_users(conn, default_threshold_wei)
+            user_ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT user_id FROM user_changes WHERE seq > ?", (since_seq,))]
+            return last_seq, user_ids, _load_users(conn, default_threshold_wei, user_ids)
+        finally:
+            conn.execute("COMMIT")
+
+    def ensure_user(self, user_id: int, threshold_wei: int):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO users (user_id, threshold, threshold_wei) VALUES (?, ?, ?)",
+            (user_id, from_wei(threshold_wei), str(threshold_wei)),
+        )
+
+    def add_address(self, user_id: int, address: str, threshold_wei: int):
+        with self.transaction():
+            self.ensure_user(user_id, threshold_wei)
+            self.conn.execute("INSERT OR IGNORE INTO addresses (user_id, address) VALUES (?, ?)", (user_id, address))
+
+    def remove_address(self, user_id: int, address: str):
+        with self.transaction():
+            self.conn.execute("DELETE FROM addresses WHERE user_id = ? AND address = ?", (user_id, address))
+            self.conn.execute("DELETE FROM alerts WHERE user_id = ? AND address = ?", (user_id, address))
+
+    def add_token(self, user_id: int, contract: str, threshold_wei: int):
+        with self.transaction():
+            self.ensure_user(user_id, threshold_wei)
+            self.conn.execute("INSERT OR IGNORE INTO tokens (user_id, contract) VALUES (?, ?)", (user_id, contract))
+
+    def remove_token(self, user_id: int, contract: str):
+        self.conn.execute("DELETE FROM tokens WHERE user_id = ? AND contract = ?", (user_id, contract))
+
+    def set_threshold(self, user_id: int, threshold_wei: int):
+        self.conn.execute(
+            "INSERT INTO users (user_id, threshold, threshold_wei) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET threshold = excluded.threshold, threshold_wei = excluded.threshold_wei",
+            (user_id, from_wei(threshold_wei), str(threshold_wei)),
+        )
+
+    def record_alerts(self, alerts: Iterable[Tuple[int, str, float]], default_threshold_wei: int):
+        """在一个事务中批量写入警告时间 (user_id, address, timestamp)"""
+        alerts = list(alerts)
+        if not alerts:
+            return
+        with self.transaction():
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, threshold, threshold_wei) VALUES (?, ?, ?)",
+                {(user_id, from_wei(default_threshold_wei), str(default_threshold_wei)) for user_id, _, _ in alerts},
+            )
+            self.conn.executemany(
+                "INSERT INTO alerts (user_id, address, last_alert) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id, address) DO UPDATE SET last_alert = excluded.last_alert",
+                alerts,
+            )
+
+    def claim_alerts(self, alerts: Iterable[Tuple[int, str, float]], cooldown: float, default_threshold_wei: int) -> Set[Tuple[int, str]]:
+        """在一个事务中为 (user_id, address, timestamp) 条件写入警告时间：只有距上次警告超过cooldown时才写入。
+        多个监控进程同时判断同一订阅时只有一个写入成功，返回写入成功（应由本进程发送）的 (user_id, address)
+        """
+        alerts = list(alerts)
+        claimed = set()
+        if not alerts:
+            return claimed
+        with self.transaction():
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, threshold, threshold_wei) VALUES (?, ?, ?)",
+                {(user_id, from_wei(default_threshold_wei), str(default_threshold_wei)) for user_id, _, _ in alerts},
+            )
+            for user_id, address, timestamp in alerts:
+                cursor = self.conn.execute(
+                    "INSERT INTO alerts (user_id, address, last_alert) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id, address) DO UPDATE SET last_alert = excluded.last_alert "
+                    "WHERE alerts.last_alert < excluded.last_alert - ?",
+                    (user_id, address, timestamp, cooldown),
+                )
+                if cursor.rowcount == 1:
+                    claimed.add((user_id, address))
+        return claimed
+
+    def release_alert(self, user_id: int, address: str, timestamp: float):
+        """撤销claim_alerts写入的警告时间（警告未能入队时），其他进程已重新写入时不受影响"""
+        self.conn.execute(
+            "DELETE FROM alerts WHERE user_id = ? AND address = ? AND last_alert = ?",
+            (user_id, address, timestamp),
+        )
+
+    def import_users(self, users_data: dict, default_threshold_wei: int):
+        """从JSON结构的用户数据一次性导入（迁移用）"""
+        with self.transaction():
+            for user_id_str, user_data in users_data.items():
+                user_id = int(user_id_str)
+                threshold_wei = user_threshold_wei(user_data, default_threshold_wei)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, threshold, threshold_wei) VALUES (?, ?, ?)",
+                    (user_id, from_wei(threshold_wei), str(threshold_wei)),
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO addresses (user_id, address) VALUES (?, ?)",
+                    [(user_id, address) for address in user_data.get('addresses', [])],
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO tokens (user_id, contract) VALUES (?, ?)",
+                    [(user_id, contract) for contract in user_data.get('tokens', [])],
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO alerts (user_id, address, last_alert) VALUES (?, ?, ?)",
+                    [(user_id, address, ts) for address, ts in user_data.get('last_alert', {}).items()],
+                )
+
+    def close(self):
+        self.conn.close()
+        if self.read_conn is not None:
+            self.read_conn.close()
+
+
+def _load_users(conn: sqlite3.Connection, default_threshold_wei: int, user_ids: Optional[List[int]] = None) -> dict:
+    """加载全部用户（或user_ids中的用户）的数据"""
+    where, params = '', ()
+    if user_ids is not None:
+        if not user_ids:
+            return {}
+        # 修改的用户很多时直接读全部再筛选，避免超出SQL参数个数限制
+        if len(user_ids) <= 500:
+            where, params = f" WHERE user_id IN ({','.join('?' * len(user_ids))})", tuple(user_ids)
+
+    users_data = {}
+    for user_id, threshold_wei in conn.execute("SELECT user_id, threshold_wei FROM users" + where, params):
+        users_data[str(user_id)] = {'addresses': [], 'last_alert': {}, 'threshold_wei': int(threshold_wei), 'tokens': []}
+
+    # 按插入顺序（rowid）返回地址，保持与列表存储相同的顺序
+    for user_id, address in conn.execute("SELECT user_id, address FROM addresses" + where + " ORDER BY rowid", params):
+        users_data.setdefault(str(user_id), {'addresses': [], 'last_alert': {}, 'threshold_wei': default_threshold_wei, 'tokens': []})
+        users_data[str(user_id)]['addresses'].append(address)
+
+    for user_id, contract in conn.execute("SELECT user_id, contract FROM tokens" + where + " ORDER BY rowid", params):
+        if str(user_id) in users_data:
+            users_data[str(user_id)]['tokens'].append(contract)
+
+    for user_id, address, last_alert in conn.execute("SELECT user_id, address, last_alert FROM alerts" + where, params):
+        if str(user_id) in users_data:
+            users_data[str(user_id)]['last_alert'][address] = last_alert
+
+    if user_ids is not None and not where:
+        wanted = {str(user_id) for user_id in user_ids}
+        users_data = {key: value for key, value in users_data.items() if key in wanted}
+    return users_data
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
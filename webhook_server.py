@@ -0,0 +1,68 @@
+"""
+Telegram Webhook服务
+在同一个事件循环中运行aiohttp服务器接收Telegram推送的Update，校验secret token后
+放入Application的更新队列，由Application按配置的并发数处理。
+必须配置secret token：没有校验时任何人都可以向该地址伪造Update
+"""
+
+import hmac
+from aiohttp import web
+from telegram import Update
+from config import WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    def __init__(self, application, path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET,
+                 listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+        if not secret_token:
+            raise ValueError("Webhook server requires a secret token")
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.listen = listen
+        self.port = port
+        self.web_app = web.Application()
+        self.web_app.router.add_post(path, self.handle_update)
+        self.runner = None
+
+    def add_route(self, method: str, path: str, handler):
+        """在同一服务器上挂载其他HTTP接口（需在start之前调用）"""
+        self.web_app.router.add_route(method, path, handler)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """接收一条Update"""
+        provided = request.headers.get(SECRET_HEADER, '')
+        # 按字节比较：请求头含非ASCII字符时str比较会抛出TypeError（变成500而不是403）
+        if not hmac.compare_digest(provided.encode('utf-8', 'surrogateescape'), self.secret_token.encode('utf-8')):
+            return web.Response(status=403, text='forbidden')
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400, text='invalid json')
+
+        try:
+            update = Update.de_json(data, self.application.bot) if isinstance(data, dict) else None
+        except Exception:
+            # 字段类型不对等格式错误的请求体
+            update = None
+        if update is None:
+            return web.Response(status=400, text='invalid update')
+
+        # 立即返回200，实际处理由Application的更新队列异步完成
+        await self.application.update_queue.put(update)
+        return web.Response(text='ok')
+
+    async def start(self):
+        self.runner = web.AppRunner(self.web_app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.listen, self.port)
+        await site.start()
+        print(f"🌐 Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None